@@ -1,13 +1,38 @@
 #!/usr/bin/env python3
 """
-Microphone Permission Test - Run this on CLIENT machine
-Tests microphone access and Windows privacy settings
+Audio Device Diagnostics - Run this on CLIENT machine
+- check: microphone access and Windows privacy settings (the default)
+- bench: for each device and format, measures open time, callback interval
+  jitter, overflow/underflow rates, the highest sustainable sample rate at
+  each chunk size, and input -> output loopback latency
+- --backend synthetic runs the same measurements on simulated devices, so
+  the measuring code can be tried without a sound card
+- power: runs client.py's audio engine through the call modes and measures
+  CPU time, capture thread wakeups and mode switch latency per idle-stream
+  policy
+
+Usage:
+    python audio_debug.py
+    python audio_debug.py bench --chunks 256 512 1024 2048
+    python audio_debug.py bench --loopback 0:2 --json    # e.g. Stereo Mix records the speakers
+    python audio_debug.py bench --backend synthetic --json
+    python audio_debug.py power --policies pause close keep --seconds 5
 """
 
-import pyaudio
-import numpy as np
+import argparse
+import json
+import random
+import threading
 import time
 import subprocess
+from collections import deque
+
+import numpy as np
+
+try:
+    import pyaudio
+except ImportError:  # only the synthetic backend works without PyAudio
+    pyaudio = None
 
 def check_windows_microphone_privacy():
     """Check Windows microphone privacy settings"""
@@ -160,7 +185,361 @@ def fix_microphone_issues():
     print("   • Device Manager → Audio inputs and outputs")
     print("   • Right-click microphone → Update driver")
 
-def main():
+# PortAudio callback status flags and sample formats (same values as pyaudio.pa*)
+INPUT_UNDERFLOW, INPUT_OVERFLOW, OUTPUT_UNDERFLOW, OUTPUT_OVERFLOW = 0x1, 0x2, 0x4, 0x8
+INPUT_XRUN = INPUT_UNDERFLOW | INPUT_OVERFLOW
+OUTPUT_XRUN = OUTPUT_UNDERFLOW | OUTPUT_OVERFLOW
+PA_CONTINUE = 0
+SAMPLE_FORMATS = {'int16': (8, 2), 'float32': (1, 4)}   # name -> (pa format, bytes per sample)
+
+class PyAudioBackend:
+    """Real devices through PyAudio callback streams"""
+    name = 'pyaudio'
+    
+    def __init__(self):
+        self.p = pyaudio.PyAudio()
+    
+    def devices(self):
+        devices = []
+        for i in range(self.p.get_device_count()):
+            info = self.p.get_device_info_by_index(i)
+            devices.append({'index': i, 'name': info['name'],
+                            'inputs': info['maxInputChannels'], 'outputs': info['maxOutputChannels']})
+        return devices
+    
+    def open(self, device, rate, chunk, sample_format, callback, input=False, output=False):
+        return self.p.open(
+            format=SAMPLE_FORMATS[sample_format][0],
+            channels=1,
+            rate=rate,
+            input=input,
+            output=output,
+            input_device_index=device if input else None,
+            output_device_index=device if output else None,
+            frames_per_buffer=chunk,
+            stream_callback=callback,
+            start=False
+        )
+    
+    def close(self):
+        self.p.terminate()
+
+class SyntheticBackend:
+    """Simulated devices driven by timer threads - no sound card needed
+    
+    Streams call back every chunk / rate seconds plus random jitter. The
+    simulated host can only service max_callbacks_per_s callbacks. A shorter
+    period builds up a deficit that is reported as an overflow/underflow,
+    the same way a real device reports a buffer it was not serviced in time
+    for. "Synthetic Loopback" records what "Synthetic Speakers" played,
+    latency_ms later.
+    """
+    name = 'synthetic'
+    
+    def __init__(self, jitter_ms=0.5, max_callbacks_per_s=250, latency_ms=40, open_ms=5, seed=1):
+        self.jitter = jitter_ms / 1000
+        self.min_period = 1 / max_callbacks_per_s
+        self.latency = latency_ms / 1000
+        self.open_delay = open_ms / 1000
+        self.rng = random.Random(seed)
+        self.line = deque()            # speaker samples on their way to the loopback input
+        self.line_lock = threading.Lock()
+    
+    def devices(self):
+        return [
+            {'index': 0, 'name': 'Synthetic Microphone', 'inputs': 1, 'outputs': 0},
+            {'index': 1, 'name': 'Synthetic Speakers', 'inputs': 0, 'outputs': 2},
+            {'index': 2, 'name': 'Synthetic Loopback', 'inputs': 2, 'outputs': 0}
+        ]
+    
+    def open(self, device, rate, chunk, sample_format, callback, input=False, output=False):
+        time.sleep(self.open_delay)
+        if device == 2:
+            # Speakers play what a callback returns right away; an input
+            # buffer is delivered once it has been captured - one more chunk
+            with self.line_lock:
+                self.line = deque(np.zeros(int(self.latency * rate) + chunk, dtype=np.int16))
+        return SyntheticStream(self, device, rate, chunk, SAMPLE_FORMATS[sample_format][1],
+                               callback, input)
+    
+    def close(self):
+        pass
+
+class SyntheticStream:
+    """One simulated callback stream (see SyntheticBackend)"""
+    def __init__(self, backend, device, rate, chunk, sample_bytes, callback, input):
+        self.backend = backend
+        self.device = device
+        self.rate = rate
+        self.chunk = chunk
+        self.sample_bytes = sample_bytes
+        self.callback = callback
+        self.input = input
+        self.active = False
+        self.thread = None
+        self.position = 0
+    
+    def start_stream(self):
+        self.active = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def stop_stream(self):
+        self.active = False
+        if self.thread:
+            self.thread.join()
+    
+    def close(self):
+        self.stop_stream()
+    
+    def read_input(self):
+        """chunk samples: the loopback line, or a tone from the microphone"""
+        if self.device == 2:
+            with self.backend.line_lock:
+                line = self.backend.line
+                samples = [line.popleft() if line else 0 for _ in range(self.chunk)]
+            samples = np.array(samples, dtype=np.int16)
+        else:
+            t = (np.arange(self.chunk) + self.position) / self.rate
+            samples = (np.sin(2 * np.pi * 440 * t) * 3000).astype(np.int16)
+        self.position += self.chunk
+        return samples.tobytes() if self.sample_bytes == 2 else (samples / 32768).astype(np.float32).tobytes()
+    
+    def run(self):
+        backend = self.backend
+        period = self.chunk / self.rate
+        deficit = 0.0
+        due = time.perf_counter()
+        while self.active:
+            due += period
+            delay = due + abs(backend.rng.gauss(0, backend.jitter)) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            
+            status = 0
+            deficit += max(0.0, backend.min_period - period)
+            if deficit >= period:
+                deficit -= period
+                status = INPUT_OVERFLOW if self.input else OUTPUT_UNDERFLOW
+            
+            out, _ = self.callback(self.read_input() if self.input else None, self.chunk, {}, status)
+            if not self.input and out and self.device == 1:
+                with backend.line_lock:
+                    backend.line.extend(np.frombuffer(out, dtype=np.int16))
+
+def create_backend(name):
+    """Build a device backend by name ('pyaudio' or 'synthetic')"""
+    if name == 'pyaudio':
+        if pyaudio is None:
+            raise SystemExit("❌ PyAudio is not installed - try --backend synthetic")
+        return PyAudioBackend()
+    return SyntheticBackend()
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if len(values) else None
+
+def measure_stream(backend, device, direction, rate, chunk, sample_format, seconds):
+    """Open time, callback interval jitter and xrun rate for one stream format"""
+    times = []
+    xruns = [0]
+    xrun_mask = INPUT_XRUN if direction == 'input' else OUTPUT_XRUN
+    silence = bytes(chunk * SAMPLE_FORMATS[sample_format][1])
+    
+    def callback(in_data, frame_count, time_info, status):
+        times.append(time.perf_counter())
+        if status & xrun_mask:
+            xruns[0] += 1
+        return (None if direction == 'input' else silence), PA_CONTINUE
+    
+    row = {'device': device['index'], 'name': device['name'], 'direction': direction,
+           'format': sample_format, 'rate': rate, 'chunk': chunk}
+    start = time.perf_counter()
+    try:
+        stream = backend.open(device['index'], rate, chunk, sample_format, callback,
+                              input=direction == 'input', output=direction == 'output')
+    except Exception as e:
+        return {**row, 'error': str(e)}
+    row['open_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    
+    stream.start_stream()
+    time.sleep(seconds)
+    stream.stop_stream()
+    stream.close()
+    
+    expected = chunk / rate
+    intervals = np.diff(times)[1:]    # the first callbacks often come in a burst
+    jitter = np.abs(intervals - expected)
+    callbacks_per_s = len(times) / seconds
+    return {
+        **row,
+        'callbacks': len(times),
+        'period_ms': round(expected * 1000, 3),
+        'interval_mean_ms': round(float(intervals.mean()) * 1000, 3) if len(intervals) else None,
+        'jitter_p50_ms': percentile_ms(jitter, 50),
+        'jitter_p99_ms': percentile_ms(jitter, 99),
+        'xruns': xruns[0],
+        'xruns_per_s': round(xruns[0] / seconds, 2),
+        # Kept up: no xruns and (nearly) every expected callback arrived
+        'sustainable': xruns[0] == 0 and callbacks_per_s >= 0.9 / expected
+    }
+
+def measure_loopback(backend, input_device, output_device, rate, chunk, seconds, clicks_per_s=2):
+    """Time from handing a click to the output until it shows up in the input
+    
+    One click is played every 1 / clicks_per_s seconds, so latencies longer
+    than that cannot be told apart and are not counted.
+    """
+    emitted = []
+    latencies = []
+    click_every = int(rate / clicks_per_s)
+    played = [0]
+    
+    def output_callback(in_data, frame_count, time_info, status):
+        samples = np.zeros(frame_count, dtype=np.int16)
+        offset = -played[0] % click_every
+        if offset < frame_count:
+            samples[offset:offset + 32] = 20000
+            emitted.append(time.perf_counter() + offset / rate)
+        played[0] += frame_count
+        return samples.tobytes(), PA_CONTINUE
+    
+    def input_callback(in_data, frame_count, time_info, status):
+        now = time.perf_counter()
+        loud = np.flatnonzero(np.abs(np.frombuffer(in_data, dtype=np.int16)) > 8000)
+        if len(loud) and emitted:
+            heard = now - (frame_count - loud[0]) / rate   # when that sample was captured
+            sent = [t for t in emitted if t <= heard]
+            if sent and heard - sent[-1] < 1 / clicks_per_s:
+                latencies.append(heard - sent[-1])
+                emitted.clear()
+        return None, PA_CONTINUE
+    
+    row = {'input': input_device, 'output': output_device, 'rate': rate, 'chunk': chunk}
+    try:
+        streams = [backend.open(output_device, rate, chunk, 'int16', output_callback, output=True),
+                   backend.open(input_device, rate, chunk, 'int16', input_callback, input=True)]
+    except Exception as e:
+        return {**row, 'error': str(e)}
+    for stream in streams:
+        stream.start_stream()
+    time.sleep(seconds)
+    for stream in streams:
+        stream.stop_stream()
+        stream.close()
+    
+    return {
+        **row,
+        'clicks_heard': len(latencies),
+        'latency_p50_ms': percentile_ms(latencies, 50),
+        'latency_max_ms': round(max(latencies) * 1000, 3) if latencies else None
+    }
+
+def max_sustainable(rows):
+    """Highest sustainable rate and callbacks/s per device, direction and chunk size"""
+    best = {}
+    for row in rows:
+        if not row.get('sustainable'):
+            continue
+        key = (row['device'], row['name'], row['direction'], row['format'], row['chunk'])
+        if row['rate'] > best.get(key, 0):
+            best[key] = row['rate']
+    return [{'device': device, 'name': name, 'direction': direction, 'format': sample_format,
+             'chunk': chunk, 'max_rate': rate, 'frames_per_s': round(rate / chunk, 1)}
+            for (device, name, direction, sample_format, chunk), rate in sorted(best.items())]
+
+def print_table(title, rows):
+    """Print result rows as an aligned table"""
+    print(f"\n{title}")
+    if not rows:
+        print("  (none)")
+        return
+    keys = list(dict.fromkeys(k for row in rows for k in row))
+    widths = {k: max(len(k), *(len(str(r.get(k, ''))) for r in rows)) for k in keys}
+    print("  ".join(k.ljust(widths[k]) for k in keys))
+    for row in rows:
+        print("  ".join(str(row.get(k, '')).ljust(widths[k]) for k in keys))
+
+def run_bench(args):
+    """Measure every selected device and format; returns the results dict"""
+    backend = create_backend(args.backend)
+    devices = [d for d in backend.devices() if args.device is None or d['index'] in args.device]
+    loopback = args.loopback or ('2:1' if args.backend == 'synthetic' else None)
+    
+    streams = []
+    try:
+        for device in devices:
+            for direction, channels in (('input', device['inputs']), ('output', device['outputs'])):
+                if not channels:
+                    continue
+                for sample_format in args.formats:
+                    for chunk in args.chunks:
+                        for rate in args.rates:
+                            row = measure_stream(backend, device, direction, rate, chunk,
+                                                 sample_format, args.seconds)
+                            streams.append(row)
+                            if not args.json:
+                                print(f"  {device['name'][:30]:<30} {direction:<6} {sample_format:<7} "
+                                      f"{rate:>6} Hz x {chunk:<5} "
+                                      f"{'✗ ' + row['error'] if 'error' in row else '✓' if row['sustainable'] else '⚠ xruns'}")
+        
+        loopbacks = []
+        if loopback:
+            input_device, output_device = (int(i) for i in loopback.split(':'))
+            for chunk in args.chunks:
+                loopbacks.append(measure_loopback(backend, input_device, output_device,
+                                                  args.rates[-1], chunk, max(args.seconds, 2)))
+    finally:
+        backend.close()
+    
+    return {
+        'backend': backend.name,
+        'streams': streams,
+        'max_sustainable': max_sustainable(streams),
+        'loopback': loopbacks
+    }
+
+def run_power(args):
+    """Call mode walk per idle-stream policy; returns result rows
+    
+    Each mode is held for args.seconds. CPU time is the whole process's,
+    so the figures include PortAudio's own threads.
+    """
+    from client import AudioOnlyManager  # needs PyAudio and websockets
+    
+    rows = []
+    for policy in args.policies:
+        manager = AudioOnlyManager(idle_streams=policy, switch_target_ms=args.target_ms)
+        if not manager.start():
+            raise SystemExit("❌ Audio devices did not open - see the messages above")
+        try:
+            time.sleep(0.5)  # let the start-up pass settle
+            for mode in args.modes:
+                switches = manager.switches
+                manager.set_call_mode(mode)
+                deadline = time.perf_counter() + 2
+                while manager.switches == switches and time.perf_counter() < deadline:
+                    time.sleep(0.001)
+                switch_ms = manager.switch_times[-1] if manager.switches > switches else None
+                
+                cpu, wakeups, start = time.process_time(), manager.wakeups, time.perf_counter()
+                time.sleep(args.seconds)
+                elapsed = time.perf_counter() - start
+                rows.append({
+                    'policy': policy,
+                    'mode': mode,
+                    'streams': '+'.join(sorted(manager.active_streams)) or '-',
+                    'switch_ms': round(switch_ms, 1) if switch_ms is not None else None,
+                    'cpu_ms_per_s': round((time.process_time() - cpu) * 1000 / elapsed, 2),
+                    'wakeups_per_s': round((manager.wakeups - wakeups) / elapsed, 1)
+                })
+                if not args.json:
+                    print(f"  {policy:<6} {mode:<7} switch {rows[-1]['switch_ms']}ms  "
+                          f"{rows[-1]['cpu_ms_per_s']} ms CPU/s  {rows[-1]['wakeups_per_s']} wakeups/s")
+        finally:
+            manager.stop()
+    return rows
+
+def run_check():
     print("🎤 MICROPHONE PERMISSION & ACCESS TEST")
     print("=" * 50)
     print("This will test if Python can access your microphone")
@@ -188,5 +567,55 @@ def main():
     print("\nPress ENTER to exit...")
     input()
 
+def main():
+    parser = argparse.ArgumentParser(description='Audio Device Diagnostics')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('check', help='Microphone access and Windows privacy settings (default)')
+    
+    p = sub.add_parser('bench', help='Device latency, jitter and throughput per format')
+    p.add_argument('--backend', choices=['pyaudio', 'synthetic'], default='pyaudio')
+    p.add_argument('--device', type=int, nargs='+', help='Device indexes to measure (default: all)')
+    p.add_argument('--formats', nargs='+', choices=sorted(SAMPLE_FORMATS), default=['int16'])
+    p.add_argument('--rates', type=int, nargs='+', default=[16000, 22050, 48000])
+    p.add_argument('--chunks', type=int, nargs='+', default=[128, 256, 512, 1024, 2048])
+    p.add_argument('--seconds', type=float, default=0.5, help='How long each format runs')
+    p.add_argument('--loopback', help='INPUT:OUTPUT device pair that hears itself, for latency')
+    p.add_argument('--json', action='store_true', help='Print machine-readable results')
+    
+    p = sub.add_parser('power', help="Idle CPU, wakeups and mode switch latency of the client's audio engine")
+    p.add_argument('--policies', nargs='+', choices=['pause', 'close', 'keep'], default=['pause', 'close', 'keep'])
+    p.add_argument('--modes', nargs='+', choices=['off', 'listen', 'talk', 'both'],
+                   default=['off', 'listen', 'talk', 'both', 'off'])
+    p.add_argument('--seconds', type=float, default=5, help='How long each mode is held')
+    p.add_argument('--target-ms', type=float, default=100, help='Mode switch latency target')
+    p.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+    
+    if args.command == 'power':
+        if not args.json:
+            print("🔋 CLIENT AUDIO ENGINE POWER")
+            print("=" * 50)
+        rows = run_power(args)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print_table("📊 Per call mode", rows)
+        return
+    
+    if args.command != 'bench':
+        run_check()
+        return
+    
+    if not args.json:
+        print(f"🎛 AUDIO DEVICE BENCHMARK ({args.backend})")
+        print("=" * 50)
+    results = run_bench(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table("📊 Streams", results['streams'])
+        print_table("🏁 Highest sustainable rate per chunk size", results['max_sustainable'])
+        print_table("🔁 Loopback latency", results['loopback'])
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+"""
+Audio DSP helpers shared by the call client and server
+- Pure NumPy, no PyAudio, so they can run on the server and offline
+- All audio is mono 16-bit PCM unless noted otherwise
+"""
+
+import math
+import time
+from base64 import b64decode, b64encode
+from collections import deque
+
+import numpy as np
+
+def pcm_to_array(pcm_bytes):
+    """Convert 16-bit PCM bytes to an int16 array (no copy)"""
+    return np.frombuffer(pcm_bytes, dtype=np.int16)
+
+def resample_pcm(pcm_bytes, from_rate, to_rate, channels=1):
+    """Resample 16-bit PCM bytes with linear interpolation
+    
+    Good enough for voice when stepping the send rate down; returns the
+    input unchanged when the rates match. Multichannel audio must be
+    interleaved; each channel is resampled on its own.
+    """
+    if from_rate == to_rate or not pcm_bytes:
+        return pcm_bytes
+    
+    frames = pcm_to_array(pcm_bytes).astype(np.float32).reshape(-1, channels)
+    out_length = max(1, int(round(len(frames) * to_rate / from_rate)))
+    positions = np.linspace(0, len(frames) - 1, out_length)
+    resampled = np.column_stack([np.interp(positions, np.arange(len(frames)), frames[:, c])
+                                 for c in range(channels)])
+    return np.clip(np.round(resampled), -32768, 32767).astype(np.int16).tobytes()
+
+def interleave_pcm(*channels):
+    """Interleave equal-length int16 arrays into multichannel PCM bytes"""
+    return np.column_stack(channels).astype(np.int16).tobytes()
+
+def split_pcm(pcm_bytes, channels):
+    """Split interleaved PCM bytes into one mono PCM bytes object per channel"""
+    frames = pcm_to_array(pcm_bytes).reshape(-1, channels)
+    return [frames[:, c].tobytes() for c in range(channels)]
+
+def mix_pcm(sources, gains):
+    """Mix equal-length int16 arrays to mono PCM bytes with a gain per source"""
+    mixed = sum(source.astype(np.float32) * gain for source, gain in zip(sources, gains))
+    return np.clip(np.round(mixed), -32768, 32767).astype(np.int16).tobytes()
+
+def pcm_level(pcm_bytes):
+    """(sum of squares, peak, samples) of 16-bit PCM, to sum into a level meter"""
+    samples = pcm_to_array(pcm_bytes).astype(np.float32)
+    if not len(samples):
+        return 0.0, 0, 0
+    return float(np.dot(samples, samples)), int(np.max(np.abs(samples))), len(samples)
+
+def downmix_pcm(pcm_bytes, channels):
+    """Average interleaved multichannel PCM bytes down to mono PCM bytes"""
+    if channels == 1:
+        return pcm_bytes
+    frames = pcm_to_array(pcm_bytes)
+    frames = frames[:len(frames) // channels * channels].reshape(-1, channels)
+    return to_pcm(frames.astype(np.float32).mean(axis=1))
+
+def resample_stream(pcm_bytes, from_rate, to_rate, state=None, channels=1):
+    """Resample one frame of a continuous stream; returns (pcm_bytes, state)
+    
+    Unlike resample_pcm, the interpolation runs across frame boundaries,
+    so there is no click at every frame edge. state carries the last input
+    sample and the position of the next output sample from one call to the
+    next; pass None for the first frame of a stream.
+    """
+    frames = pcm_to_array(pcm_bytes).astype(np.float32).reshape(-1, channels)
+    if from_rate == to_rate or not len(frames):
+        return pcm_bytes, state
+    previous, phase = state if state else (frames[0], 0.0)
+    
+    # Input positions of the output samples; -1 is the previous frame's last sample
+    step = from_rate / to_rate
+    count = max(0, int(np.floor((len(frames) - 1 - phase) / step)) + 1)
+    positions = phase + np.arange(count) * step + 1
+    extended = np.vstack((previous, frames))
+    resampled = np.column_stack([np.interp(positions, np.arange(len(extended)), extended[:, c])
+                                 for c in range(channels)])
+    next_phase = phase + count * step - len(frames)
+    return to_pcm(resampled), (frames[-1], next_phase)
+
+def build_mulaw_tables():
+    """G.711 mu-law lookup tables: every int16 -> byte, and every byte -> int16"""
+    samples = np.arange(-32768, 32768, dtype=np.int32)
+    # As in the reference coder: 14-bit magnitude (negatives round down), bias, clip
+    shifted = samples >> 2
+    magnitude = np.minimum(np.abs(shifted), 8159) + 0x21
+    segment = np.floor(np.log2(magnitude)).astype(np.int32) - 5
+    mantissa = (magnitude >> (segment + 1)) & 0x0F
+    encoded = np.where(segment >= 8, 0x7F, (segment << 4) | mantissa) ^ np.where(shifted < 0, 0x7F, 0xFF)
+    # Index by the int16 bit pattern, as read through a uint16 view
+    encode = np.empty(65536, dtype=np.uint8)
+    encode[samples.astype(np.int16).view(np.uint16)] = encoded
+    
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    decoded = (((codes & 0x0F) << 3) + 0x84 << ((codes >> 4) & 0x07)) - 0x84
+    decode = np.where(codes & 0x80, -decoded, decoded).astype(np.int16)
+    return encode, decode
+
+MULAW_ENCODE, MULAW_DECODE = build_mulaw_tables()
+
+def mulaw_encode(pcm_bytes):
+    """16-bit PCM bytes -> G.711 mu-law bytes (half the size)"""
+    return MULAW_ENCODE[pcm_to_array(pcm_bytes).view(np.uint16)].tobytes()
+
+def mulaw_decode(mulaw_bytes):
+    """G.711 mu-law bytes -> 16-bit PCM bytes"""
+    return MULAW_DECODE[np.frombuffer(mulaw_bytes, dtype=np.uint8)].tobytes()
+
+# Frame codecs: name -> (encode from 16-bit PCM, decode to 16-bit PCM)
+CODECS = {
+    'pcm16': (lambda pcm: pcm, lambda pcm: pcm),
+    'mulaw': (mulaw_encode, mulaw_decode)
+}
+
+def transcode_batch(work, states):
+    """Convert a batch of base64 audio frames; returns (audio, states, costs_ns)
+    
+    Each work item is (state_key, audio_b64, from_codec, from_rate, channels,
+    to_codec, to_rate). Frames that share a state_key are consecutive frames
+    of one stream and are resampled in order. states maps state_key to
+    resampler state and is returned updated. This is a plain function of
+    its arguments, so it runs the same in a thread or a worker process.
+    """
+    audio = []
+    costs = []
+    for key, audio_b64, from_codec, from_rate, channels, to_codec, to_rate in work:
+        start = time.perf_counter_ns()
+        pcm = CODECS[from_codec][1](b64decode(audio_b64))
+        pcm, states[key] = resample_stream(pcm, from_rate, to_rate, states.get(key), channels)
+        audio.append(b64encode(CODECS[to_codec][0](pcm)).decode('utf-8'))
+        costs.append(time.perf_counter_ns() - start)
+    return audio, states, costs
+
+class EchoCanceller:
+    """Removes the speaker signal from a captured stream
+    
+    The samples written to the speaker are the reference. add_reference()
+    queues them, and process() takes the same number of reference samples
+    as it gets captured samples. When the speaker was silent the reference
+    runs dry and is padded with zeros. The adaptive filter learns the
+    speaker -> capture path (delay plus room) up to tail_ms and subtracts
+    its estimate of the echo. Subclasses implement cancel_block() for one
+    block of block_size samples.
+    """
+    def __init__(self, rate=22050, block_size=256, tail_ms=100, mu=0.5, max_reference_ms=500):
+        self.rate = rate
+        self.block_size = block_size
+        self.taps = max(block_size, int(rate * tail_ms / 1000) // block_size * block_size)
+        self.mu = mu
+        self.max_reference = int(rate * max_reference_ms / 1000)
+        self.reference = np.zeros(0, dtype=np.float32)
+        
+        # Stats for the quality report
+        self.frames = 0
+        self.cpu_seconds = 0.0
+        self.echo_energy = 0.0      # captured energy while the speaker was playing
+        self.residual_energy = 0.0  # the same after cancellation
+    
+    def add_reference(self, pcm_bytes):
+        """Queue samples that were just written to the speaker"""
+        samples = pcm_to_array(pcm_bytes).astype(np.float32)
+        self.reference = np.concatenate((self.reference, samples))[-self.max_reference:]
+    
+    def clear_reference(self):
+        """Drop queued reference samples (e.g. when capture was paused)"""
+        self.reference = np.zeros(0, dtype=np.float32)
+    
+    def take_reference(self, count):
+        """Reference samples lined up with the next count captured samples"""
+        taken = self.reference[:count]
+        self.reference = self.reference[count:]
+        if len(taken) < count:
+            taken = np.concatenate((taken, np.zeros(count - len(taken), dtype=np.float32)))
+        return taken
+    
+    def process(self, pcm_bytes):
+        """Cancel echo in one captured frame of 16-bit PCM bytes
+        
+        Frames are split into blocks; a short last block is zero-padded, so
+        frame sizes that are multiples of block_size work best.
+        """
+        start = time.perf_counter()
+        captured = pcm_to_array(pcm_bytes).astype(np.float32)
+        reference = self.take_reference(len(captured))
+        
+        out = np.empty_like(captured)
+        block = self.block_size
+        for i in range(0, len(captured), block):
+            d = captured[i:i + block]
+            x = reference[i:i + block]
+            if len(d) < block:
+                pad = block - len(d)
+                out[i:] = self.cancel_block(np.pad(d, (0, pad)), np.pad(x, (0, pad)))[:len(d)]
+            else:
+                out[i:i + block] = self.cancel_block(d, x)
+        
+        if np.any(reference):
+            self.echo_energy += float(np.dot(captured, captured))
+            self.residual_energy += float(np.dot(out, out))
+        self.frames += 1
+        self.cpu_seconds += time.perf_counter() - start
+        return np.clip(np.round(out), -32768, 32767).astype(np.int16).tobytes()
+    
+    def cancel_block(self, captured, reference):
+        raise NotImplementedError
+    
+    def stats(self):
+        """ERLE while the speaker was playing, and CPU per frame"""
+        return {
+            'backend': self.name,
+            'erle_db': round(erle_db(self.echo_energy, self.residual_energy), 1),
+            'us_per_frame': round(self.cpu_seconds / self.frames * 1e6, 1) if self.frames else None
+        }
+
+class BlockNlmsEchoCanceller(EchoCanceller):
+    """Time-domain NLMS, updated once per block with matrix products"""
+    name = 'nlms'
+    
+    def __init__(self, rate=22050, block_size=256, tail_ms=100, mu=0.2, **kwargs):
+        super().__init__(rate, block_size, tail_ms, mu, **kwargs)
+        self.weights = np.zeros(self.taps, dtype=np.float32)
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+    
+    def cancel_block(self, captured, reference):
+        x = np.concatenate((self.history, reference))
+        self.history = x[-(self.taps - 1):]
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.taps)  # (block, taps), oldest first
+        
+        error = captured - windows @ self.weights
+        power = float(np.dot(x, x)) * self.taps / len(x)  # average energy of the block's windows
+        if power > self.taps:  # adapt only while the speaker is playing
+            self.weights += self.mu * (windows.T @ error) / (power + 1e-3)
+        return never_louder(captured, error)
+
+class FdafEchoCanceller(EchoCanceller):
+    """Partitioned-block frequency-domain NLMS (overlap-save)
+    
+    The tail is split into taps / block_size partitions, so filtering and
+    adaptation are a few FFTs per block instead of taps multiplies per
+    sample. Each frequency bin is normalized by its own reference power.
+    """
+    name = 'fdaf'
+    
+    def __init__(self, rate=22050, block_size=256, tail_ms=100, mu=0.5, **kwargs):
+        super().__init__(rate, block_size, tail_ms, mu, **kwargs)
+        bins = block_size + 1
+        self.partitions = self.taps // block_size
+        self.weights = np.zeros((self.partitions, bins), dtype=np.complex64)
+        self.spectra = np.zeros((self.partitions, bins), dtype=np.complex64)  # newest first
+        self.power = np.full(bins, 1.0, dtype=np.float32)
+        self.previous = np.zeros(block_size, dtype=np.float32)
+    
+    def cancel_block(self, captured, reference):
+        block = self.block_size
+        self.spectra = np.roll(self.spectra, 1, axis=0)
+        self.spectra[0] = np.fft.rfft(np.concatenate((self.previous, reference)))
+        self.previous = reference
+        
+        echo = np.fft.irfft((self.spectra * self.weights).sum(axis=0))[block:]
+        error = captured - echo
+        
+        if float(np.dot(reference, reference)) > block:  # adapt only while the speaker is playing
+            # Power over the whole tail, so a spurt ending in the newest block
+            # cannot blow up the step for the older partitions
+            self.power = 0.5 * self.power + 0.5 * (np.abs(self.spectra) ** 2).sum(axis=0)
+            error_spectrum = np.fft.rfft(np.concatenate((np.zeros(block, dtype=np.float32), error)))
+            gradient = np.conj(self.spectra) * (error_spectrum / (self.power + 1e-3))
+            # Keep the filter causal and block_size long per partition
+            constrained = np.fft.irfft(gradient, axis=1)
+            constrained[:, block:] = 0
+            self.weights += self.mu * np.fft.rfft(constrained, axis=1)
+        return never_louder(captured, error)
+
+def never_louder(captured, error):
+    """Never make a block louder than it was captured
+    
+    Right after the echo path changes the filter can predict echo that is
+    no longer there; passing the capture through beats adding that error.
+    """
+    if float(np.dot(error, error)) <= float(np.dot(captured, captured)):
+        return error
+    return captured
+
+ECHO_CANCELLERS = {
+    'fdaf': FdafEchoCanceller,
+    'nlms': BlockNlmsEchoCanceller
+}
+
+def create_echo_canceller(backend='fdaf', **kwargs):
+    """Build an echo canceller by backend name ('fdaf' or 'nlms')"""
+    return ECHO_CANCELLERS[backend](**kwargs)
+
+def erle_db(echo_energy, residual_energy):
+    """Echo return loss enhancement: how much quieter the echo got, in dB"""
+    if echo_energy <= 0:
+        return 0.0
+    return float(10 * np.log10(echo_energy / max(residual_energy, 1e-9)))
+
+class NoiseSuppressor:
+    """Removes steady background noise (fans, HVAC) from a captured stream
+    
+    Short-time spectra over frame_ms windows with 50% overlap; sqrt-Hann
+    analysis and synthesis windows overlap-add back to the input when the
+    gain is 1, so a clean signal only comes out one window (frame_ms) late.
+    All windows of a chunk go through one 2-D FFT. The noise power per bin
+    is the minimum over the last window_s seconds of the power smoothed
+    across 8 windows and 3 bins (speech has gaps, steady noise does not),
+    times a bias correction for taking a minimum. Subclasses turn signal
+    and noise power into a gain per bin in suppression_gain(); gains never
+    go below floor_db, which keeps the leftover noise smooth instead of
+    'musical'.
+    
+    Residual noise can still peak over a fixed level gate, so the capture
+    loop also asks above_noise(): whether the last frame's level was a
+    margin above the noise estimate.
+    """
+    SMOOTH_WINDOWS = 8
+    
+    def __init__(self, rate=22050, frame_ms=12, window_s=1.5, floor_db=-20, noise_bias=2.0):
+        self.rate = rate
+        self.hop = max(16, int(rate * frame_ms / 1000) // 2)
+        self.frame_size = 2 * self.hop
+        self.window = np.sqrt(np.hanning(self.frame_size + 1)[:-1]).astype(np.float32)  # periodic
+        self.floor = 10 ** (floor_db / 20)
+        self.noise_bias = noise_bias
+        self.window_frames = max(1, int(window_s * rate / self.hop))
+        
+        self.history = np.zeros(self.hop, dtype=np.float32)     # input not yet in a full window
+        self.tail = np.zeros(self.hop, dtype=np.float32)        # second half of the last output window
+        self.output = np.zeros(self.hop, dtype=np.float32)      # processed samples not yet returned
+        self.recent = np.zeros((0, self.hop + 1), dtype=np.float32)   # last window powers, for smoothing
+        self.minima = deque()       # (windows, per-bin minimum) per processed chunk, newest last
+        self.noise = None
+        self.snr_db = math.inf      # last frame's level over the noise estimate
+        
+        # Stats for the quality report
+        self.frames = 0
+        self.cpu_seconds = 0.0
+        self.input_energy = 0.0
+        self.output_energy = 0.0
+    
+    def process(self, pcm_bytes):
+        """Suppress noise in one captured frame of 16-bit PCM bytes (same length out)"""
+        start = time.perf_counter()
+        captured = pcm_to_array(pcm_bytes).astype(np.float32)
+        hop = self.hop
+        buffered = np.concatenate((self.history, captured))
+        count = len(buffered) // hop - 1
+        if count > 0:
+            windows = np.lib.stride_tricks.sliding_window_view(buffered, self.frame_size)[::hop][:count]
+            spectra = np.fft.rfft(windows * self.window, axis=1)
+            power = spectra.real ** 2 + spectra.imag ** 2
+            self.track_noise(power)
+            gain = np.maximum(self.suppression_gain(power, self.noise), self.floor)
+            out = np.fft.irfft(spectra * gain, n=self.frame_size, axis=1) * self.window
+            
+            # Overlap-add: each window's first half plus the previous window's second half
+            halves = np.vstack((self.tail, out[:-1, hop:]))
+            self.output = np.concatenate((self.output, (out[:, :hop] + halves).ravel()))
+            self.tail = out[-1, hop:]
+            self.history = buffered[count * hop:]
+        else:
+            self.history = buffered
+        
+        result = self.output[:len(captured)]
+        self.output = self.output[len(captured):]
+        if len(result) < len(captured):  # only before the first window is full
+            result = np.concatenate((np.zeros(len(captured) - len(result), dtype=np.float32), result))
+        
+        energy = float(np.dot(captured, captured))
+        if self.noise is not None and len(captured):
+            noise_power = float(self.noise.mean()) / float(np.dot(self.window, self.window))
+            self.snr_db = 10 * math.log10(max(energy / len(captured), 1e-9) / noise_power)
+        self.input_energy += energy
+        self.output_energy += float(np.dot(result, result))
+        self.frames += 1
+        self.cpu_seconds += time.perf_counter() - start
+        return to_pcm(result)
+    
+    def track_noise(self, power):
+        """Update the noise estimate from one chunk's window powers (minimum statistics)"""
+        # Average neighbouring windows and bins so the minimum is not a random dip
+        power = np.vstack((self.recent, power))
+        self.recent = power[-(self.SMOOTH_WINDOWS - 1):]
+        kernel = min(self.SMOOTH_WINDOWS, len(power))
+        smoothed = np.cumsum(power, axis=0)
+        smoothed[kernel:] = smoothed[kernel:] - smoothed[:-kernel]
+        smoothed = smoothed[kernel - 1:] / kernel
+        padded = np.pad(smoothed, ((0, 0), (1, 1)), mode='edge')
+        smoothed = (padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]) / 3
+        
+        self.minima.append((len(smoothed), smoothed.min(axis=0)))
+        windows = sum(count for count, _ in self.minima)
+        while len(self.minima) > 1 and windows - self.minima[0][0] >= self.window_frames:
+            windows -= self.minima.popleft()[0]
+        self.noise = np.min([minimum for _, minimum in self.minima], axis=0) * self.noise_bias + 1e-3
+    
+    def suppression_gain(self, power, noise):
+        raise NotImplementedError
+    
+    def above_noise(self, margin_db=6):
+        """True if the last frame was margin_db over the noise floor (always, before there is one)"""
+        return self.snr_db >= margin_db
+    
+    def stats(self):
+        """Energy removed so far, noise floor and CPU per frame"""
+        noise_db = None
+        if self.noise is not None:
+            # Mean noise power per bin back to a sample RMS, relative to full scale
+            rms = np.sqrt(float(self.noise.mean()) / float(np.dot(self.window, self.window)))
+            noise_db = round(float(20 * np.log10(max(rms, 1e-3) / 32768)), 1)
+        return {
+            'backend': self.name,
+            'removed_db': round(erle_db(self.input_energy, self.output_energy), 1),
+            'noise_dbfs': noise_db,
+            'us_per_frame': round(self.cpu_seconds / self.frames * 1e6, 1) if self.frames else None
+        }
+
+class SpectralSubtraction(NoiseSuppressor):
+    """Power spectral subtraction with over-subtraction"""
+    name = 'subtract'
+    
+    def __init__(self, rate=22050, over_subtraction=2.0, **kwargs):
+        super().__init__(rate, **kwargs)
+        self.over_subtraction = over_subtraction
+    
+    def suppression_gain(self, power, noise):
+        return np.sqrt(np.maximum(1 - self.over_subtraction * noise / (power + 1e-9), 0))
+
+class WienerSuppressor(NoiseSuppressor):
+    """Wiener gain from an SNR smoothed over neighbouring windows and bins
+    
+    The a-priori SNR is estimated as (posterior SNR - 1) over the power
+    averaged across the window, the two before it (carried over from the
+    previous chunk) and the bins either side - a vectorized stand-in for
+    the decision-directed estimate that keeps noise-only bins from
+    flickering open.
+    """
+    name = 'wiener'
+    
+    def __init__(self, rate=22050, **kwargs):
+        super().__init__(rate, **kwargs)
+        self.last_power = None
+    
+    def suppression_gain(self, power, noise):
+        previous = power[:1].repeat(2, axis=0) if self.last_power is None else self.last_power
+        stacked = np.vstack((previous, power))
+        self.last_power = stacked[-2:]
+        smoothed = (stacked[:-2] + stacked[1:-1] + stacked[2:]) / 3
+        padded = np.pad(smoothed, ((0, 0), (1, 1)), mode='edge')
+        smoothed = (padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]) / 3
+        snr = np.maximum(smoothed / noise - 1, 0)
+        return snr / (1 + snr)
+
+NOISE_SUPPRESSORS = {
+    'wiener': WienerSuppressor,
+    'subtract': SpectralSubtraction
+}
+
+def create_noise_suppressor(backend='wiener', **kwargs):
+    """Build a noise suppressor by backend name ('wiener' or 'subtract')"""
+    return NOISE_SUPPRESSORS[backend](**kwargs)
+
+class PlayoutBuffer:
+    """Holds received audio between the network and the speaker
+    
+    push() queues PCM as it arrives. pull() returns the next chunk for the
+    speaker, once a whole chunk can be made. When the sender goes quiet,
+    flush() returns whatever is left. Each subclass decides what to do when
+    more than target_ms is buffered: drop audio, or play it faster.
+    """
+    def __init__(self, rate=22050, target_ms=150):
+        self.rate = rate
+        self.target = int(rate * target_ms / 1000)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.offset = 0          # input samples already removed from pending
+        
+        # Stats for the quality report
+        self.chunks = 0
+        self.cpu_seconds = 0.0
+        self.dropped = 0         # input samples discarded
+        self.drop_events = 0     # discontinuities caused by discarding
+        self.stretched = 0       # input samples skipped (+) or repeated (-) by time-stretching
+    
+    @property
+    def buffered(self):
+        """Received samples that have not been played yet"""
+        return len(self.pending)
+    
+    @property
+    def buffered_ms(self):
+        return self.buffered * 1000 / self.rate
+    
+    @property
+    def position(self):
+        """Input samples played, skipped or dropped so far - the playout clock"""
+        return self.offset
+    
+    def push(self, pcm_bytes):
+        """Queue audio received from the network"""
+        self.pending = np.concatenate((self.pending, pcm_to_array(pcm_bytes).astype(np.float32)))
+    
+    def consume(self, count):
+        """Remove count samples from the front of pending"""
+        self.pending = self.pending[count:]
+        self.offset += count
+    
+    def pull(self, count):
+        """The next count samples as PCM bytes, or b'' if not enough is buffered"""
+        if self.buffered < count:
+            return b''
+        start = time.perf_counter()
+        out = self.pending[:count]
+        self.consume(count)
+        self.chunks += 1
+        self.cpu_seconds += time.perf_counter() - start
+        return to_pcm(out)
+    
+    def flush(self):
+        """Everything still buffered, played as is (the sender went quiet)"""
+        out = self.pending
+        self.consume(len(out))
+        return to_pcm(out)
+    
+    def stats(self):
+        """Buffer level, what was discarded or stretched, and CPU per chunk"""
+        return {
+            'policy': self.name,
+            'buffered_ms': round(self.buffered_ms),
+            'dropped_ms': round(self.dropped * 1000 / self.rate),
+            'drop_events': self.drop_events,
+            'stretched_ms': round(self.stretched * 1000 / self.rate),
+            'us_per_chunk': round(self.cpu_seconds / self.chunks * 1e6, 1) if self.chunks else None
+        }
+
+class DropPlayout(PlayoutBuffer):
+    """Plays audio as received; over max_ms, drops the oldest down to target"""
+    name = 'drop'
+    
+    def __init__(self, rate=22050, target_ms=150, max_ms=None):
+        super().__init__(rate, target_ms)
+        self.limit = int(rate * (max_ms or 2 * target_ms) / 1000)
+    
+    def pull(self, count):
+        if self.buffered > self.limit:
+            excess = self.buffered - self.target
+            self.consume(excess)
+            self.dropped += excess
+            self.drop_events += 1
+        return super().pull(count)
+
+class WsolaPlayout(PlayoutBuffer):
+    """Time-stretches audio (WSOLA) to steer the buffer towards target_ms
+    
+    The output is built from Hann-windowed frames of frame_ms that overlap
+    by half. Each frame moves hop * speed through the input. Its start is
+    shifted by up to search_ms to where the waveform best continues the
+    previous frame, so pitch is kept and the joins do not click. Speed is
+    picked before each chunk. Within 25% of the target it is 1.0, and the
+    output is then the input, sample for sample. It rises to max_speed at
+    twice the target and falls to min_speed as the buffer empties. Beyond
+    max_ms the oldest audio is dropped, as a last resort.
+    """
+    name = 'wsola'
+    
+    def __init__(self, rate=22050, target_ms=150, max_speed=1.1, min_speed=0.9,
+                 frame_ms=20, search_ms=8, max_ms=2000):
+        super().__init__(rate, target_ms)
+        self.max_speed = max_speed
+        self.min_speed = min_speed
+        self.hop = int(rate * frame_ms / 2000)
+        self.frame = 2 * self.hop
+        self.search = min(int(rate * search_ms / 1000), self.hop - 1)
+        self.limit = int(rate * max_ms / 1000)
+        # Periodic Hann: the two halves of overlapping frames sum to exactly 1
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.frame) / self.frame)).astype(np.float32)
+        self.speed = 1.0
+        self.reset()
+    
+    def reset(self):
+        """Start over without a previous frame to continue from"""
+        self.pos = 0.0           # where the next frame should start in pending
+        self.prev = None         # where the previous frame did start
+        self.tail = np.zeros(self.hop, dtype=np.float32)   # its windowed second half
+        self.output = np.zeros(0, dtype=np.float32)        # made but not pulled yet
+    
+    @property
+    def buffered(self):
+        return len(self.pending) - int(self.pos) + len(self.output)
+    
+    @property
+    def position(self):
+        return self.offset + int(self.pos)
+    
+    def push(self, pcm_bytes):
+        super().push(pcm_bytes)
+        if self.buffered > self.limit:
+            excess = self.buffered - self.target
+            self.consume(len(self.pending) - self.target)
+            self.reset()
+            self.dropped += excess
+            self.drop_events += 1
+    
+    def speed_for(self, buffered):
+        """Playback speed for the current buffer level"""
+        error = (buffered - self.target) / self.target
+        if abs(error) <= 0.25:
+            return 1.0
+        if error > 0:
+            return 1 + (self.max_speed - 1) * min(1.0, error)
+        return 1 - (1 - self.min_speed) * min(1.0, -error)
+    
+    def best_start(self, natural, nominal):
+        """Frame start near nominal whose first half best matches the natural continuation"""
+        lo = max(0, nominal - self.search)
+        template = self.pending[natural:natural + self.hop]
+        region = self.pending[lo:nominal + self.search + self.hop]
+        # Sliding energy from a running sum, correlation for all candidates at once
+        power = np.concatenate(([0.0], np.cumsum(region.astype(np.float64) ** 2)))
+        energy = power[self.hop:] - power[:-self.hop] + 1e-3
+        return lo + int(np.argmax(np.correlate(region, template, 'valid') / np.sqrt(energy)))
+    
+    def make_hop(self, speed):
+        """The next hop output samples, or None if more input is needed"""
+        nominal = int(round(self.pos))
+        natural = nominal if self.prev is None else self.prev + self.hop
+        if len(self.pending) < max(natural, nominal + self.search) + self.frame:
+            return None
+        
+        if self.prev is None:
+            start = nominal
+            out = self.pending[start:start + self.hop]   # nothing to overlap with
+        else:
+            start = natural if speed == 1.0 else self.best_start(natural, nominal)
+            out = self.tail + self.window[:self.hop] * self.pending[start:start + self.hop]
+        self.tail = self.window[self.hop:] * self.pending[start + self.hop:start + self.frame]
+        self.prev = start
+        
+        if speed == 1.0:
+            self.pos = start + self.hop   # follow the frames exactly - plain playback
+        else:
+            self.pos += self.hop * speed
+            self.stretched += round(self.hop * (speed - 1))
+        return out
+    
+    def pull(self, count):
+        start = time.perf_counter()
+        self.speed = self.speed_for(self.buffered)
+        parts = [self.output]
+        made = len(self.output)
+        while made < count:
+            out = self.make_hop(self.speed)
+            if out is None:
+                break
+            parts.append(out)
+            made += len(out)
+        self.output = np.concatenate(parts)
+        
+        # Keep only the input the next frame can still reach
+        keep = max(0, min(int(self.pos) - self.search, int(self.pos) if self.prev is None else self.prev))
+        self.pending = self.pending[keep:]
+        self.offset += keep
+        self.pos -= keep
+        if self.prev is not None:
+            self.prev -= keep
+        
+        if len(self.output) < count:
+            return b''
+        out = self.output[:count]
+        self.output = self.output[count:]
+        self.chunks += 1
+        self.cpu_seconds += time.perf_counter() - start
+        return to_pcm(out)
+    
+    def flush(self):
+        # The windowed tail plus the rest of its frame is the plain input again
+        start = int(self.pos) if self.prev is None else self.prev + self.hop
+        out = np.concatenate((self.output, self.pending[start:]))
+        self.consume(len(self.pending))
+        self.reset()
+        return to_pcm(out)
+
+PLAYOUT_POLICIES = {
+    'wsola': WsolaPlayout,
+    'drop': DropPlayout
+}
+
+def create_playout(policy='wsola', **kwargs):
+    """Build a playout buffer by policy name ('wsola' or 'drop')"""
+    return PLAYOUT_POLICIES[policy](**kwargs)
+
+def to_pcm(samples):
+    """Round and clip float samples to 16-bit PCM bytes"""
+    return np.clip(np.round(samples), -32768, 32767).astype(np.int16).tobytes()
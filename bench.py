@@ -0,0 +1,1793 @@
+#!/usr/bin/env python3
+"""
+Audio Call Server Benchmarks
+Starts a local server.py in a scratch directory and drives it with synthetic
+clients and viewers, so changes to the forwarding path can be measured.
+
+Usage:
+    python bench.py coalesce --clients 4 --seconds 10 --frame-ms 10 --batch 4
+    python bench.py transport --loss 0.02 --rto-ms 200 --seconds 10
+    python bench.py sessions --sessions 10000 --frames 1000000
+    python bench.py watchers --clients 50 --watchers 1 10 50 --seconds 10
+    python bench.py aec --backend fdaf nlms
+    python bench.py aec --far recordings/<call>/viewer_mic.wav --near recordings/<call>/client_mic.wav
+    python bench.py playout --stall-ms 1000 --target-ms 150
+    python bench.py denoise --noise fan hvac --noise-dbfs -40
+    python bench.py profiler --frames 20000
+    python bench.py tls --calls 20 --seconds 10
+    python bench.py flood --idle 300 --flooders 5
+    python bench.py restart --calls 20
+    python bench.py transcode --sessions 50 --workers 2
+    python bench.py logindex --sessions 50000 --noise 5
+    python bench.py replay traffic.trace --speed 1 4 16
+    python bench.py codec
+    python bench.py control --processes 4 --calls 10 --seconds 5
+    python bench.py wall --clients 20 --listen 1 --seconds 10
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from base64 import b64decode, b64encode
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+import websockets
+
+import proxy_protocol
+import traffic_trace
+import udp_media
+from audio_dsp import (ECHO_CANCELLERS, NOISE_SUPPRESSORS, PLAYOUT_POLICIES, create_echo_canceller,
+                       create_noise_suppressor, create_playout, erle_db, to_pcm)
+from server import AudioCallManager
+
+SERVER_SCRIPT = Path(__file__).resolve().parent / 'server.py'
+
+def bench_uuid(i):
+    """Deterministic UUID for a synthetic client"""
+    return f"BE0C0000-0000-0000-0000-{i:012d}"
+
+def free_port():
+    """Pick a free local TCP port"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class BenchServer:
+    """Runs server.py as a subprocess with its own allowed.json and logs"""
+    # Every synthetic peer comes from 127.0.0.1 - per-address limits would
+    # throttle the bench itself (extra_args can still set them)
+    LOCAL_LIMITS = ['--max-per-ip', '1000000', '--ip-message-rate', '1e9', '--ip-byte-rate', '1e12']
+
+    def __init__(self, clients, extra_args=(), tls=False):
+        self.port = free_port()
+        self.tls = tls
+        self.workdir = tempfile.TemporaryDirectory(prefix='audio_bench_')
+        self.extra_args = list(extra_args)
+        self.url = f"{'wss' if tls else 'ws'}://127.0.0.1:{self.port}/ws"
+        self.process = None
+
+        with open(Path(self.workdir.name) / 'allowed.json', 'w') as f:
+            json.dump({'allowed_uuids': [bench_uuid(i) for i in range(clients)]}, f)
+
+    async def __aenter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, str(SERVER_SCRIPT), '--host', '127.0.0.1', '--port', str(self.port),
+             *self.LOCAL_LIMITS, *self.extra_args],
+            cwd=self.workdir.name,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        for _ in range(100):
+            try:
+                await self.stats()
+                return self
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    async def __aexit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+        self.workdir.cleanup()
+
+    async def stats(self):
+        """Fetch /api/server_stats from the running server"""
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{'https' if self.tls else 'http'}://127.0.0.1:{self.port}/api/server_stats",
+                                   ssl=False if self.tls else True) as resp:
+                return await resp.json()
+
+async def connect_call(url, uuid, mode='both', ssl=None):
+    """Connect a synthetic viewer and client for one UUID and set the call mode"""
+    viewer = await websockets.connect(url, max_size=None, ssl=ssl)
+    await viewer.send(json.dumps({'type': 'audio_viewer_connect', 'uuid': uuid}))
+    await viewer.recv()
+
+    client = await websockets.connect(url, max_size=None, ssl=ssl)
+    await client.send(json.dumps({'type': 'audio_client_connect', 'uuid': uuid}))
+    await client.recv()
+
+    await viewer.send(json.dumps({'type': 'call_mode_change', 'uuid': uuid, 'mode': mode}))
+    await client.recv()  # forwarded call_mode_change
+    return client, viewer
+
+def synthetic_frame(samples, rate=22050):
+    """Base64 PCM of a 440 Hz tone, the size of one captured frame"""
+    t = np.arange(samples) / rate
+    pcm = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+    return b64encode(pcm.tobytes()).decode('utf-8')
+
+def latency_summary(label, latencies_ms, sent):
+    """Percentiles of one-way frame latency"""
+    values = np.array(latencies_ms) if latencies_ms else np.zeros(1)
+    return {
+        'transport': label,
+        'frames_sent': sent,
+        'frames_received': len(latencies_ms),
+        'p50_ms': round(float(np.percentile(values, 50)), 1),
+        'p95_ms': round(float(np.percentile(values, 95)), 1),
+        'p99_ms': round(float(np.percentile(values, 99)), 1),
+        'max_ms': round(float(values.max()), 1)
+    }
+
+def summarize(label, before, after, seconds, received):
+    """Turn two server_stats snapshots into per-second rates"""
+    frames = after['frames_in'] - before['frames_in']
+    cpu = after['cpu_seconds'] - before['cpu_seconds']
+    return {
+        'mode': label,
+        'messages_in_per_s': round((after['messages_in'] - before['messages_in']) / seconds, 1),
+        'messages_out_per_s': round((after['messages_out'] - before['messages_out']) / seconds, 1),
+        'frames_per_s': round(frames / seconds, 1),
+        'frames_received': received,
+        'server_cpu_percent': round(cpu / seconds * 100, 1),
+        'cpu_us_per_frame': round(cpu / frames * 1e6, 1) if frames else None
+    }
+
+def print_table(rows):
+    """Print result rows as an aligned table"""
+    if not rows:
+        return
+    keys = list(rows[0])
+    widths = {k: max(len(k), *(len(str(r[k])) for r in rows)) for k in keys}
+    print("  ".join(k.ljust(widths[k]) for k in keys))
+    for row in rows:
+        print("  ".join(str(row[k]).ljust(widths[k]) for k in keys))
+
+# ---------------------------------------------------------------- coalesce
+
+async def drain_viewer(viewer, counter):
+    """Count audio frames arriving at a viewer, unpacking batches"""
+    try:
+        async for message in viewer:
+            data = json.loads(message)
+            if data.get('type') == 'audio_batch':
+                counter[0] += len(data.get('frames', []))
+            elif data.get('type') == 'client_system_audio':
+                counter[0] += 1
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def send_paced(client, uuid, frame_b64, frame_ms, batch, seconds):
+    """Send system audio at real-time pace, batch frames per message"""
+    interval = frame_ms / 1000 * batch
+    frame = {'type': 'client_system_audio', 'audio': frame_b64, 'rate': 22050}
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < seconds:
+        now = time.time()
+        if batch == 1:
+            await client.send(json.dumps({**frame, 'uuid': uuid, 'timestamp': now}))
+        else:
+            await client.send(json.dumps({
+                'type': 'audio_batch',
+                'uuid': uuid,
+                'frames': [{**frame, 'timestamp': now}] * batch
+            }))
+        sent += 1
+        await asyncio.sleep(max(0, start + sent * interval - time.perf_counter()))
+
+async def bench_coalesce(args):
+    """Messages/s and server CPU with and without coalescing"""
+    samples = int(22050 * args.frame_ms / 1000)
+    frame_b64 = synthetic_frame(samples)
+    rows = []
+
+    for label, batch in (('single', 1), (f'batch x{args.batch}', args.batch)):
+        async with BenchServer(args.clients) as server:
+            calls = [await connect_call(server.url, bench_uuid(i), 'listen') for i in range(args.clients)]
+            counter = [0]
+            drains = [asyncio.create_task(drain_viewer(v, counter)) for _, v in calls]
+
+            before = await server.stats()
+            await asyncio.gather(*(send_paced(c, bench_uuid(i), frame_b64, args.frame_ms, batch, args.seconds)
+                                   for i, (c, _) in enumerate(calls)))
+            await asyncio.sleep(0.5)  # let the last frames arrive
+            after = await server.stats()
+            rows.append(summarize(label, before, after, args.seconds, counter[0]))
+
+            for task in drains:
+                task.cancel()
+            for client, viewer in calls:
+                await client.close()
+                await viewer.close()
+    return rows
+
+# ---------------------------------------------------------------- transport
+
+class LossyTcpProxy:
+    """TCP proxy that emulates segment loss on the client -> server leg
+
+    A lost segment is retransmitted after an RTO, and TCP delivers in order,
+    so everything written behind it waits too - the stall is applied to the
+    whole stream, not just the lost chunk.
+    """
+    def __init__(self, target_port, loss, rto_ms):
+        self.target_port = target_port
+        self.loss = loss
+        self.rto = rto_ms / 1000
+        self.port = free_port()
+        self.server = None
+        self.losses = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', self.port)
+
+    async def handle(self, reader, writer):
+        up_reader, up_writer = await asyncio.open_connection('127.0.0.1', self.target_port)
+        await asyncio.gather(self.pipe(reader, up_writer, lossy=True),
+                             self.pipe(up_reader, writer, lossy=False),
+                             return_exceptions=True)
+
+    async def pipe(self, reader, writer, lossy):
+        try:
+            while data := await reader.read(65536):
+                if lossy and random.random() < self.loss:
+                    self.losses += 1
+                    await asyncio.sleep(self.rto)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+
+class LossyUdpProxy(asyncio.DatagramProtocol):
+    """UDP proxy that drops client -> server datagrams at the given rate"""
+    def __init__(self, target_port, loss):
+        self.target = ('127.0.0.1', target_port)
+        self.loss = loss
+        self.port = None
+        self.transport = None
+        self.client_addr = None
+        self.losses = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.port = transport.get_extra_info('sockname')[1]
+
+    def datagram_received(self, data, addr):
+        if addr == self.target:
+            if self.client_addr:
+                self.transport.sendto(data, self.client_addr)
+            return
+        self.client_addr = addr
+        if random.random() < self.loss:
+            self.losses += 1
+            return
+        self.transport.sendto(data, self.target)
+
+async def collect_latency(viewer, latencies):
+    """Record one-way latency of every client frame reaching the viewer"""
+    try:
+        async for message in viewer:
+            data = json.loads(message)
+            if data.get('type') == 'client_system_audio':
+                latencies.append((time.time() - data['timestamp']) * 1000)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def bench_transport(args):
+    """Frame latency tails over WebSocket/TCP vs UDP under packet loss"""
+    if not udp_media.is_available():
+        raise SystemExit("transport bench needs the 'cryptography' package")
+
+    samples = int(22050 * args.frame_ms / 1000)
+    pcm = b64decode(synthetic_frame(samples))
+    interval = args.frame_ms / 1000
+    uuid = bench_uuid(0)
+    rows = []
+
+    udp_port = free_port()
+    async with BenchServer(1, ['--udp-port', str(udp_port)]) as server:
+        tcp_proxy = LossyTcpProxy(server.port, args.loss, args.rto_ms)
+        await tcp_proxy.start()
+        loop = asyncio.get_running_loop()
+        _, udp_proxy = await loop.create_datagram_endpoint(
+            lambda: LossyUdpProxy(udp_port, args.loss), local_addr=('127.0.0.1', 0))
+
+        for label in ('websocket', 'udp'):
+            # The client leg goes through the lossy proxy, the viewer is direct
+            client_url = f"ws://127.0.0.1:{tcp_proxy.port}/ws" if label == 'websocket' else server.url
+            viewer = await websockets.connect(server.url, max_size=None)
+            await viewer.send(json.dumps({'type': 'audio_viewer_connect', 'uuid': uuid}))
+            await viewer.recv()
+            client = await websockets.connect(client_url, max_size=None)
+            await client.send(json.dumps({'type': 'audio_client_connect', 'uuid': uuid}))
+            await client.recv()
+            await viewer.send(json.dumps({'type': 'call_mode_change', 'uuid': uuid, 'mode': 'listen'}))
+            await client.recv()
+
+            channel = None
+            if label == 'udp':
+                await client.send(json.dumps({'type': 'udp_offer', 'uuid': uuid}))
+                answer = json.loads(await client.recv())
+                channel = await udp_media.open_channel('127.0.0.1', udp_proxy.port, b64decode(answer['key']),
+                                                       answer['session_id'], lambda *frame: None)
+
+            latencies = []
+            collector = asyncio.create_task(collect_latency(viewer, latencies))
+            frame = {'type': 'client_system_audio', 'uuid': uuid,
+                     'audio': b64encode(pcm).decode('utf-8'), 'rate': 22050}
+            start = time.perf_counter()
+            sent = 0
+            while time.perf_counter() - start < args.seconds:
+                if channel:
+                    channel.send(udp_media.KIND_SYSTEM, time.time(), 22050, pcm)
+                else:
+                    await client.send(json.dumps({**frame, 'timestamp': time.time()}))
+                sent += 1
+                await asyncio.sleep(max(0, start + sent * interval - time.perf_counter()))
+            await asyncio.sleep(args.rto_ms / 1000 + 0.5)  # let stalled frames drain
+
+            collector.cancel()
+            rows.append(latency_summary(label, latencies, sent))
+            if channel:
+                channel.close()
+            await client.close()
+            await viewer.close()
+
+        tcp_proxy.close()
+        udp_proxy.transport.close()
+    return rows
+
+# ---------------------------------------------------------------- sessions
+
+class ParallelDictCalls:
+    """The old AudioCallManager layout: one dict per attribute, dicts as records"""
+    def __init__(self):
+        self.audio_clients = {}
+        self.audio_viewers = {}
+        self.call_modes = {}
+        self.ping_times = {}
+        self.audio_stats = {}
+        self.resume_tokens = {}
+        self.quality_reports = {}
+
+    def add_call(self, uuid, client_ws, viewer_ws):
+        now = time.time()
+        self.audio_clients[uuid] = {'ws': client_ws, 'ip': '10.0.0.1', 'connected_at': now}
+        self.audio_viewers[uuid] = {'ws': viewer_ws, 'ip': '10.0.0.2', 'connected_at': now, 'transport': None,
+                                    'dropped_frames': 0, 'congestion_events': 0, 'last_congestion_signal': 0}
+        self.call_modes[uuid] = 'both'
+        self.ping_times[uuid] = now
+        self.audio_stats[uuid] = {'system_audio': 0, 'mic_audio': 0}
+        self.resume_tokens[uuid] = 'x' * 22
+
+    def route_frame(self, uuid):
+        """The lookups a client frame needed before forwarding"""
+        if self.call_modes.get(uuid, 'off') not in ['listen', 'both']:
+            return None
+        viewer = self.audio_viewers.get(uuid)
+        if not viewer:
+            return None
+        if uuid in self.audio_stats:
+            self.audio_stats[uuid]['system_audio'] += 1
+        return viewer['ws']
+
+class SessionCalls:
+    """The current layout: one CallSession per UUID"""
+    def __init__(self):
+        self.manager = AudioCallManager()
+
+    def add_call(self, uuid, client_ws, viewer_ws):
+        self.manager.add_audio_client(uuid, client_ws, '10.0.0.1')
+        self.manager.add_audio_viewer(uuid, viewer_ws, '10.0.0.2')
+        self.manager.set_call_mode(uuid, 'both')
+        self.manager.update_ping(uuid)
+        self.manager.get_session(uuid).resume_token = 'x' * 22
+
+    def route_frame(self, uuid):
+        """The lookups a client frame needs before forwarding"""
+        session = self.manager.sessions.get(uuid)
+        if not session or not session.to_viewer or not session.viewer_ws:
+            return None
+        session.system_audio += 1
+        return session.viewer_ws
+
+def bench_sessions(args):
+    """Per-call memory and per-frame routing cost at many sessions"""
+    uuids = [bench_uuid(i) for i in range(args.sessions)]
+    order = [uuids[i] for i in np.random.default_rng(0).integers(0, args.sessions, args.frames)]
+    rows = []
+
+    for label, layout in (('parallel dicts', ParallelDictCalls), ('CallSession', SessionCalls)):
+        sockets = [object() for _ in range(2 * args.sessions)]  # stand-ins for websockets
+        tracemalloc.start()
+        calls = layout()
+        for i, uuid in enumerate(uuids):
+            calls.add_call(uuid, sockets[2 * i], sockets[2 * i + 1])
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        route = calls.route_frame
+        start = time.perf_counter()
+        for uuid in order:
+            route(uuid)
+        elapsed = time.perf_counter() - start
+
+        rows.append({
+            'layout': label,
+            'sessions': args.sessions,
+            'bytes_per_call': round(memory / args.sessions),
+            'total_mb': round(memory / 1e6, 2),
+            'ns_per_frame': round(elapsed / args.frames * 1e9)
+        })
+    return rows
+
+# ---------------------------------------------------------------- watchers
+
+async def churn_modes(calls, stop):
+    """Flip call modes so the status feed has deltas to push"""
+    modes = ['listen', 'both']
+    i = 0
+    while not stop.is_set():
+        i += 1
+        client, viewer = calls[i % len(calls)]
+        await viewer.send(json.dumps({'type': 'call_mode_change', 'uuid': bench_uuid(i % len(calls)),
+                                      'mode': modes[i // len(calls) % 2]}))
+        await asyncio.sleep(0.1)
+
+async def poll_watcher(http, base, uuids, interval, stop, counter):
+    """Dashboard that polls /api/status for every UUID"""
+    while not stop.is_set():
+        for uuid in uuids:
+            async with http.get(f"{base}/api/status/{uuid}") as resp:
+                await resp.read()
+            counter[0] += 1
+        await asyncio.sleep(interval)
+
+async def feed_watcher(http, base, stop, counter):
+    """Dashboard that loads /api/sessions once, then follows the delta feed"""
+    after = ''
+    while True:
+        async with http.get(f"{base}/api/sessions", params={'after': after, 'limit': 1000}) as resp:
+            page = await resp.json()
+        counter[0] += 1
+        if not page['next']:
+            break
+        after = page['next']
+    async with http.get(f"{base}/api/status_feed", params={'since': page['version']}) as resp:
+        counter[0] += 1
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(resp.content.readany(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+async def bench_watchers(args):
+    """Server CPU for N dashboards polling vs following the status feed"""
+    rows = []
+    for label in ('poll', 'feed'):
+        for watchers in args.watchers:
+            async with BenchServer(args.clients, ['--status-interval', '1']) as server:
+                base = f"http://127.0.0.1:{server.port}"
+                uuids = [bench_uuid(i) for i in range(args.clients)]
+                calls = [await connect_call(server.url, uuid, 'listen') for uuid in uuids]
+                drains = [asyncio.create_task(drain_viewer(c, [0])) for c, _ in calls]  # forwarded mode changes
+                stop = asyncio.Event()
+                counter = [0]
+
+                async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+                    before = await server.stats()
+                    tasks = [asyncio.create_task(churn_modes(calls, stop))]
+                    for _ in range(watchers):
+                        if label == 'poll':
+                            tasks.append(asyncio.create_task(
+                                poll_watcher(http, base, uuids, args.poll_interval, stop, counter)))
+                        else:
+                            tasks.append(asyncio.create_task(feed_watcher(http, base, stop, counter)))
+                    await asyncio.sleep(args.seconds)
+                    after = await server.stats()
+                    stop.set()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+
+                for task in drains:
+                    task.cancel()
+                for client, viewer in calls:
+                    await client.close()
+                    await viewer.close()
+
+            cpu = after['cpu_seconds'] - before['cpu_seconds']
+            rows.append({
+                'mode': label,
+                'watchers': watchers,
+                'http_requests': counter[0],
+                'status_deltas': after['status_version'] - before['status_version'],
+                'server_cpu_percent': round(cpu / args.seconds * 100, 1)
+            })
+    return rows
+
+# ---------------------------------------------------------------- aec
+
+def speech_like(seconds, rate, rng, pause_every=2.0):
+    """Band-limited noise with a syllable envelope and pauses, as int16-range floats"""
+    n = int(seconds * rate)
+    t = np.arange(n) / rate
+    noise = np.convolve(rng.standard_normal(n), np.hanning(9), mode='same')
+    noise /= noise.std()
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None) ** 0.5
+    envelope *= (t % pause_every) < pause_every * 0.7   # talk spurts with gaps
+    return noise * envelope * 3000
+
+def room_response(rate, rng, delay_ms=25, rt60_ms=120, gain=0.6):
+    """Speaker -> mic impulse response: a delay, then decaying reflections"""
+    length = int(rate * rt60_ms / 1000)
+    decay = np.exp(-6.9 * np.arange(length) / length)   # -60 dB over rt60
+    response = rng.standard_normal(length) * decay * 0.15
+    response[0] = 1.0
+    response = np.concatenate((np.zeros(int(rate * delay_ms / 1000)), response))
+    return response * gain / np.sqrt(np.sum(response ** 2))
+
+def echo_scenarios(rate, seconds, rng):
+    """(name, far-end reference, near-end capture, echo-only mask) per scenario"""
+    far = speech_like(seconds, rate, rng)
+    n = len(far)
+    room = room_response(rate, rng)
+    echo = np.convolve(far, room)[:n]
+    noise = rng.standard_normal(n) * 30
+    scenarios = [('single talk', far, echo + noise, np.ones(n, dtype=bool))]
+
+    near = speech_like(seconds, rate, rng, pause_every=3.1) * 0.8
+    near_active = np.zeros(n, dtype=bool)
+    near_active[n // 3:2 * n // 3] = True
+    near *= near_active
+    scenarios.append(('double talk', far, echo + near + noise, ~near_active))
+
+    moved = np.convolve(far, room_response(rate, rng, delay_ms=40))[:n]
+    path_change = np.concatenate((echo[:n // 2], moved[n // 2:]))
+    scenarios.append(('path change', far, path_change + noise, np.ones(n, dtype=bool)))
+
+    loopback = np.concatenate((np.zeros(int(rate * 0.03)), far))[:n] * 0.9
+    scenarios.append(('loopback', far, loopback, np.ones(n, dtype=bool)))
+    return scenarios
+
+def read_wav(path):
+    """Mono 16-bit WAV as (samples, rate)"""
+    with wave.open(str(path), 'rb') as f:
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).astype(np.float64), f.getframerate()
+
+def run_canceller(backend, far, near, rate, frame, mask, warmup_s):
+    """Feed a scenario frame by frame like the client does; ERLE on echo-only samples"""
+    canceller = create_echo_canceller(backend, rate=rate)
+    to_pcm = lambda a: np.clip(a, -32768, 32767).astype(np.int16).tobytes()
+    out = []
+    for i in range(0, len(near) - frame + 1, frame):
+        canceller.add_reference(to_pcm(far[i:i + frame]))
+        out.append(np.frombuffer(canceller.process(to_pcm(near[i:i + frame])), dtype=np.int16))
+    out = np.concatenate(out).astype(np.float64)
+    n = len(out)
+
+    scored = mask[:n] & (np.abs(far[:n]) > 0)
+    scored[:int(warmup_s * rate)] = False
+    stats = canceller.stats()
+    return {
+        'erle_db': round(erle_db(np.sum(near[:n][scored] ** 2), np.sum(out[scored] ** 2)), 1),
+        'us_per_frame': stats['us_per_frame'],
+        'realtime_percent': round(stats['us_per_frame'] / (frame / rate * 1e6) * 100, 2)
+    }
+
+def bench_aec(args):
+    """Echo return loss enhancement and CPU per frame for each backend"""
+    rng = np.random.default_rng(1)
+    if args.far and args.near:
+        far, rate = read_wav(args.far)
+        near, _ = read_wav(args.near)
+        n = min(len(far), len(near))
+        scenarios = [('recorded', far[:n], near[:n], np.ones(n, dtype=bool))]
+    else:
+        rate = args.rate
+        scenarios = echo_scenarios(rate, args.seconds, rng)
+
+    rows = []
+    for name, far, near, mask in scenarios:
+        for backend in args.backend:
+            rows.append({'scenario': name, 'backend': backend, 'frame': args.frame,
+                         **run_canceller(backend, far, near, rate, args.frame, mask, args.warmup)})
+    return rows
+
+# ---------------------------------------------------------------- playout
+
+def voiced_speech(seconds, rate, f0=140, pause_every=2.0):
+    """Harmonics of f0 with a syllable envelope and pauses - has a pitch to check"""
+    t = np.arange(int(seconds * rate)) / rate
+    voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 8))
+    envelope = 0.3 + 0.7 * np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None)
+    envelope *= (t % pause_every) < pause_every * 0.8
+    return voice * envelope * 4000
+
+def pitch_hz(samples, rate, low=60, high=400):
+    """Strongest autocorrelation period between low and high Hz"""
+    x = samples - samples.mean()
+    spectrum = np.fft.rfft(x, 2 * len(x))
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:len(x)]
+    lo, hi = int(rate / high), int(rate / low)
+    return round(rate / (lo + int(np.argmax(autocorr[lo:hi]))), 1)
+
+def packet_arrivals(seconds, rate, packet, stall_at, stall_s, jitter_s, rng):
+    """(arrival time, first sample) per viewer packet; a stall releases its backlog at once"""
+    arrivals = []
+    for first in range(0, int(seconds * rate) - packet + 1, packet):
+        sent = first / rate
+        arrival = sent + rng.uniform(0, jitter_s)
+        if stall_at <= sent < stall_at + stall_s:
+            arrival = stall_at + stall_s + rng.uniform(0, jitter_s)
+        arrivals.append((arrival, first))
+    return sorted(arrivals)
+
+def run_playout(policy, signal, arrivals, args):
+    """Play the arrivals through one policy on a simulated speaker clock"""
+    rate, chunk, packet = args.rate, args.chunk, args.packet
+    options = {'max_speed': args.max_speed} if policy == 'wsola' else {}
+    playout = create_playout(policy, rate=rate, target_ms=args.target_ms, **options)
+    tick = chunk / rate
+    now, i, last_push = arrivals[0][0], 0, 0.0
+    curve, played, underruns = [], [], 0
+    while i < len(arrivals) or playout.buffered:
+        while i < len(arrivals) and arrivals[i][0] <= now:
+            first = arrivals[i][1]
+            playout.push(to_pcm(signal[first:first + packet]))
+            last_push, i = now, i + 1
+        pcm = playout.pull(chunk)
+        if not pcm and playout.buffered and now - last_push > 2 * tick:
+            pcm = playout.flush()
+        if pcm:
+            played.append(np.frombuffer(pcm, dtype=np.int16))
+        elif i < len(arrivals):
+            underruns += 1
+        # Sender capture time of what the speaker is playing now
+        curve.append((now, now - playout.position / rate))
+        now += tick
+
+    times = np.array([t for t, _ in curve])
+    latency = np.array([l for _, l in curve]) * 1000
+    stall_end = args.stall_at + args.stall_ms / 1000
+    baseline = float(np.median(latency[times < args.stall_at]))
+    after = times >= stall_end
+    settled = after & (latency <= baseline + 20)
+    recovery = float(times[settled][0] - stall_end) if settled.any() else None
+    stretched = np.concatenate(played).astype(np.float64)
+    window = slice(int(stall_end * rate), int((stall_end + 3) * rate))
+    stats = playout.stats()
+    return {
+        'policy': policy,
+        'baseline_ms': round(baseline),
+        'peak_ms': round(float(latency[after].max())),
+        'recovery_s': round(recovery, 2) if recovery is not None else None,
+        'dropped_ms': stats['dropped_ms'],
+        'drop_events': stats['drop_events'],
+        'stretched_ms': stats['stretched_ms'],
+        'underruns': underruns,
+        'pitch_hz': pitch_hz(stretched[window], rate),
+        'us_per_chunk': stats['us_per_chunk'],
+        'curve_ms': [round(float(l)) for l in latency[times >= args.stall_at][::max(1, round(0.5 / tick))]]
+    }
+
+def bench_playout(args):
+    """Latency recovery after a network stall: time-stretching vs dropping"""
+    rng = np.random.default_rng(1)
+    signal = voiced_speech(args.seconds, args.rate, f0=args.f0)
+    arrivals = packet_arrivals(args.seconds, args.rate, args.packet, args.stall_at,
+                               args.stall_ms / 1000, args.jitter_ms / 1000, rng)
+    return [run_playout(policy, signal, arrivals, args) for policy in args.policy]
+
+# ---------------------------------------------------------------- denoise
+
+def office_noise(kind, seconds, rate, rng, dbfs):
+    """Steady background noise at an RMS level: 'fan' (rumble and hum) or 'hvac' (broadband hiss)"""
+    n = int(seconds * rate)
+    white = rng.standard_normal(n)
+    if kind == 'fan':
+        t = np.arange(n) / rate
+        rumble = np.convolve(white, np.ones(32) / 32, mode='same')   # low-pass
+        noise = rumble / rumble.std() + sum(0.5 / k * np.sin(2 * np.pi * 120 * k * t) for k in range(1, 4))
+    else:
+        spectrum = np.fft.rfft(white)
+        spectrum /= np.sqrt(np.arange(len(spectrum)) + 1)          # pink: -3 dB per octave
+        spectrum[:int(60 * n / rate)] = 0                           # nothing below 60 Hz
+        noise = np.fft.irfft(spectrum, n)
+    return noise / noise.std() * 32768 * 10 ** (dbfs / 20)
+
+def run_suppressor(backend, clean, noise, rate, chunk, warmup_s, gate, margin_db):
+    """Noise removed, SNR before and after, and how often silence and speech pass the voice gate"""
+    suppressor = create_noise_suppressor(backend, rate=rate)
+    noisy = np.clip(clean + noise, -32768, 32767)
+    n = len(noisy) // chunk * chunk
+    out, opened = [], []
+    for i in range(0, n, chunk):
+        processed = np.frombuffer(suppressor.process(to_pcm(noisy[i:i + chunk])), dtype=np.int16)
+        out.append(processed)
+        # The client's gate: peak over the fixed level and, with a suppressor, over the noise floor
+        opened.append(np.max(np.abs(processed)) > gate and suppressor.above_noise(margin_db))
+    out = np.concatenate(out).astype(np.float64)
+    delay = 2 * suppressor.hop
+    warmup = int(warmup_s * rate) // chunk
+    quiet = [not np.any(clean[i:i + chunk]) for i in range(0, n, chunk)]
+    speech = [np.sum(clean[i:i + chunk] ** 2) > np.sum(noise[i:i + chunk] ** 2) for i in range(0, n, chunk)]
+    out, noisy_in = out[delay:], noisy
+    noisy, clean = noisy[:n - delay], clean[:n - delay]
+
+    scored = np.arange(len(out)) >= warmup_s * rate
+    silent = scored & (clean == 0)
+    talking = scored & (clean != 0)
+
+    def snr_db(signal):
+        error = signal[talking] - clean[talking]
+        return round(10 * np.log10(np.sum(clean[talking] ** 2) / max(np.sum(error ** 2), 1e-9)), 1)
+
+    def percent(decisions, chunks):
+        chosen = [decisions[k] for k in range(warmup, len(chunks)) if chunks[k]]
+        return round(100 * sum(chosen) / len(chosen), 1) if chosen else None
+
+    level_gate = [np.max(np.abs(noisy_in[i:i + chunk])) > gate for i in range(0, n, chunk)]
+    stats = suppressor.stats()
+    return {
+        'noise_reduction_db': round(erle_db(np.sum(noisy[silent] ** 2), np.sum(out[silent] ** 2)), 1),
+        'snr_in_db': snr_db(noisy),
+        'snr_out_db': snr_db(out),
+        'gate_open_in_percent': percent(level_gate, quiet),
+        'gate_open_out_percent': percent(opened, quiet),
+        'speech_passed_percent': percent(opened, speech),
+        'noise_estimate_dbfs': stats['noise_dbfs'],
+        'us_per_chunk': stats['us_per_frame'],
+        'realtime_percent': round(stats['us_per_frame'] / (chunk / rate * 1e6) * 100, 2)
+    }
+
+def bench_denoise(args):
+    """Noise reduction, speech SNR and CPU per chunk for each suppressor backend"""
+    rng = np.random.default_rng(1)
+    clean = speech_like(args.seconds, args.rate, rng)
+    rows = []
+    for kind in args.noise:
+        noise = office_noise(kind, args.seconds, args.rate, rng, args.noise_dbfs)
+        for backend in args.backend:
+            for chunk in args.chunk:
+                rows.append({'noise': kind, 'backend': backend, 'chunk': chunk,
+                             **run_suppressor(backend, clean, noise, args.rate, chunk, args.warmup, args.gate,
+                                              args.margin_db)})
+    return rows
+
+# ---------------------------------------------------------------- profiler
+
+def pipeline_frame(profiler, pcm, captured_at):
+    """The client's per-frame work between device read and send, with its laps"""
+    mark = time.perf_counter_ns()
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    mark = profiler.lap('device_read', mark)
+    level = int(np.max(np.abs(samples)))
+    profiler.lap('level_check', mark)
+    profiler.record('queue_wait', int((time.time() - captured_at) * 1e9))
+    mark = time.perf_counter_ns()
+    message = json.dumps({'type': 'client_microphone_audio', 'audio': b64encode(pcm).decode('utf-8'),
+                          'rate': 22050, 'timestamp': captured_at, 'level': level})
+    mark = profiler.lap('encode', mark)
+    profiler.lap('send', mark)
+    return message
+
+def bench_profiler(args):
+    """Cost of the stage profiler per call and per frame, against its budget"""
+    from client import StageProfiler   # the client module needs PyAudio
+
+    lap_ns = {}
+    for enabled in (False, True):
+        profiler = StageProfiler(enabled=enabled)
+        start = time.perf_counter_ns()
+        mark = start
+        for _ in range(args.calls):
+            mark = profiler.lap('encode', mark)
+        lap_ns[enabled] = round((time.perf_counter_ns() - start) / args.calls)
+
+    pcm = (np.sin(np.arange(args.chunk) * 0.1) * 8000).astype(np.int16).tobytes()
+    frame_us = args.chunk / 22050 * 1e6
+    costs = {}
+    for enabled in (False, True, False, True):   # interleaved, best of two
+        profiler = StageProfiler(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            pipeline_frame(profiler, pcm, time.time())
+        cost = (time.perf_counter() - start) / args.frames * 1e6
+        costs[enabled] = min(cost, costs.get(enabled, cost))
+
+    rows = []
+    for enabled in (False, True):
+        overhead = max(0.0, costs[enabled] - costs[False])
+        rows.append({
+            'profiler': 'on' if enabled else 'off',
+            'ns_per_lap': lap_ns[enabled],
+            'us_per_frame': round(costs[enabled], 2),
+            'overhead_us': round(overhead, 2),
+            'overhead_percent': round(overhead / costs[False] * 100, 2),
+            'realtime_percent': round(overhead / frame_us * 100, 4),
+            'within_budget': overhead / frame_us * 100 <= args.budget_percent
+        })
+    return rows
+
+# ---------------------------------------------------------------- tls
+
+def make_certificate(directory):
+    """Self-signed certificate and key for 127.0.0.1 (needs the openssl command)"""
+    cert, key = Path(directory) / 'cert.pem', Path(directory) / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-keyout', str(key), '-out', str(cert)],
+                   check=True, capture_output=True)
+    return str(cert), str(key)
+
+def client_tls_context():
+    """Client context that accepts the bench's self-signed certificate"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+def run_tls_proxy(port, unix_path, cert, key):
+    """TLS-terminating proxy in front of a Unix socket, sending PROXY v1 headers
+
+    Runs in its own process, the way haproxy or nginx would.
+    """
+    async def pipe(reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(reader, writer):
+        upstream_reader, upstream_writer = await asyncio.open_unix_connection(unix_path)
+        upstream_writer.write(proxy_protocol.encode_v1(writer.get_extra_info('peername')[:2],
+                                                       writer.get_extra_info('sockname')[:2]))
+        await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+    async def serve():
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        server = await asyncio.start_server(handle, '127.0.0.1', port, ssl=context)
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+def handshake_times(port, count):
+    """Median full and resumed TLS handshake times, and the share resumed"""
+    context = client_tls_context()
+    request = b'GET /api/server_stats HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'
+    full, resumed, reused = [], [], 0
+    for _ in range(count):
+        session = None
+        for times in (full, resumed):
+            sock = socket.create_connection(('127.0.0.1', port))
+            start = time.perf_counter()
+            tls = context.wrap_socket(sock, server_hostname='127.0.0.1', session=session)
+            times.append((time.perf_counter() - start) * 1000)
+            tls.sendall(request)
+            while tls.recv(65536):   # TLS 1.3 tickets arrive after the handshake
+                pass
+            if session is None:
+                session = tls.session
+            else:
+                reused += tls.session_reused
+            tls.close()
+    return float(np.median(full)), float(np.median(resumed)), reused / count * 100
+
+async def bench_tls(args):
+    """Forwarding latency and server CPU: plain, TLS in the server, TLS in a proxy"""
+    frame_b64 = synthetic_frame(int(22050 * args.frame_ms / 1000))
+    rows = []
+    for mode in args.mode:
+        certs = tempfile.TemporaryDirectory(prefix='audio_bench_tls_')
+        cert, key = make_certificate(certs.name)
+        extra = ['--tls-tickets', str(args.tickets)]
+        proxy = None
+        server = BenchServer(args.calls, extra, tls=mode != 'plain')
+        if mode == 'tls':
+            server.extra_args += ['--cert', cert, '--key', key]
+        elif mode == 'tls-offload':
+            unix_path = str(Path(server.workdir.name) / 'server.sock')
+            server.extra_args += ['--unix', unix_path, '--proxy-protocol']
+            proxy = multiprocessing.get_context('spawn').Process(
+                target=run_tls_proxy, args=(server.port, unix_path, cert, key), daemon=True)
+            proxy.start()
+
+        async with server:
+            context = client_tls_context() if server.tls else None
+            calls = [await connect_call(server.url, bench_uuid(i), 'listen', ssl=context)
+                     for i in range(args.calls)]
+            latencies = []
+            collectors = [asyncio.create_task(collect_latency(viewer, latencies)) for _, viewer in calls]
+            before = await server.stats()
+            await asyncio.gather(*(send_paced(client, bench_uuid(i), frame_b64, args.frame_ms, 1, args.seconds)
+                                   for i, (client, _) in enumerate(calls)))
+            after = await server.stats()
+            await asyncio.sleep(0.5)
+
+            sent = after['frames_in'] - before['frames_in']
+            row = latency_summary(mode, latencies, sent)
+            cpu = after['cpu_seconds'] - before['cpu_seconds']
+            row['server_cpu_percent'] = round(cpu / args.seconds * 100, 1)
+            row['cpu_us_per_frame'] = round(cpu / sent * 1e6, 1) if sent else None
+            if server.tls:
+                full, resumed, reused = await asyncio.get_running_loop().run_in_executor(
+                    None, handshake_times, server.port, args.handshakes)
+                row.update(handshake_ms=round(full, 2), resumed_ms=round(resumed, 2),
+                           resumed_percent=round(reused))
+            else:
+                row.update(handshake_ms='-', resumed_ms='-', resumed_percent='-')
+            rows.append(row)
+
+            for task in collectors:
+                task.cancel()
+            for client, viewer in calls:
+                await client.close()
+                await viewer.close()
+        if proxy:
+            proxy.terminate()
+            proxy.join()
+        certs.cleanup()
+    return rows
+
+# ---------------------------------------------------------------- flood
+
+async def idle_socket(url, sockets):
+    """Open a WebSocket and never identify - the server should close it"""
+    try:
+        ws = await websockets.connect(url, max_size=None)
+        sockets.append(ws)
+        await ws.wait_closed()
+    except (websockets.exceptions.WebSocketException, OSError):
+        pass   # refused at the connection cap
+
+async def flood_socket(url, uuid, frame_b64, stop, counter):
+    """Connect as a client and send frames as fast as the socket takes them"""
+    message = json.dumps({'type': 'client_system_audio', 'uuid': uuid, 'audio': frame_b64,
+                          'rate': 22050, 'timestamp': 0})
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({'type': 'audio_client_connect', 'uuid': uuid}))
+            while not stop.is_set():
+                await ws.send(message)
+                counter[0] += 1
+                await asyncio.sleep(0)   # send() may not yield while the buffer has room
+    except (websockets.exceptions.WebSocketException, OSError):
+        pass
+
+async def bench_flood(args):
+    """Legitimate call latency and event loop lag while idle sockets and floods hit the server"""
+    frame_b64 = synthetic_frame(int(22050 * args.frame_ms / 1000))
+    flood_frame = synthetic_frame(4096)
+    limits = {
+        'unlimited': ['--max-connections', '1000000', '--handshake-timeout', '1e9',
+                      '--message-rate', '1e9', '--byte-rate', '1e12'],
+        'limited': ['--max-connections', str(args.max_connections), '--handshake-timeout', str(args.handshake_timeout)]
+    }
+    rows = []
+    for mode in args.mode:
+        async with BenchServer(args.calls + args.flooders, limits[mode]) as server:
+            calls = [await connect_call(server.url, bench_uuid(i), 'listen') for i in range(args.calls)]
+            latencies = []
+            collectors = [asyncio.create_task(collect_latency(viewer, latencies)) for _, viewer in calls]
+
+            stop = asyncio.Event()
+            sockets = []
+            flooded = [0]
+            attack = [asyncio.create_task(flood_socket(server.url, bench_uuid(args.calls + i), flood_frame, stop, flooded))
+                      for i in range(args.flooders)]
+            await asyncio.sleep(0.2)   # flooders get in before the idle sockets fill the cap
+            attack += [asyncio.create_task(idle_socket(server.url, sockets)) for _ in range(args.idle)]
+            await asyncio.gather(*(send_paced(client, bench_uuid(i), frame_b64, args.frame_ms, 1, args.seconds)
+                                   for i, (client, _) in enumerate(calls)))
+            stats = await server.stats()
+            stop.set()
+            for task in attack + collectors:
+                task.cancel()
+            await asyncio.gather(*attack, return_exceptions=True)
+
+            sent = int(args.seconds * 1000 / args.frame_ms) * args.calls
+            row = {'mode': mode, **latency_summary(mode, latencies, sent)}
+            del row['transport']
+            admission = stats['admission']
+            row.update(loop_lag_p99_ms=stats['event_loop']['lag_p99_ms'],
+                       loop_lag_max_ms=stats['event_loop']['lag_max_ms'],
+                       flood_messages=flooded[0],
+                       idle_open=sum(not ws.close_code for ws in sockets),
+                       refused=admission['rejected_capacity'] + admission['rejected_ip'],
+                       handshake_timeouts=admission['handshake_timeouts'],
+                       rate_limited=admission['rate_limited'],
+                       rate_limit_closes=admission['rate_limit_closes'])
+            rows.append(row)
+            for ws in sockets:
+                await ws.close()
+            for client, viewer in calls:
+                await client.close()
+                await viewer.close()
+    return rows
+
+# ---------------------------------------------------------------- restart
+
+async def restarting_client(url, uuid, frame_b64, frame_ms, connected, stop, stats):
+    """Stream mic frames, reconnecting with the resume token whenever the server drops us"""
+    token = None
+    interval = frame_ms / 1000
+    while not stop.is_set():
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                await ws.send(json.dumps({'type': 'audio_client_connect', 'uuid': uuid,
+                                          'resume_token': token}))
+                reply = json.loads(await ws.recv())
+                token = reply.get('resume_token')
+                stats['resumed'] += bool(reply.get('resumed'))
+                connected.set()
+                while not stop.is_set():
+                    await ws.send(json.dumps({'type': 'client_microphone_audio', 'uuid': uuid,
+                                              'audio': frame_b64, 'rate': 22050, 'timestamp': time.time()}))
+                    stats['sent'] += 1
+                    await asyncio.sleep(interval)
+        except (websockets.exceptions.ConnectionClosed, OSError):
+            stats['reconnects'] += 1
+            await asyncio.sleep(0.01)
+
+async def restarting_viewer(url, uuid, stop, arrivals):
+    """Receive a call's frames (recording arrival times), reconnecting like view.html"""
+    mode_set = False
+    while not stop.is_set():
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                await ws.send(json.dumps({'type': 'audio_viewer_connect', 'uuid': uuid}))
+                await ws.recv()
+                if not mode_set:
+                    await ws.send(json.dumps({'type': 'call_mode_change', 'uuid': uuid, 'mode': 'both'}))
+                    mode_set = True
+                async for message in ws:
+                    if json.loads(message).get('type') == 'client_microphone_audio':
+                        arrivals.append(time.time())
+        except (websockets.exceptions.ConnectionClosed, OSError):
+            await asyncio.sleep(0.01)
+
+def gap_summary(phase, arrivals, start, end, sent, resumed, pid):
+    """Longest silence each call had at its viewer within a time window"""
+    gaps = []
+    received = 0
+    for times in arrivals:
+        window = [start] + [t for t in times if start <= t < end] + [end]
+        received += len(window) - 2
+        gaps.append(max(np.diff(window)) * 1000)
+    return {
+        'phase': phase,
+        'calls': len(arrivals),
+        'frames_sent': sent,
+        'frames_received': received,
+        'gap_p50_ms': round(float(np.percentile(gaps, 50)), 1),
+        'gap_max_ms': round(max(gaps), 1),
+        'resumed_calls': resumed,
+        'server_pid': pid
+    }
+
+async def bench_restart(args):
+    """Interruption per call while the server restarts gracefully under load"""
+    stop = asyncio.Event()
+    stats = {'sent': 0, 'resumed': 0, 'reconnects': 0}
+    arrivals = [[] for _ in range(args.calls)]
+    frame_b64 = synthetic_frame(int(22050 * args.frame_ms / 1000))
+    new_pid = None
+
+    async with BenchServer(args.calls) as server:
+        tasks = []
+        for i in range(args.calls):
+            connected = asyncio.Event()
+            tasks.append(asyncio.create_task(restarting_client(
+                server.url, bench_uuid(i), frame_b64, args.frame_ms, connected, stop, stats)))
+            await connected.wait()
+            tasks.append(asyncio.create_task(restarting_viewer(server.url, bench_uuid(i), stop, arrivals[i])))
+        try:
+            await asyncio.sleep(1)   # calls up and in 'both' mode
+            old_pid = (await server.stats())['pid']
+            start = time.time()
+            sent_at_start = stats['sent']
+            await asyncio.sleep(args.seconds)
+            sent_before = stats['sent']
+
+            restart_at = time.time()
+            server.process.send_signal(signal.SIGHUP)
+            await asyncio.get_running_loop().run_in_executor(None, server.process.wait, 30)
+            handover_s = time.time() - restart_at
+            await asyncio.sleep(args.seconds)
+            new_pid = (await server.stats())['pid']
+            stop.set()
+            end = time.time()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if new_pid and new_pid != server.process.pid:
+                os.kill(new_pid, signal.SIGTERM)
+
+    rows = [gap_summary('steady', arrivals, start, restart_at, sent_before - sent_at_start, 0, old_pid),
+            gap_summary('restart', arrivals, restart_at, end, stats['sent'] - sent_before,
+                        stats['resumed'], new_pid)]
+    rows[1]['phase'] = f"restart ({handover_s:.2f}s handover)"
+    return rows
+
+# ---------------------------------------------------------------- transcode
+
+def bench_transcode(args):
+    """Frame cost, delivery latency and event loop lag: inline vs worker pools"""
+    from server import EventLoopMonitor, TranscodePool
+
+    rate = 22050
+    samples = int(rate * args.frame_ms / 1000)
+    t = np.arange(samples * 50) / rate
+    tone = (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+    audio = [b64encode(tone[i * samples:(i + 1) * samples].tobytes()).decode('utf-8') for i in range(50)]
+    caps = ((args.to_codec,), args.to_rate)
+
+    async def run(mode):
+        workers = 0 if mode == 'inline' else args.workers
+        pool = TranscodePool(workers=workers, processes=mode == 'process', batch_size=args.batch)
+        monitor = EventLoopMonitor(interval=0.005, window=100000)
+        pool.start()
+        monitor_task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.5)   # let process workers start before timing
+
+        latencies = []
+        async def deliver(frames, sent):
+            latencies.append((time.perf_counter() - sent) * 1000)
+
+        interval = args.frame_ms / 1000
+        start = time.perf_counter()
+        sent = 0
+        for tick in range(int(args.seconds / interval)):
+            await asyncio.sleep(max(0, start + tick * interval - time.perf_counter()))
+            for session in range(args.sessions):
+                frame = {'type': 'client_microphone_audio', 'audio': audio[tick % 50], 'rate': rate}
+                pool.submit(bench_uuid(session), [frame], caps,
+                            lambda frames, sent=time.perf_counter(): deliver(frames, sent))
+                sent += 1
+        deadline = time.perf_counter() + 5
+        while len(latencies) + pool.stats['queue_drops'] < sent and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+        monitor_task.cancel()
+        stats = pool.get_stats()
+        loop_stats = monitor.get_stats()
+        pool.close()
+        latencies.sort()
+        pick = lambda q: round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 2) if latencies else 0
+        return {
+            'mode': mode,
+            'workers': workers,
+            'frames': sent,
+            'frames_per_s': round(sent / args.seconds),
+            'us_per_frame': stats['us_per_frame'],
+            'avg_batch': stats['avg_batch'],
+            'busy_pct': stats['busy_pct'],
+            'latency_p50_ms': pick(0.5),
+            'latency_p99_ms': pick(0.99),
+            'loop_lag_p99_ms': loop_stats['lag_p99_ms'],
+            'loop_lag_max_ms': loop_stats['lag_max_ms'],
+            'queue_drops': stats['queue_drops']
+        }
+
+    async def run_all():
+        return [await run(mode) for mode in args.mode]
+    return run_all()
+
+# ---------------------------------------------------------------- logindex
+
+def write_synthetic_log(path, sessions, uuids, noise, start=1748500000, seed=0):
+    """Append server-style log lines: call events buried in access lines and tracebacks"""
+    rng = random.Random(seed)
+    stamp = lambda t: time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t)) + f",{int(t * 1000) % 1000:03d}"
+    access = ('{ip} [29/May/2025:14:58:54 +0530] "GET /api/status/{uuid} HTTP/1.1" 200 349 "-" '
+              '"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/136.0.0.0 Safari/537.36"')
+    traceback = ('Traceback (most recent call last):\n'
+                 '  File "server.py", line 212, in serve_view_page\n'
+                 '    content = await f.read()\n'
+                 "UnicodeDecodeError: 'charmap' codec can't decode byte 0x8f\n")
+    t = start
+    with open(path, 'a') as f:
+        for i in range(sessions):
+            uuid = bench_uuid(rng.randrange(uuids))
+            ip = f"10.0.{rng.randrange(4)}.{rng.randrange(1, 255)}"
+            events = [f"AUDIO CLIENT CONNECT - UUID: {uuid}, IP: {ip}",
+                      f"CALL MODE CHANGE - UUID: {uuid}, Mode: {rng.choice(['listen', 'talk', 'both'])}",
+                      f"AUDIO STATS - UUID: {uuid}, System: {rng.randrange(10000)}, Mic: {rng.randrange(10000)}",
+                      f"AUDIO CLIENT DISCONNECT - UUID: {uuid}, IP: {ip}"]
+            for event in events:
+                for _ in range(noise):
+                    t += rng.random()
+                    f.write(f"{stamp(t)} - INFO - {access.format(ip=ip, uuid=uuid)}\n")
+                if rng.random() < 0.05:
+                    f.write(f"{stamp(t)} - ERROR - Error handling request from {ip}\n{traceback}")
+                t += rng.random() * 60
+                f.write(f"{stamp(t)} - INFO - {event}\n")
+    return t
+
+def grep_sessions(path, uuid):
+    """The manual way: scan the whole log for one UUID's connects and disconnects"""
+    pattern = re.compile(rf"^(\S+ \S+) - INFO - AUDIO CLIENT (CONNECT|DISCONNECT) - UUID: {uuid}, IP: (\S+)", re.M)
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return len(pattern.findall(f.read()))
+
+def bench_logindex(args):
+    """Log index build, incremental update and query times vs scanning the log"""
+    from log_index import LogIndex
+
+    rows = []
+    def timed(step, fn, repeat=1):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        rows.append({'step': step, 'log_mb': round(os.path.getsize(log) / 1e6, 1),
+                     'ms': round(sorted(times)[len(times) // 2] * 1000, 2)})
+        return result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, 'audio_call_log.txt')
+        end = write_synthetic_log(log, args.sessions, args.uuids, args.noise)
+        index = LogIndex(os.path.join(tmp, 'log_index.db'))
+        uuid, ip = bench_uuid(1), '10.0.1.1'
+
+        timed('grep whole log for one UUID', lambda: grep_sessions(log, uuid), repeat=3)
+        timed('index from scratch', lambda: index.update(log))
+        timed('update, nothing new', lambda: index.update(log), repeat=5)
+        write_synthetic_log(log, max(1, args.sessions // 100), args.uuids, args.noise, start=end, seed=1)
+        timed('update after 1% more sessions', lambda: index.update(log))
+        timed('query: sessions of one UUID', lambda: index.uuid_sessions(uuid), repeat=20)
+        timed('query: UUIDs from one IP', lambda: index.grouped("ip = :ip", ip=ip), repeat=20)
+        timed('query: connected time, all UUIDs', lambda: index.grouped("1"), repeat=20)
+        index.close()
+    return rows
+
+# ---------------------------------------------------------------- replay
+
+REPLAY_AUDIO_TYPES = ('client_system_audio', 'client_microphone_audio', 'client_combined_audio', 'viewer_audio')
+
+REPLAY_HANDSHAKE_LEAD = 0.1  # traced opens are stamped after the handshake; start that much earlier
+
+def replay_messages(records, payloads, filler):
+    """Connection number -> [(time, message dict or None, after, done)] from a trace
+
+    Traces without payloads get a message of the recorded type and size;
+    audio removed by redaction comes back as a tone of the same length.
+    Call numbers map onto bench UUIDs. after/done are events that keep the
+    messages of one call in trace order across its connections: a message
+    waits for the call's previous one, so handshake jitter or a high speed
+    cannot, say, move a client's connect after its viewer's mode change.
+    """
+    def refill(data):
+        if isinstance(data.get('audio'), int):
+            data['audio'] = filler[:data['audio']]
+        for frame in data.get('frames') or ():
+            if isinstance(frame, dict):
+                refill(frame)
+        return data
+
+    connections = {}
+    last_of_call = {}
+    call_of_connection = {}
+    for r in records:
+        if r['event'] == traffic_trace.OPEN:
+            connections[r['connection']] = [(r['time'], None, None, None)]
+        elif r['connection'] not in connections:
+            continue   # opened before the trace started
+        elif r['event'] == traffic_trace.CLOSE:
+            # A reconnect must not overtake the close of the socket it replaces
+            call = call_of_connection.get(r['connection'])
+            after, done = last_of_call.get(call), asyncio.Event()
+            if call:
+                last_of_call[call] = done
+            connections[r['connection']].append((r['time'], None, after, done))
+        elif r['event'] == traffic_trace.MESSAGE:
+            if payloads == 'none':
+                data = {'type': r['type']}
+                if r['type'] in REPLAY_AUDIO_TYPES or r['type'] == 'audio_batch':
+                    audio = {'audio': filler[:max(8, (r['size'] - 120) // 8 * 8)], 'rate': 22050}
+                    data.update({'frames': [audio]} if r['type'] == 'audio_batch' else audio)
+                elif r['type'] == 'call_mode_change':
+                    data['mode'] = 'both'
+            else:
+                data = refill(json.loads(r['payload']))
+                data.pop('resume_token', None)
+            after, done = None, asyncio.Event()
+            if r['call']:
+                data['uuid'] = bench_uuid(r['call'] - 1)
+                after = last_of_call.get(r['call'])
+                last_of_call[r['call']] = done
+                call_of_connection[r['connection']] = r['call']
+            connections[r['connection']].append((r['time'], data, after, done))
+    return connections
+
+async def collect_frame_latency(ws, latencies):
+    """One-way latency of every timestamped audio frame a replayed peer receives"""
+    try:
+        async for message in ws:
+            data = json.loads(message)
+            frames = data.get('frames') if data.get('type') == 'audio_batch' else [data]
+            now = time.time()
+            for frame in frames or ():
+                if 'timestamp' in frame and frame.get('type') in REPLAY_AUDIO_TYPES:
+                    latencies.append((now - frame['timestamp']) * 1000)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def replay_connection(url, events, speed, start, result):
+    """Open, send and close one traced connection on the trace's schedule"""
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(max(0, start + events[0][0] / speed - REPLAY_HANDSHAKE_LEAD - loop.time()))
+    try:
+        ws = await websockets.connect(url, max_size=None)
+    except (OSError, websockets.exceptions.InvalidStatus):
+        result['refused'] += 1
+        for _, _, _, done in events:
+            if done:
+                done.set()   # later messages of the call go ahead without these
+        return
+    receiver = asyncio.create_task(collect_frame_latency(ws, result['latencies']))
+    try:
+        for t, data, after, done in events[1:]:
+            delay = start + t / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if after:
+                await after.wait()
+            if data is None:
+                await ws.close()
+                break
+            result['send_lag'].append(max(0, loop.time() - (start + t / speed)) * 1000)
+            now = time.time()
+            if data.get('type') in REPLAY_AUDIO_TYPES:
+                data['timestamp'] = now
+            for frame in data.get('frames') or ():
+                if isinstance(frame, dict):
+                    frame['timestamp'] = now
+            await ws.send(json.dumps(data))
+            result['sent'] += 1
+            done.set()
+    except websockets.exceptions.ConnectionClosed:
+        result['closed_by_server'] += 1
+    finally:
+        for _, _, _, done in events:
+            if done:
+                done.set()
+        await ws.close()
+        receiver.cancel()
+
+async def bench_replay(args):
+    """Forwarding latency and server CPU while replaying a recorded trace"""
+    header, records = traffic_trace.read_trace(args.trace)
+    if args.seconds:
+        records = [r for r in records if r['time'] < args.seconds]
+    longest = max((r['size'] for r in records if r['event'] == traffic_trace.MESSAGE), default=0)
+    filler = synthetic_frame(longest)   # base64 grows 4/3 per sample byte, so this covers any frame
+    calls = max((r['call'] for r in records), default=0)
+    duration = records[-1]['time'] - records[0]['time'] if records else 0
+
+    rows = []
+    for speed in args.speed:
+        connections = replay_messages(records, header['payloads'], filler)
+        # The trace's own pacing is the point - lift the per-connection limits too
+        extra = ['--message-rate', '1e9', '--byte-rate', '1e12']
+        async with BenchServer(calls, extra) as server:
+            result = {'latencies': [], 'send_lag': [], 'sent': 0, 'refused': 0, 'closed_by_server': 0}
+            before = await server.stats()
+            loop = asyncio.get_running_loop()
+            start = loop.time() + 0.5 - records[0]['time'] / speed
+            await asyncio.gather(*(replay_connection(server.url, events, speed, start, result)
+                                   for events in connections.values()))
+            await asyncio.sleep(0.2)
+            after = await server.stats()
+
+        row = latency_summary(f"{speed:g}x", result['latencies'], after['frames_in'] - before['frames_in'])
+        cpu = after['cpu_seconds'] - before['cpu_seconds']
+        messages = after['messages_in'] - before['messages_in']
+        lag = np.array(result['send_lag'] or [0])
+        row.update({
+            'trace_seconds': round(duration, 1),
+            'connections': len(connections),
+            'messages': result['sent'],
+            'server_cpu_percent': round(cpu / max(duration / speed, 1e-9) * 100, 1),
+            'cpu_us_per_message': round(cpu / messages * 1e6, 1) if messages else None,
+            'send_lag_p99_ms': round(float(np.percentile(lag, 99)), 1),
+            'refused': result['refused'],
+            'closed_by_server': result['closed_by_server']
+        })
+        rows.append(row)
+    return rows
+
+# ---------------------------------------------------------------- codec / control
+
+def control_samples():
+    """Representative control messages (as sent) and a status response (to encode)"""
+    uuid = bench_uuid(0)
+    messages = {
+        'audio_client_connect': {'type': 'audio_client_connect', 'uuid': uuid, 'client_type': 'audio_only',
+                                 'resume_token': None, 'codecs': ['pcm16', 'mulaw']},
+        'call_mode_change': {'type': 'call_mode_change', 'uuid': uuid, 'mode': 'both'},
+        'ping_request': {'type': 'ping_request', 'uuid': uuid, 'timestamp': 1729270000000},
+        'quality_report': {'type': 'quality_report', 'uuid': uuid,
+                           'report': {'loss': 0.01, 'rtt_ms': 21.5, 'jitter_ms': 3.2, 'bitrate': 64000,
+                                      'egress': {'queued': 0, 'sent': 1200}, 'level': 'high'}},
+    }
+    status = AudioCallManager().get_connection_status(uuid)
+    return {name: json.dumps(m) for name, m in messages.items()}, status
+
+def bench_codec(args):
+    """Decode+validate and encode cost per control message for each codec"""
+    from message_codec import available_codecs, create_message_codec
+
+    messages, status = control_samples()
+    rows = []
+    for name in available_codecs():
+        codec = create_message_codec(name)
+        for label, fn, arg in [(m, codec.decode, text) for m, text in messages.items()] + \
+                              [('status response', codec.encode, status)]:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                fn(arg)
+            us = (time.perf_counter() - start) / args.iterations * 1e6
+            rows.append({
+                'codec': name,
+                'message': label,
+                'op': 'encode' if fn == codec.encode else 'decode+validate',
+                'us_per_message': round(us, 2),
+                'messages_per_s': round(1e6 / us)
+            })
+    return rows
+
+async def ping_loop(viewer, uuid, stop, rtts):
+    """Viewer side: one ping at a time, timing each round trip through the client"""
+    try:
+        while not stop.is_set():
+            sent = time.perf_counter()
+            await viewer.send(json.dumps({'type': 'ping_request', 'uuid': uuid, 'timestamp': sent}))
+            while json.loads(await viewer.recv()).get('type') != 'ping_response':
+                pass
+            rtts.append((time.perf_counter() - sent) * 1000)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def pong_loop(client, uuid):
+    """Client side: answer every ping the way client.py does"""
+    try:
+        async for message in client:
+            data = json.loads(message)
+            if data.get('type') == 'ping_request':
+                await client.send(json.dumps({'type': 'ping_response', 'uuid': uuid,
+                                              'timestamp': data.get('timestamp')}))
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def poll_status(port, uuid, stop, latencies):
+    """Dashboard side: poll /api/status/{uuid} back to back"""
+    async with aiohttp.ClientSession() as session:
+        while not stop.is_set():
+            start = time.perf_counter()
+            async with session.get(f"http://127.0.0.1:{port}/api/status/{uuid}") as resp:
+                await resp.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+def control_load(url, port, first, calls, pollers, start_at, seconds):
+    """One load process: pings on its calls and status polls from start_at for seconds"""
+    async def run():
+        pairs = [await connect_call(url, bench_uuid(i), 'off') for i in range(first, first + calls)]
+        pongs = [asyncio.create_task(pong_loop(client, bench_uuid(first + i))) for i, (client, _) in enumerate(pairs)]
+        await asyncio.sleep(max(0, start_at - time.time()))
+        stop = asyncio.Event()
+        rtts, polls = [], []
+        workers = [asyncio.create_task(ping_loop(viewer, bench_uuid(first + i), stop, rtts))
+                   for i, (_, viewer) in enumerate(pairs)]
+        workers += [asyncio.create_task(poll_status(port, bench_uuid(first), stop, polls)) for _ in range(pollers)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*workers)
+        for task in pongs:
+            task.cancel()
+        for client, viewer in pairs:
+            await client.close()
+            await viewer.close()
+        return rtts, polls
+    return asyncio.run(run())
+
+async def bench_control(args):
+    """Control-plane messages/s and latency through the server per event loop and codec
+
+    The load comes from several processes so that the server, not the
+    bench, is what runs out of CPU.
+    """
+    from message_codec import available_codecs
+    import importlib.util
+
+    loops = ['asyncio'] + (['uvloop'] if importlib.util.find_spec('uvloop') else [])
+    rows = []
+    with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+        for loop_name in loops:
+            for codec in available_codecs():
+                async with BenchServer(args.calls * args.processes, ['--loop', loop_name, '--codec', codec]) as server:
+                    start_at = time.time() + 3   # spawned processes import and connect first
+                    load = asyncio.get_running_loop().run_in_executor(None, pool.starmap, control_load, [
+                        (server.url, server.port, i * args.calls, args.calls, args.pollers, start_at, args.seconds)
+                        for i in range(args.processes)])
+                    await asyncio.sleep(start_at - time.time())
+                    before = await server.stats()
+                    await asyncio.sleep(args.seconds)
+                    after = await server.stats()
+                    results = await load
+
+                rtts = np.array([x for r, _ in results for x in r] or [0])
+                polls = np.array([x for _, p in results for x in p] or [0])
+                messages = after['messages_in'] - before['messages_in']
+                cpu = after['cpu_seconds'] - before['cpu_seconds']
+                rows.append({
+                    'loop': after['runtime']['loop'],
+                    'codec': after['runtime']['codec'],
+                    'control_msgs_per_s': round(messages / args.seconds),
+                    'ping_rtt_p50_ms': round(float(np.percentile(rtts, 50)), 2),
+                    'ping_rtt_p99_ms': round(float(np.percentile(rtts, 99)), 2),
+                    'status_polls_per_s': round(len(polls) / args.seconds),
+                    'status_p99_ms': round(float(np.percentile(polls, 99)), 2),
+                    'server_cpu_percent': round(cpu / args.seconds * 100, 1),
+                    'cpu_us_per_request': round(cpu / (messages + len(polls)) * 1e6, 1) if messages else None
+                })
+    return rows
+
+# ---------------------------------------------------------------- wall
+
+async def drain_monitor(ws, counter):
+    """Count messages and bytes arriving at a monitoring viewer or wall"""
+    try:
+        async for message in ws:
+            counter['messages'] += 1
+            counter['bytes'] += len(message)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def connect_wall(url, uuids, listen, premix):
+    """One wall watching every client, listening to the first few, calls set to listen"""
+    clients = []
+    for uuid in uuids:
+        client = await websockets.connect(url, max_size=None)
+        await client.send(json.dumps({'type': 'audio_client_connect', 'uuid': uuid}))
+        await client.recv()
+        clients.append(client)
+
+    wall = await websockets.connect(url, max_size=None)
+    await wall.send(json.dumps({'type': 'wall_connect', 'uuids': uuids, 'selected': uuids[:listen],
+                                'premix': premix}))
+    await wall.recv()
+    for client, uuid in zip(clients, uuids):
+        await wall.send(json.dumps({'type': 'call_mode_change', 'uuid': uuid, 'mode': 'listen'}))
+        await client.recv()  # forwarded call_mode_change
+    return clients, [wall]
+
+async def bench_wall(args):
+    """Server CPU and monitoring traffic: a viewer per client vs one wall"""
+    frame_b64 = synthetic_frame(int(22050 * args.frame_ms / 1000))
+    uuids = [bench_uuid(i) for i in range(args.clients)]
+    rows = []
+    for label in ('viewer per client', 'wall', 'wall + premix'):
+        async with BenchServer(args.clients) as server:
+            if label == 'viewer per client':
+                calls = [await connect_call(server.url, uuid, 'listen') for uuid in uuids]
+                clients, monitors = [c for c, _ in calls], [v for _, v in calls]
+            else:
+                clients, monitors = await connect_wall(server.url, uuids, args.listen, label == 'wall + premix')
+            counter = {'messages': 0, 'bytes': 0}
+            drains = [asyncio.create_task(drain_monitor(m, counter)) for m in monitors]
+
+            before = await server.stats()
+            await asyncio.gather(*(send_paced(c, uuid, frame_b64, args.frame_ms, 1, args.seconds)
+                                   for c, uuid in zip(clients, uuids)))
+            await asyncio.sleep(0.5)
+            after = await server.stats()
+
+            for task in drains:
+                task.cancel()
+            for ws in clients + monitors:
+                await ws.close()
+
+        cpu = after['cpu_seconds'] - before['cpu_seconds']
+        rows.append({
+            'monitor': label,
+            'clients': args.clients,
+            'listened': args.clients if label == 'viewer per client' else min(args.listen, args.clients),
+            'sockets': len(monitors),
+            'messages_per_s': round(counter['messages'] / args.seconds, 1),
+            'kbytes_per_s': round(counter['bytes'] / args.seconds / 1024, 1),
+            'server_cpu_percent': round(cpu / args.seconds * 100, 1)
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Audio Call Server Benchmarks')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('coalesce', help='Message coalescing vs one message per frame')
+    p.add_argument('--clients', type=int, default=4)
+    p.add_argument('--seconds', type=float, default=10)
+    p.add_argument('--frame-ms', type=float, default=10)
+    p.add_argument('--batch', type=int, default=4)
+    p.set_defaults(func=bench_coalesce)
+
+    p = sub.add_parser('transport', help='Latency tails over WebSocket vs UDP with packet loss')
+    p.add_argument('--seconds', type=float, default=10)
+    p.add_argument('--frame-ms', type=float, default=20)
+    p.add_argument('--loss', type=float, default=0.02, help='Fraction of client packets lost')
+    p.add_argument('--rto-ms', type=float, default=200, help='TCP retransmission stall per loss')
+    p.set_defaults(func=bench_transport)
+
+    p = sub.add_parser('sessions', help='Call state memory and routing lookups at many sessions')
+    p.add_argument('--sessions', type=int, default=10000)
+    p.add_argument('--frames', type=int, default=1000000)
+    p.set_defaults(func=bench_sessions)
+
+    p = sub.add_parser('watchers', help='Status polling vs the push feed as dashboards are added')
+    p.add_argument('--clients', type=int, default=50)
+    p.add_argument('--watchers', type=int, nargs='+', default=[1, 10, 50])
+    p.add_argument('--seconds', type=float, default=10)
+    p.add_argument('--poll-interval', type=float, default=1, help='Seconds between polling sweeps')
+    p.set_defaults(func=bench_watchers)
+
+    p = sub.add_parser('aec', help='Echo canceller ERLE and CPU on synthetic or recorded echo')
+    p.add_argument('--backend', nargs='+', choices=sorted(ECHO_CANCELLERS), default=['fdaf', 'nlms'])
+    p.add_argument('--seconds', type=float, default=12)
+    p.add_argument('--rate', type=int, default=22050)
+    p.add_argument('--frame', type=int, default=2048, help='Samples per captured frame')
+    p.add_argument('--warmup', type=float, default=2, help='Seconds of convergence left out of ERLE')
+    p.add_argument('--far', help='WAV of what the speaker played (e.g. a recorded viewer_mic track)')
+    p.add_argument('--near', help='WAV captured at the same time (e.g. the client_mic track)')
+    p.set_defaults(func=bench_aec)
+
+    p = sub.add_parser('denoise', help='Noise suppressor noise reduction, speech SNR and CPU per chunk')
+    p.add_argument('--backend', nargs='+', choices=sorted(NOISE_SUPPRESSORS), default=['wiener', 'subtract'])
+    p.add_argument('--noise', nargs='+', choices=['fan', 'hvac'], default=['fan', 'hvac'])
+    p.add_argument('--noise-dbfs', type=float, default=-40, help='Background noise RMS level')
+    p.add_argument('--seconds', type=float, default=12)
+    p.add_argument('--rate', type=int, default=22050)
+    p.add_argument('--chunk', type=int, nargs='+', default=[1024, 2048, 4096], help='Samples per captured frame')
+    p.add_argument('--warmup', type=float, default=2, help='Seconds of noise tracking left out of the scores')
+    p.add_argument('--gate', type=int, default=300, help="Peak level of the client's mic voice gate")
+    p.add_argument('--margin-db', type=float, default=6,
+                   help='Level over the noise estimate the gate also needs (client --denoise-gate-db)')
+    p.set_defaults(func=bench_denoise)
+
+    p = sub.add_parser('playout', help='Viewer audio latency recovery after a stall: WSOLA vs dropping')
+    p.add_argument('--policy', nargs='+', choices=sorted(PLAYOUT_POLICIES), default=['drop', 'wsola'])
+    p.add_argument('--seconds', type=float, default=15)
+    p.add_argument('--rate', type=int, default=22050)
+    p.add_argument('--chunk', type=int, default=2048, help='Samples per speaker write')
+    p.add_argument('--packet', type=int, default=1024, help='Samples per viewer audio message')
+    p.add_argument('--target-ms', type=int, default=150)
+    p.add_argument('--max-speed', type=float, default=1.1, help='Fastest WSOLA playback')
+    p.add_argument('--stall-at', type=float, default=3, help='Seconds in when the network stalls')
+    p.add_argument('--stall-ms', type=float, default=1000, help='How long delivery stops')
+    p.add_argument('--jitter-ms', type=float, default=20)
+    p.add_argument('--f0', type=float, default=140, help='Pitch of the synthetic voice')
+    p.set_defaults(func=bench_playout)
+
+    p = sub.add_parser('profiler', help='Overhead of the client stage profiler')
+    p.add_argument('--calls', type=int, default=1000000, help='lap() calls to time')
+    p.add_argument('--frames', type=int, default=20000, help='Simulated frames per run')
+    p.add_argument('--chunk', type=int, default=2048, help='Samples per frame')
+    p.add_argument('--budget-percent', type=float, default=0.1,
+                   help='Allowed overhead as a share of real time (one core)')
+    p.set_defaults(func=bench_profiler)
+
+    p = sub.add_parser('tls', help='Forwarding latency with TLS in the server vs in a proxy')
+    p.add_argument('--mode', nargs='+', choices=['plain', 'tls', 'tls-offload'],
+                   default=['plain', 'tls', 'tls-offload'])
+    p.add_argument('--calls', type=int, default=20)
+    p.add_argument('--seconds', type=float, default=10)
+    p.add_argument('--frame-ms', type=float, default=20)
+    p.add_argument('--tickets', type=int, default=2, help='Server --tls-tickets')
+    p.add_argument('--handshakes', type=int, default=50, help='Full/resumed handshake pairs to time')
+    p.set_defaults(func=bench_tls)
+
+    p = sub.add_parser('flood', help='Call latency and loop lag under idle-socket and message floods')
+    p.add_argument('--mode', nargs='+', choices=['unlimited', 'limited'], default=['unlimited', 'limited'])
+    p.add_argument('--calls', type=int, default=10)
+    p.add_argument('--idle', type=int, default=300, help='Sockets that never send a connect message')
+    p.add_argument('--flooders', type=int, default=5, help='Clients sending as fast as they can')
+    p.add_argument('--seconds', type=float, default=8)
+    p.add_argument('--frame-ms', type=float, default=20)
+    p.add_argument('--max-connections', type=int, default=200, help='Server cap in limited mode')
+    p.add_argument('--handshake-timeout', type=float, default=2, help='Server deadline in limited mode')
+    p.set_defaults(func=bench_flood)
+
+    p = sub.add_parser('restart', help='Per-call interruption during a graceful server restart under load')
+    p.add_argument('--calls', type=int, default=20)
+    p.add_argument('--seconds', type=float, default=3, help='Streaming before and after the restart')
+    p.add_argument('--frame-ms', type=float, default=20)
+    p.set_defaults(func=bench_restart)
+
+    p = sub.add_parser('transcode', help='Server codec/rate conversion inline vs in thread or process pools')
+    p.add_argument('--mode', nargs='+', choices=['inline', 'thread', 'process'],
+                   default=['inline', 'thread', 'process'])
+    p.add_argument('--workers', type=int, default=2)
+    p.add_argument('--batch', type=int, default=16, help='Most frames per worker call')
+    p.add_argument('--sessions', type=int, default=50, help='Streams converted at once')
+    p.add_argument('--seconds', type=float, default=5)
+    p.add_argument('--frame-ms', type=float, default=20)
+    p.add_argument('--to-codec', choices=['pcm16', 'mulaw'], default='mulaw')
+    p.add_argument('--to-rate', type=int, default=8000)
+    p.set_defaults(func=bench_transcode)
+
+    p = sub.add_parser('logindex', help='Call log index build, incremental update and query times')
+    p.add_argument('--sessions', type=int, default=50000, help='Calls written to the synthetic log')
+    p.add_argument('--uuids', type=int, default=500)
+    p.add_argument('--noise', type=int, default=5, help='Access log lines before each call event')
+    p.set_defaults(func=bench_logindex)
+
+    p = sub.add_parser('replay', help='Latency and server CPU replaying a trace from server.py --trace')
+    p.add_argument('trace', help='Trace file written by server.py --trace')
+    p.add_argument('--speed', type=float, nargs='+', default=[1], help='Replay speed factors, e.g. 1 4 16')
+    p.add_argument('--seconds', type=float, help='Replay only the first part of the trace')
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser('codec', help='Control message decode/validate and encode cost per JSON codec')
+    p.add_argument('--iterations', type=int, default=100000)
+    p.set_defaults(func=bench_codec)
+
+    p = sub.add_parser('control', help='Control messages/s and latency through the server per loop and codec')
+    p.add_argument('--calls', type=int, default=10, help='Viewer/client pairs pinging each other, per process')
+    p.add_argument('--pollers', type=int, default=2, help='Concurrent /api/status pollers, per process')
+    p.add_argument('--processes', type=int, default=4, help='Load generating processes')
+    p.add_argument('--seconds', type=float, default=5)
+    p.set_defaults(func=bench_control)
+
+    p = sub.add_parser('wall', help='One monitoring wall vs a viewer per client, with and without premix')
+    p.add_argument('--clients', type=int, default=20)
+    p.add_argument('--listen', type=int, default=1, help='Clients the wall listens to')
+    p.add_argument('--seconds', type=float, default=10)
+    p.add_argument('--frame-ms', type=float, default=93, help='Client frame length (2048 samples at 22050 Hz)')
+    p.set_defaults(func=bench_wall)
+
+    args = parser.parse_args()
+    rows = args.func(args)
+    if asyncio.iscoroutine(rows):
+        rows = asyncio.run(rows)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+if __name__ == "__main__":
+    main()
@@ -7,21 +7,47 @@ Audio-Only Remote Call Client
 - No screen/keyboard/mouse access
 """
 
+import argparse
 import asyncio
 import json
+import random
+import signal
 import ssl
 import subprocess
-import sys
 import time
 import threading
 import queue
 from base64 import b64encode, b64decode
+from collections import deque
 import websockets
 import pyaudio
 import numpy as np
 
+from urllib.parse import urlparse
+import udp_media
+from audio_dsp import (CODECS, ECHO_CANCELLERS, NOISE_SUPPRESSORS, PLAYOUT_POLICIES, create_echo_canceller,
+                       create_noise_suppressor, create_playout, interleave_pcm, mix_pcm, resample_pcm)
+
 class AudioOnlyManager:
-    def __init__(self):
+    # How system audio and mic are captured and sent
+    CAPTURE_LAYOUTS = ('separate', 'stereo', 'mix')
+    
+    # Streams each call mode needs - the rest are paused ('pause'), released
+    # ('close') or left running as before ('keep'), so an idle client does
+    # not keep three devices busy all day
+    MODE_STREAMS = {
+        'off': (),
+        'listen': ('system',),
+        'talk': ('mic', 'speaker'),
+        'both': ('system', 'mic', 'speaker')
+    }
+    IDLE_POLICIES = ('pause', 'close', 'keep')
+    STREAM_ATTRS = {'system': 'system_audio_stream', 'mic': 'mic_stream', 'speaker': 'speaker_stream'}
+    
+    def __init__(self, aec_backend=None, aec_loopback=False, capture_layout='separate',
+                 system_gain=1.0, mic_gain=1.0, playout='wsola', playout_target_ms=150,
+                 profiler=None, idle_streams='pause', switch_target_ms=100, mic_denoise=None,
+                 system_denoise=None, denoise_gate_db=6):
         self.p = pyaudio.PyAudio()
         self.system_audio_stream = None   # For capturing system audio (Zoom, music, etc.)
         self.mic_stream = None           # For capturing client microphone
@@ -29,6 +55,7 @@ class AudioOnlyManager:
         
         self.system_audio_queue = queue.Queue()
         self.mic_audio_queue = queue.Queue()
+        self.combined_audio_queue = queue.Queue()  # stereo or mixed frames of both sources
         self.viewer_audio_queue = queue.Queue()
         self.running = False
         
@@ -37,10 +64,67 @@ class AudioOnlyManager:
         self.channels = 1
         self.rate = 22050  # Higher sample rate for better quality
         self.chunk = 2048  # Larger chunks for smoother audio
+        self.requested_chunk = None  # set by the quality controller, applied by the capture thread
+        
+        # Bounded capture buffer (~1s at 22050 Hz / 2048) - also what is kept
+        # while reconnecting
+        self.max_buffered_frames = 10
+        self.dropped_frames = 0
         
         # Call modes: "off", "listen", "talk", "both"
         self.call_mode = "off"
         
+        # Idle power: devices are looked up (and the mic tested) once at
+        # start-up, then streams are started and paused with the call mode.
+        # The capture thread applies a mode change between reads and sleeps
+        # on wake while no stream is running.
+        self.idle_streams = idle_streams
+        self.device_ids = {}              # stream name -> device index (None = default)
+        self.active_streams = set()
+        self.mode_requested_at = None     # perf_counter of a mode change not applied yet
+        self.wake = threading.Event()
+        self.switch_target_ms = switch_target_ms
+        self.switch_times = deque(maxlen=50)  # ms from set_call_mode to streams ready
+        self.switches = 0
+        self.slow_switches = 0
+        self.wakeups = 0                  # capture thread passes
+        
+        # 'separate' sends each source as its own message; 'stereo' and 'mix'
+        # read both on the same clock and send one frame (system left / mic
+        # right, or mixed to mono with these gains)
+        self.capture_layout = capture_layout
+        self.system_gain = system_gain
+        self.mic_gain = mic_gain
+        
+        # Echo cancellation: what the speaker plays is the reference, removed
+        # from the mic (and optionally the loopback) before it is sent
+        self.mic_echo_canceller = None
+        self.loopback_echo_canceller = None
+        if aec_backend:
+            self.mic_echo_canceller = create_echo_canceller(aec_backend, rate=self.rate)
+            if aec_loopback:
+                self.loopback_echo_canceller = create_echo_canceller(aec_backend, rate=self.rate)
+        
+        # Noise suppression: steady fan / HVAC noise is removed after echo
+        # cancellation. What is left can still peak over the level gate, so a
+        # denoised stream is only sent when it is also denoise_gate_db over
+        # the noise estimate.
+        self.denoise_gate_db = denoise_gate_db
+        self.mic_noise_suppressor = None
+        self.system_noise_suppressor = None
+        if mic_denoise:
+            self.mic_noise_suppressor = create_noise_suppressor(mic_denoise, rate=self.rate)
+        if system_denoise:
+            self.system_noise_suppressor = create_noise_suppressor(system_denoise, rate=self.rate)
+        
+        # Viewer audio waits here for the speaker; a backlog is drained by
+        # time-stretching (or dropping) instead of delaying the rest of the call
+        self.playout = create_playout(playout, rate=self.rate, target_ms=playout_target_ms)
+        self.last_viewer_audio = 0
+        
+        # Stage timings of the capture thread (shared with the client's event loop)
+        self.profiler = profiler or StageProfiler(enabled=False)
+        
     def list_audio_devices(self):
         """Debug function to list all audio devices"""
         print("\n=== AUDIO DEVICES ===")
@@ -169,6 +253,7 @@ class AudioOnlyManager:
                 input_device_index=device_id,
                 frames_per_buffer=self.chunk
             )
+            self.device_ids['system'] = device_id
             print("✓ System audio capture started")
             return True
         except Exception as e:
@@ -216,6 +301,7 @@ class AudioOnlyManager:
                 input_device_index=device_id,
                 frames_per_buffer=self.chunk
             )
+            self.device_ids['mic'] = device_id
             print("✓ Microphone capture started successfully")
             print("🎤 Your voice will be transmitted when call mode allows it")
             return True
@@ -261,6 +347,7 @@ class AudioOnlyManager:
                 output_device_index=device_id,
                 frames_per_buffer=self.chunk
             )
+            self.device_ids['speaker'] = device_id
             print("✓ Speaker output started")
             return True
         except Exception as e:
@@ -270,88 +357,298 @@ class AudioOnlyManager:
     def audio_capture_thread(self):
         """Background thread to capture audio"""
         print("🎵 Audio capture thread started")
+        profiler = self.profiler
         
         while self.running:
             try:
+                self.wakeups += 1
+                if self.mode_requested_at is not None:
+                    self.apply_call_mode()
+                if self.requested_chunk is not None:
+                    # Between reads, so every frame of a pass has the same size
+                    self.chunk, self.requested_chunk = self.requested_chunk, None
+                
+                # Capture both sources as one frame (stereo / mix layouts)
+                if self.capture_layout != 'separate' and self.call_mode != "off":
+                    self.capture_combined()
+                
                 # Capture system audio (if in listen mode)
-                if (self.system_audio_stream and 
+                if ('system' in self.active_streams and self.capture_layout == 'separate' and
                     self.call_mode in ["listen", "both"]):
                     try:
+                        mark = time.perf_counter_ns()
                         data = self.system_audio_stream.read(self.chunk, exception_on_overflow=False)
+                        mark = profiler.lap('device_read', mark)
+                        if self.loopback_echo_canceller:
+                            data = self.loopback_echo_canceller.process(data)
+                            mark = profiler.lap('aec', mark)
+                        if self.system_noise_suppressor:
+                            data = self.system_noise_suppressor.process(data)
+                            mark = profiler.lap('denoise', mark)
                         
                         # Check if there's actual audio
                         audio_level = np.max(np.abs(np.frombuffer(data, dtype=np.int16)))
-                        if audio_level > 100:  # Only send if there's sound
-                            if self.system_audio_queue.qsize() < 10:  # Prevent buildup
-                                self.system_audio_queue.put(data)
+                        profiler.lap('level_check', mark)
+                        # Only send if there's sound
+                        if audio_level > 100 and self.above_noise(self.system_noise_suppressor):
+                            self.enqueue_latest(self.system_audio_queue, data)
                     except Exception as e:
                         if "Input overflowed" not in str(e):  # Ignore overflow errors
                             print(f"System audio read error: {e}")
                 
                 # Capture microphone (if in talk mode)
-                if (self.mic_stream and 
+                if ('mic' in self.active_streams and self.capture_layout == 'separate' and
                     self.call_mode in ["talk", "both"]):
                     try:
+                        mark = time.perf_counter_ns()
                         data = self.mic_stream.read(self.chunk, exception_on_overflow=False)
+                        mark = profiler.lap('device_read', mark)
+                        if self.mic_echo_canceller:
+                            # Before the voice gate, so pure echo is not sent at all
+                            data = self.mic_echo_canceller.process(data)
+                            mark = profiler.lap('aec', mark)
+                        if self.mic_noise_suppressor:
+                            data = self.mic_noise_suppressor.process(data)
+                            mark = profiler.lap('denoise', mark)
                         
                         # Check if there's actual audio (voice detection)
                         audio_level = np.max(np.abs(np.frombuffer(data, dtype=np.int16)))
-                        if audio_level > 300:  # Voice threshold
-                            if self.mic_audio_queue.qsize() < 10:  # Prevent buildup
-                                self.mic_audio_queue.put(data)
-                                # Debug: Show when microphone is capturing
-                                if self.mic_audio_queue.qsize() % 10 == 1:  # Every 10th packet
-                                    print(f"🎤 Mic audio captured (level: {audio_level}) - Mode: {self.call_mode}")
+                        profiler.lap('level_check', mark)
+                        if audio_level > 300 and self.above_noise(self.mic_noise_suppressor):  # Voice gate
+                            self.enqueue_latest(self.mic_audio_queue, data)
+                            # Debug: Show when microphone is capturing
+                            if self.mic_audio_queue.qsize() % 10 == 1:  # Every 10th packet
+                                print(f"🎤 Mic audio captured (level: {audio_level}) - Mode: {self.call_mode}")
                                     
                     except Exception as e:
                         if "Input overflowed" not in str(e):  # Ignore overflow errors
                             print(f"Microphone read error: {e}")
                 
                 # Play viewer audio
-                if not self.viewer_audio_queue.empty() and self.speaker_stream:
-                    try:
-                        viewer_audio = self.viewer_audio_queue.get_nowait()
-                        self.speaker_stream.write(viewer_audio)
-                        print("🔊 Playing viewer audio")
-                    except queue.Empty:
-                        pass
-                    except Exception as e:
-                        print(f"Speaker output error: {e}")
+                if 'speaker' in self.active_streams:
+                    self.play_viewer_audio()
                 
-                time.sleep(0.01)  # Small delay
+                if self.active_streams:
+                    time.sleep(0.01)  # Small delay
+                else:
+                    # Nothing to read or play - sleep until the call mode changes
+                    self.wake.wait()
+                    self.wake.clear()
                 
             except Exception as e:
                 print(f"❌ Audio thread error: {e}")
                 time.sleep(0.1)
     
+    def play_viewer_audio(self):
+        """Move received viewer audio through the playout buffer to the speaker
+        
+        One speaker chunk is played per pass, the same amount of time each
+        capture pass takes, so the buffer only grows when the network
+        delivers in bursts. When the viewer stops talking, the rest is
+        flushed instead of waiting for a whole chunk.
+        """
+        mark = time.perf_counter_ns()
+        while True:
+            try:
+                self.playout.push(self.viewer_audio_queue.get_nowait())
+                self.last_viewer_audio = time.time()
+            except queue.Empty:
+                break
+        
+        viewer_audio = self.playout.pull(self.chunk)
+        if (not viewer_audio and self.playout.buffered and
+                time.time() - self.last_viewer_audio > 2 * self.chunk / self.rate):
+            viewer_audio = self.playout.flush()
+        if not viewer_audio:
+            return
+        mark = self.profiler.lap('playout', mark)
+        
+        try:
+            self.speaker_stream.write(viewer_audio)
+            self.profiler.lap('speaker_write', mark)
+            for canceller in self.echo_cancellers:
+                canceller.add_reference(viewer_audio)
+            print("🔊 Playing viewer audio")
+        except Exception as e:
+            print(f"Speaker output error: {e}")
+    
+    def capture_combined(self):
+        """Read one chunk of system audio and one of mic, send them as one frame
+        
+        Both streams run at the same rate and chunk size, so reading them
+        back to back keeps them on the same clock - they cannot drift apart
+        the way two separately sent streams do. A source that the call mode
+        does not send, or that is below its gate, is silent in the frame.
+        """
+        profiler = self.profiler
+        sources = []
+        for name, stream, canceller, suppressor, modes, gate in (
+                ('system', self.system_audio_stream, self.loopback_echo_canceller, self.system_noise_suppressor,
+                 ["listen", "both"], 100),
+                ('mic', self.mic_stream, self.mic_echo_canceller, self.mic_noise_suppressor,
+                 ["talk", "both"], 300)):
+            samples = np.zeros(self.chunk, dtype=np.int16)
+            if name in self.active_streams and self.call_mode in modes:
+                try:
+                    mark = time.perf_counter_ns()
+                    data = stream.read(self.chunk, exception_on_overflow=False)
+                    mark = profiler.lap('device_read', mark)
+                    if canceller:
+                        data = canceller.process(data)
+                        mark = profiler.lap('aec', mark)
+                    if suppressor:
+                        data = suppressor.process(data)
+                        mark = profiler.lap('denoise', mark)
+                    captured = np.frombuffer(data, dtype=np.int16)
+                    if (len(captured) == self.chunk and np.max(np.abs(captured)) > gate and
+                            self.above_noise(suppressor)):
+                        samples = captured
+                    profiler.lap('level_check', mark)
+                except Exception as e:
+                    if "Input overflowed" not in str(e):  # Ignore overflow errors
+                        print(f"Combined capture read error: {e}")
+            sources.append(samples)
+        
+        if not any(np.any(samples) for samples in sources):
+            return
+        mark = time.perf_counter_ns()
+        if self.capture_layout == 'stereo':
+            frame = interleave_pcm(*sources)
+        else:
+            frame = mix_pcm(sources, (self.system_gain, self.mic_gain))
+        profiler.lap('mix', mark)
+        self.enqueue_latest(self.combined_audio_queue, frame)
+    
+    @property
+    def combined_channels(self):
+        """Channels in a combined frame (2 for stereo, 1 for mix)"""
+        return 2 if self.capture_layout == 'stereo' else 1
+    
+    def enqueue_latest(self, audio_queue, data):
+        """Queue captured audio, dropping the oldest frame when full
+        
+        While the connection is down nothing drains the queues, so this keeps
+        the most recent max_buffered_frames of audio ready to send on resume.
+        Items are (captured_at, pcm) tuples consumed by the EgressScheduler.
+        """
+        while audio_queue.qsize() >= self.max_buffered_frames:  # Prevent buildup
+            try:
+                audio_queue.get_nowait()
+                self.dropped_frames += 1
+            except queue.Empty:
+                break
+        audio_queue.put((time.time(), data))  # capture time for egress deadlines
+    
+    @property
+    def echo_cancellers(self):
+        """The enabled echo cancellers"""
+        return [c for c in (self.mic_echo_canceller, self.loopback_echo_canceller) if c]
+    
+    def echo_stats(self):
+        """ERLE and CPU per frame of each echo canceller, if enabled"""
+        if not self.mic_echo_canceller:
+            return None
+        stats = {'mic': self.mic_echo_canceller.stats()}
+        if self.loopback_echo_canceller:
+            stats['loopback'] = self.loopback_echo_canceller.stats()
+        return stats
+    
+    def above_noise(self, suppressor):
+        """Voice gate check against the noise floor (always passes without a suppressor)"""
+        return suppressor is None or suppressor.above_noise(self.denoise_gate_db)
+    
+    def noise_stats(self):
+        """Noise removed, noise floor and CPU per frame of each noise suppressor, if enabled"""
+        stats = {name: suppressor.stats() for name, suppressor in
+                 (('mic', self.mic_noise_suppressor), ('system', self.system_noise_suppressor)) if suppressor}
+        return stats or None
+    
     def set_call_mode(self, mode):
         """Set call mode: off, listen, talk, both"""
         self.call_mode = mode
+        # Streams may have been paused - stale reference would be misaligned
+        for canceller in self.echo_cancellers:
+            canceller.clear_reference()
+        # The capture thread starts and pauses the streams on its next pass
+        self.mode_requested_at = time.perf_counter()
+        self.wake.set()
         print(f"📞 Call mode: {mode}")
     
+    def set_chunk(self, chunk):
+        """Ask the capture thread to read chunks of this many frames from its next pass"""
+        self.requested_chunk = chunk
+    
+    def open_stream(self, name):
+        """Reopen a stream on the device found at start-up (no lookup or mic test)"""
+        device_id = self.device_ids[name]
+        if name == 'speaker':
+            return self.p.open(format=self.format, channels=self.channels, rate=self.rate,
+                               output=True, output_device_index=device_id,
+                               frames_per_buffer=self.chunk)
+        return self.p.open(format=self.format, channels=self.channels, rate=self.rate,
+                           input=True, input_device_index=device_id,
+                           frames_per_buffer=self.chunk)
+    
+    def apply_call_mode(self):
+        """Start the streams the call mode needs and pause (or close) the rest
+        
+        Runs on the capture thread between reads, so a stream is never
+        stopped under a read. The time since set_call_mode is the mode
+        switch latency.
+        """
+        requested_at, self.mode_requested_at = self.mode_requested_at, None
+        if self.idle_streams == 'keep':
+            wanted = set(self.device_ids)
+        else:
+            wanted = set(self.MODE_STREAMS.get(self.call_mode, ())) & set(self.device_ids)
+        
+        for name in sorted(wanted ^ self.active_streams):
+            attr = self.STREAM_ATTRS[name]
+            stream = getattr(self, attr)
+            try:
+                if name in wanted:
+                    if stream is None:
+                        setattr(self, attr, self.open_stream(name))
+                    else:
+                        stream.start_stream()
+                    self.active_streams.add(name)
+                else:
+                    self.active_streams.discard(name)
+                    if self.idle_streams == 'close':
+                        setattr(self, attr, None)
+                        stream.close()
+                    else:
+                        stream.stop_stream()
+            except Exception as e:
+                print(f"⚠ Could not {'start' if name in wanted else 'pause'} {name} stream: {e}")
+        
+        if requested_at is not None:
+            switch_ms = (time.perf_counter() - requested_at) * 1000
+            self.switch_times.append(switch_ms)
+            self.switches += 1
+            if switch_ms > self.switch_target_ms:
+                self.slow_switches += 1
+                print(f"⚠ Call mode switch took {switch_ms:.0f}ms (target {self.switch_target_ms}ms)")
+    
+    def power_stats(self):
+        """Running streams, capture thread wakeups and mode switch latency"""
+        times = sorted(self.switch_times)
+        return {
+            'policy': self.idle_streams,
+            'streams': sorted(self.active_streams),
+            'wakeups': self.wakeups,
+            'switches': self.switches,
+            'switch_p50_ms': round(times[len(times) // 2], 1) if times else None,
+            'switch_max_ms': round(times[-1], 1) if times else None,
+            'slow_switches': self.slow_switches,
+            'target_ms': self.switch_target_ms
+        }
+    
     def add_viewer_audio(self, audio_data):
         """Add viewer's voice to playback queue"""
         if self.viewer_audio_queue.qsize() < 15:  # Prevent buildup
             self.viewer_audio_queue.put(audio_data)
     
-    def get_system_audio(self):
-        """Get system audio for sending to viewer"""
-        if not self.system_audio_queue.empty():
-            try:
-                return self.system_audio_queue.get_nowait()
-            except queue.Empty:
-                pass
-        return None
-    
-    def get_microphone_audio(self):
-        """Get microphone audio for sending to viewer"""
-        if not self.mic_audio_queue.empty():
-            try:
-                return self.mic_audio_queue.get_nowait()
-            except queue.Empty:
-                pass
-        return None
-    
     def start(self):
         """Start the audio system"""
         self.running = True
@@ -365,6 +662,10 @@ class AudioOnlyManager:
         success &= self.start_speaker_output()
         
         if success:
+            # Streams open running - pause the ones the call mode does not need
+            self.active_streams = set(self.device_ids)
+            self.apply_call_mode()
+            
             # Start background audio thread
             threading.Thread(target=self.audio_capture_thread, daemon=True).start()
             print("✅ Audio system ready for calls!")
@@ -376,31 +677,385 @@ class AudioOnlyManager:
     def stop(self):
         """Stop the audio system"""
         self.running = False
+        self.wake.set()
         
-        if self.system_audio_stream:
-            self.system_audio_stream.stop_stream()
-            self.system_audio_stream.close()
-        if self.mic_stream:
-            self.mic_stream.stop_stream()
-            self.mic_stream.close()
-        if self.speaker_stream:
-            self.speaker_stream.stop_stream()
-            self.speaker_stream.close()
+        for name, attr in self.STREAM_ATTRS.items():
+            stream = getattr(self, attr)
+            if stream:
+                if name in self.active_streams:
+                    stream.stop_stream()
+                stream.close()
+        self.active_streams.clear()
         
         self.p.terminate()
         print("🔇 Audio system stopped")
 
-class AudioCallClient:
+class AdaptiveQualityController:
+    """Steps the send quality up or down from network measurements
+    
+    Every evaluation looks at the measured RTT, the send queue depth and how
+    many frames were dropped since the last one. Quality drops after
+    degrade_after congested evaluations in a row and only recovers after
+    upgrade_after clean ones, so a link on the edge does not flap.
+    """
+    # Best quality first. Bigger chunks mean fewer messages per second;
+    # lower rates mean fewer bytes (raw PCM, so bitrate = rate * 16 bit)
+    LEVELS = [
+        {'rate': 22050, 'chunk': 1024},
+        {'rate': 22050, 'chunk': 2048},
+        {'rate': 16000, 'chunk': 2048},
+        {'rate': 11025, 'chunk': 4096},
+        {'rate': 8000, 'chunk': 4096},
+    ]
+    
+    def __init__(self, start_level=1):
+        self.level = start_level
+        
+        # Hysteresis thresholds
+        self.rtt_high_ms = 250
+        self.rtt_low_ms = 120
+        self.depth_high = 5
+        self.depth_low = 1
+        self.degrade_after = 2
+        self.upgrade_after = 8
+        
+        self.bad_streak = 0
+        self.good_streak = 0
+        self.last_drops = 0
+        self.last_sample = {}
+        self.decisions = deque(maxlen=20)
+    
+    @property
+    def settings(self):
+        """Current level settings including the resulting bitrate"""
+        level = self.LEVELS[self.level]
+        return {
+            'level': self.level,
+            'rate': level['rate'],
+            'chunk': level['chunk'],
+            'bitrate_kbps': level['rate'] * 16 // 1000
+        }
+    
+    def update(self, rtt_ms, queue_depth, total_drops):
+        """Feed one evaluation; returns a decision dict when the level changes"""
+        new_drops = total_drops - self.last_drops
+        self.last_drops = total_drops
+        self.last_sample = {'rtt_ms': rtt_ms, 'queue_depth': queue_depth, 'new_drops': new_drops}
+        
+        congested = (rtt_ms is not None and rtt_ms > self.rtt_high_ms) or \
+            queue_depth >= self.depth_high or new_drops > 0
+        clean = (rtt_ms is None or rtt_ms < self.rtt_low_ms) and \
+            queue_depth <= self.depth_low and new_drops == 0
+        
+        old_level = self.level
+        if congested:
+            self.good_streak = 0
+            self.bad_streak += 1
+            if self.bad_streak >= self.degrade_after and self.level < len(self.LEVELS) - 1:
+                self.level += 1
+                self.bad_streak = 0
+        elif clean:
+            self.bad_streak = 0
+            self.good_streak += 1
+            if self.good_streak >= self.upgrade_after and self.level > 0:
+                self.level -= 1
+                self.good_streak = 0
+        else:
+            # Inside the hysteresis band - hold the current level
+            self.bad_streak = 0
+            self.good_streak = 0
+        
+        if self.level == old_level:
+            return None
+        
+        decision = {
+            'time': time.time(),
+            'action': 'degrade' if self.level > old_level else 'upgrade',
+            'from_level': old_level,
+            **self.settings,
+            **self.last_sample
+        }
+        self.decisions.append(decision)
+        return decision
+    
+    def report(self):
+        """Snapshot of the controller state for logging and the viewer"""
+        return {
+            **self.settings,
+            **self.last_sample,
+            'decisions': list(self.decisions)[-5:]
+        }
+
+class EgressScheduler:
+    """Decides which captured frame is sent next
+    
+    Streams share the link by weight (stride scheduling) and priority breaks
+    ties, so with the default weights the mic goes first and gets three of
+    every four sends while both streams are backlogged. A frame that has
+    waited longer than its stream's deadline is dropped instead of being
+    sent late, and counted as a deadline miss. Frames kept through a
+    reconnect are exempt (replay_backlog), or any outage longer than the
+    deadline would throw the whole resume buffer away.
+    """
     def __init__(self):
+        self.streams = {}        # name -> stream state
+        self.virtual_time = 0.0  # pass value of the last frame sent
+        self.replay_before = 0.0 # frames captured before this are sent however late
+    
+    def add_stream(self, name, source_queue, priority, share, deadline_ms):
+        """Register a capture queue; lower priority numbers go first"""
+        self.streams[name] = {
+            'queue': source_queue,
+            'priority': priority,
+            'share': share,
+            'deadline': deadline_ms / 1000,
+            'pass': 0.0,
+            'head': None,         # (captured_at, pcm) taken off the queue
+            'sent': 0,
+            'deadline_misses': 0
+        }
+    
+    def fill_head(self, stream, now):
+        """Take the next fresh frame of a stream, dropping stale ones"""
+        while stream['head'] is None:
+            try:
+                frame = stream['queue'].get_nowait()
+            except queue.Empty:
+                return None
+            if self.late(stream, frame, now):
+                stream['deadline_misses'] += 1
+                continue
+            stream['head'] = frame
+            # A stream waking up from idle must not cash in saved-up credit
+            stream['pass'] = max(stream['pass'], self.virtual_time)
+        
+        if self.late(stream, stream['head'], now):
+            stream['deadline_misses'] += 1
+            stream['head'] = None
+            return self.fill_head(stream, now)
+        return stream['head']
+    
+    def late(self, stream, frame, now):
+        return now - frame[0] > stream['deadline'] and frame[0] >= self.replay_before
+    
+    def replay_backlog(self):
+        """The connection is back: send what was buffered while it was down"""
+        self.replay_before = time.time()
+    
+    def next_frame(self):
+        """Return (stream_name, captured_at, pcm) to send next, or None"""
+        now = time.time()
+        best_name = None
+        best_key = None
+        for name, stream in self.streams.items():
+            if self.fill_head(stream, now) is None:
+                continue
+            key = (stream['pass'], stream['priority'])
+            if best_key is None or key < best_key:
+                best_name, best_key = name, key
+        
+        if best_name is None:
+            return None
+        
+        stream = self.streams[best_name]
+        captured_at, pcm = stream['head']
+        stream['head'] = None
+        self.virtual_time = stream['pass']
+        stream['pass'] += 1 / stream['share']
+        stream['sent'] += 1
+        return best_name, captured_at, pcm
+    
+    @property
+    def queued(self):
+        """Frames waiting across all streams"""
+        return sum(s['queue'].qsize() + (s['head'] is not None) for s in self.streams.values())
+    
+    @property
+    def deadline_misses(self):
+        """Total frames dropped for missing their deadline"""
+        return sum(s['deadline_misses'] for s in self.streams.values())
+    
+    def stats(self):
+        """Per-stream send and deadline-miss counters"""
+        return {
+            name: {
+                'sent': s['sent'],
+                'deadline_misses': s['deadline_misses'],
+                'queued': s['queue'].qsize() + (s['head'] is not None),
+                'share': s['share'],
+                'deadline_ms': int(s['deadline'] * 1000)
+            }
+            for name, s in self.streams.items()
+        }
+
+class StageProfiler:
+    """Per-stage timing histograms for the audio pipeline
+    
+    Each stage has a fixed array of log2 buckets (about 1us, 2us, 4us and up
+    to 35 minutes). Recording is an index and an increment, and memory never
+    grows, so the profiler can stay on in production. Each stage is only
+    recorded from one thread (the capture thread or the event loop), so no
+    lock is needed. Percentiles are bucket upper bounds (capped at the max),
+    so they are within 2x.
+    
+    device_read includes waiting for the device to fill a chunk; queue_wait
+    is capture to send, measured from the frame's capture timestamp.
+    """
+    BUCKETS = 32
+    STAGES = ('device_read', 'aec', 'denoise', 'level_check', 'mix', 'queue_wait', 'encode', 'send',
+              'receive', 'playout', 'speaker_write')
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+    
+    def reset(self):
+        self.started = time.time()
+        self.histograms = {stage: [0] * self.BUCKETS for stage in self.STAGES}
+        self.total_ns = dict.fromkeys(self.STAGES, 0)
+        self.max_ns = dict.fromkeys(self.STAGES, 0)
+    
+    def record(self, stage, ns):
+        """Count one duration (nanoseconds) for a stage"""
+        if not self.enabled:
+            return
+        self.histograms[stage][min((ns >> 10).bit_length(), self.BUCKETS - 1)] += 1
+        self.total_ns[stage] += ns
+        if ns > self.max_ns[stage]:
+            self.max_ns[stage] = ns
+    
+    def lap(self, stage, mark):
+        """Record the time since mark (a perf_counter_ns value); returns the new mark"""
+        if not self.enabled:
+            return mark
+        now = time.perf_counter_ns()
+        ns = now - mark
+        bucket = (ns >> 10).bit_length()   # record() inlined - this runs several times per frame
+        self.histograms[stage][bucket if bucket < self.BUCKETS else self.BUCKETS - 1] += 1
+        self.total_ns[stage] += ns
+        if ns > self.max_ns[stage]:
+            self.max_ns[stage] = ns
+        return now
+    
+    def percentile_us(self, stage, q):
+        """Upper bound of the bucket holding the q-th percentile, in microseconds"""
+        counts = self.histograms[stage]
+        rank = q / 100 * sum(counts)
+        seen = 0
+        for bucket, count in enumerate(counts):
+            seen += count
+            if count and seen >= rank:
+                return round(min((1 << bucket) * 1.024, self.max_ns[stage] / 1000), 1)
+        return None
+    
+    def snapshot(self):
+        """Count, mean, p50/p99 and max per stage that has been recorded"""
+        stages = {}
+        for stage in self.STAGES:
+            count = sum(self.histograms[stage])
+            if not count:
+                continue
+            stages[stage] = {
+                'count': count,
+                'mean_us': round(self.total_ns[stage] / count / 1000, 1),
+                'p50_us': self.percentile_us(stage, 50),
+                'p99_us': self.percentile_us(stage, 99),
+                'max_us': round(self.max_ns[stage] / 1000, 1)
+            }
+        return {'seconds': round(time.time() - self.started, 1), 'stages': stages}
+    
+    def dump(self):
+        """Print the stage table"""
+        snapshot = self.snapshot()
+        print(f"📊 Pipeline stage timings over {snapshot['seconds']}s (us)")
+        print(f"   {'stage':<14}{'count':>9}{'mean':>10}{'p50':>10}{'p99':>10}{'max':>12}")
+        for stage, s in snapshot['stages'].items():
+            print(f"   {stage:<14}{s['count']:>9}{s['mean_us']:>10}{s['p50_us']:>10}"
+                  f"{s['p99_us']:>10}{s['max_us']:>12}")
+
+class AudioCallClient:
+    # Outgoing message type for each egress stream
+    STREAM_MESSAGE_TYPES = {
+        'mic': 'client_microphone_audio',
+        'system': 'client_system_audio',
+        'combined': 'client_combined_audio'
+    }
+    
+    def __init__(self, mic_share=3, system_share=1, mic_deadline_ms=300, system_deadline_ms=600,
+                 coalesce_ms=0, max_batch_frames=8, use_udp=False, aec_backend=None, aec_loopback=False,
+                 capture_layout='separate', system_gain=1.0, mic_gain=1.0, playout='wsola',
+                 playout_target_ms=150, profile=True, codec='pcm16', idle_streams='pause',
+                 switch_target_ms=100, idle_ping_seconds=20, mic_denoise=None, system_denoise=None,
+                 denoise_gate_db=6):
         self.uuid = self.get_system_uuid()
         self.websocket = None
         self.running = False
-        self.audio_manager = AudioOnlyManager()
+        self.profiler = StageProfiler(enabled=profile)
+        self.audio_manager = AudioOnlyManager(aec_backend=aec_backend, aec_loopback=aec_loopback,
+                                              capture_layout=capture_layout,
+                                              system_gain=system_gain, mic_gain=mic_gain,
+                                              playout=playout, playout_target_ms=playout_target_ms,
+                                              profiler=self.profiler, idle_streams=idle_streams,
+                                              switch_target_ms=switch_target_ms,
+                                              mic_denoise=mic_denoise, system_denoise=system_denoise,
+                                              denoise_gate_db=denoise_gate_db)
+        
+        # Live voice first, background audio gets what is left
+        self.scheduler = EgressScheduler()
+        self.scheduler.add_stream('mic', self.audio_manager.mic_audio_queue,
+                                  priority=0, share=mic_share, deadline_ms=mic_deadline_ms)
+        self.scheduler.add_stream('system', self.audio_manager.system_audio_queue,
+                                  priority=1, share=system_share, deadline_ms=system_deadline_ms)
+        # Combined frames carry the mic, so they get the mic's treatment
+        self.scheduler.add_stream('combined', self.audio_manager.combined_audio_queue,
+                                  priority=0, share=mic_share, deadline_ms=mic_deadline_ms)
+        
+        # Frame kind for each egress stream on the UDP media path
+        self.udp_kinds = {
+            'mic': udp_media.KIND_MIC,
+            'system': udp_media.KIND_SYSTEM,
+            'combined': udp_media.KIND_STEREO if capture_layout == 'stereo' else udp_media.KIND_MIX
+        }
+        
+        # Codec for WebSocket audio frames - the server converts for viewers
+        # that cannot take it (UDP frames are always 16-bit PCM)
+        self.codec = codec
+        
+        # Coalescing: pack waiting frames into one audio_batch message (0 = off)
+        self.coalesce_ms = coalesce_ms
+        self.max_batch_frames = max_batch_frames
         
         # Ping monitoring
         self.last_ping_time = 0
         self.ping_ms = 0
         
+        # Idle power: with the call mode 'off' the sender sleeps until a call
+        # starts and the monitors only wake every idle_ping_seconds (well
+        # inside the server's idle timeout)
+        self.call_active = asyncio.Event()
+        self.idle_ping_seconds = idle_ping_seconds
+        self.loop_wakeups = 0
+        
+        # Reconnect with jittered exponential backoff; the server hands out a
+        # resume token so a reconnect gets the call mode back immediately
+        self.reconnect_base_delay = 0.5
+        self.reconnect_max_delay = 30
+        self.resume_token = None
+        self.disconnected_at = None
+        self.recovery_times = deque(maxlen=50)  # seconds from drop to resumed call
+        
+        # Adaptive quality - RTT comes from WebSocket ping/pong round trips
+        self.quality = AdaptiveQualityController()
+        self.rtt_ms = None
+        self.congestion_signals = 0  # server-reported congestion toward the viewer
+        
+        # Optional encrypted UDP media path - WebSocket stays the control
+        # channel and carries audio whenever UDP is not getting through
+        self.use_udp = use_udp
+        self.server_url = None
+        self.udp_channel = None
+        self.udp_active = False
+        
     def get_system_uuid(self):
         """Get system UUID"""
         try:
@@ -432,7 +1087,7 @@ class AudioCallClient:
             
             self.websocket = await websockets.connect(
                 server_url,
-                ssl=ssl_context,
+                ssl=ssl_context if server_url.startswith('wss://') else None,
                 ping_interval=20,
                 ping_timeout=10
             )
@@ -442,7 +1097,9 @@ class AudioCallClient:
             await self.websocket.send(json.dumps({
                 'type': 'audio_client_connect',
                 'uuid': self.uuid,
-                'client_type': 'audio_only'
+                'client_type': 'audio_only',
+                'resume_token': self.resume_token,
+                'codecs': sorted(CODECS, key=lambda codec: codec != self.codec)  # ours first
             }))
             
             print(f"📡 Connected to server with UUID: {self.uuid}")
@@ -459,21 +1116,64 @@ class AudioCallClient:
         """Handle incoming messages from server"""
         try:
             async for message in self.websocket:
+                mark = time.perf_counter_ns()
                 data = json.loads(message)
                 msg_type = data.get('type')
                 
-                if msg_type == 'call_mode_change':
+                if msg_type == 'connected':
+                    self.handle_connected(data)
+                    if self.use_udp and udp_media.is_available():
+                        await self.websocket.send(json.dumps({'type': 'udp_offer', 'uuid': self.uuid}))
+                
+                elif msg_type == 'udp_answer':
+                    await self.open_udp_channel(data)
+                
+                elif msg_type == 'udp_unavailable':
+                    print("⚠ Server has no UDP media path - audio stays on WebSocket")
+                
+                elif msg_type == 'server_restart':
+                    # The server is handing over to a new process - the
+                    # reconnect right after this resumes the call there
+                    print("🔁 Server restarting - reconnecting to resume the call")
+                
+                elif msg_type == 'error':
+                    # Authorization failures will not fix themselves - stop retrying
+                    print(f"❌ Server error: {data.get('message')}")
+                    self.running = False
+                    break
+                
+                elif msg_type == 'call_mode_change':
                     mode = data.get('mode', 'off')
-                    self.audio_manager.set_call_mode(mode)
+                    self.set_call_mode(mode)
                 
                 elif msg_type == 'viewer_audio':
                     # Viewer's voice -> play through client speakers
                     try:
-                        audio_data = b64decode(data.get('audio'))
-                        self.audio_manager.add_viewer_audio(audio_data)
+                        self.audio_manager.add_viewer_audio(self.decode_frame(data))
                     except Exception as e:
                         print(f"Error processing viewer audio: {e}")
                 
+                elif msg_type == 'audio_batch':
+                    # Coalesced viewer frames - unpack in order
+                    try:
+                        for frame in data.get('frames', []):
+                            if frame.get('type') == 'viewer_audio':
+                                self.audio_manager.add_viewer_audio(self.decode_frame(frame))
+                    except Exception as e:
+                        print(f"Error processing viewer audio batch: {e}")
+                
+                elif msg_type == 'profile_request':
+                    # On-demand stage timings for whoever is debugging lag
+                    await self.websocket.send(json.dumps({
+                        'type': 'profile_report',
+                        'uuid': self.uuid,
+                        'profile': self.profiler.snapshot()
+                    }))
+                
+                elif msg_type == 'congestion':
+                    # Server sees the viewer falling behind - count it like a drop
+                    self.congestion_signals += 1
+                
                 elif msg_type == 'ping_request':
                     # Respond to ping
                     await self.websocket.send(json.dumps({
@@ -484,43 +1184,176 @@ class AudioCallClient:
                 
                 elif msg_type == 'disconnect':
                     print("📞 Call ended by viewer")
+                    self.running = False
                     break
+                
+                self.profiler.lap('receive', mark)
                     
         except websockets.exceptions.ConnectionClosed:
             print("📞 Connection to server lost")
         except Exception as e:
             print(f"❌ Message handling error: {e}")
     
+    def handle_connected(self, data):
+        """Handle the server's connect acknowledgement and session resume"""
+        self.resume_token = data.get('resume_token')
+        
+        if data.get('resumed'):
+            self.set_call_mode(data.get('call_mode', 'off'))
+            if self.disconnected_at:
+                recovery = time.time() - self.disconnected_at
+                self.recovery_times.append(recovery)
+                avg = sum(self.recovery_times) / len(self.recovery_times)
+                print(f"✅ Call resumed in {recovery * 1000:.0f}ms "
+                      f"(avg {avg * 1000:.0f}ms over {len(self.recovery_times)} reconnects)")
+        else:
+            # A fresh session (new server, expired token) starts in the server's mode
+            self.set_call_mode(data.get('call_mode', 'off'))
+            print("✅ Authenticated with server")
+        if self.disconnected_at:
+            self.scheduler.replay_backlog()
+        self.disconnected_at = None
+    
+    def set_call_mode(self, mode):
+        """Switch the audio engine's streams and the loops' pace to a call mode"""
+        self.audio_manager.set_call_mode(mode)
+        if mode == 'off':
+            self.call_active.clear()
+        else:
+            self.call_active.set()
+    
+    async def idle_wait(self, seconds, idle_seconds):
+        """Sleep between monitor passes; returns True if the call was idle
+        
+        While the call mode is 'off' the wait is idle_seconds, cut short as
+        soon as a call starts.
+        """
+        self.loop_wakeups += 1
+        if self.call_active.is_set():
+            await asyncio.sleep(seconds)
+            return False
+        try:
+            await asyncio.wait_for(self.call_active.wait(), idle_seconds)
+        except asyncio.TimeoutError:
+            pass
+        return True
+    
+    async def open_udp_channel(self, data):
+        """Open the UDP media path the server offered"""
+        self.close_udp_channel()
+        try:
+            self.udp_channel = await udp_media.open_channel(
+                urlparse(self.server_url).hostname, data['port'],
+                b64decode(data['key']), data['session_id'], self.receive_udp_audio)
+            self.udp_channel.send(udp_media.KIND_PROBE, time.time())
+            print(f"📦 UDP media channel opened to port {data['port']}")
+        except Exception as e:
+            print(f"⚠ UDP media unavailable ({e}) - audio stays on WebSocket")
+            self.udp_channel = None
+    
+    def close_udp_channel(self):
+        """Close the UDP media path; audio falls back to WebSocket"""
+        if self.udp_channel:
+            self.udp_channel.close()
+            self.udp_channel = None
+        self.udp_active = False
+    
+    def receive_udp_audio(self, kind, timestamp, rate, pcm):
+        """Viewer audio arriving over UDP"""
+        if kind == udp_media.KIND_VIEWER:
+            self.audio_manager.add_viewer_audio(pcm)
+    
+    def get_reconnect_delay(self, attempt):
+        """Full-jitter exponential backoff delay for a reconnect attempt"""
+        ceiling = min(self.reconnect_max_delay, self.reconnect_base_delay * (2 ** attempt))
+        return random.uniform(0, ceiling)
+    
+    def prepare_pcm(self, stream_name, pcm):
+        """Resample a captured frame to the current send rate; returns (rate, pcm)"""
+        send_rate = self.quality.settings['rate']
+        channels = self.audio_manager.combined_channels if stream_name == 'combined' else 1
+        return send_rate, resample_pcm(pcm, self.audio_manager.rate, send_rate, channels)
+    
+    def encode_frame(self, stream_name, captured_at, pcm):
+        """Build the message body for one captured frame (uuid added by the caller)"""
+        send_rate, pcm = self.prepare_pcm(stream_name, pcm)
+        message = {
+            'type': self.STREAM_MESSAGE_TYPES[stream_name],
+            'audio': b64encode(CODECS[self.codec][0](pcm)).decode('utf-8'),
+            'codec': self.codec,
+            'rate': send_rate,
+            'timestamp': captured_at
+        }
+        if stream_name == 'combined':
+            message['layout'] = self.audio_manager.capture_layout
+            message['channels'] = self.audio_manager.combined_channels
+        return message
+    
+    def decode_frame(self, frame):
+        """16-bit PCM from a received audio frame in any codec we announced"""
+        return CODECS[frame.get('codec', 'pcm16')][1](b64decode(frame.get('audio')))
+    
+    async def collect_batch(self, first_frame):
+        """Coalesce frames that are already waiting, or arrive within the budget"""
+        batch = [first_frame]
+        deadline = time.perf_counter() + self.coalesce_ms / 1000
+        while len(batch) < self.max_batch_frames:
+            frame = self.scheduler.next_frame()
+            if frame:
+                batch.append(frame)
+            elif time.perf_counter() >= deadline:
+                break
+            else:
+                await asyncio.sleep(0.001)
+        return batch
+    
     async def send_audio_updates(self):
-        """Send audio to viewer"""
+        """Send audio to viewer in the order the egress scheduler picks"""
         print("📡 Audio transmission thread started")
         
         while self.running and self.websocket:
             try:
-                # Send system audio (Zoom meeting, music, etc.)
-                system_audio = self.audio_manager.get_system_audio()
-                if system_audio:
-                    audio_b64 = b64encode(system_audio).decode('utf-8')
-                    await self.websocket.send(json.dumps({
-                        'type': 'client_system_audio',
-                        'uuid': self.uuid,
-                        'audio': audio_b64,
-                        'timestamp': time.time()
-                    }))
+                frame = self.scheduler.next_frame()
+                if frame is None:
+                    self.loop_wakeups += 1
+                    if not self.call_active.is_set() and not self.scheduler.queued:
+                        await self.call_active.wait()  # No call - nothing will be captured
+                    else:
+                        await asyncio.sleep(0.02)  # Nothing queued - check again at 50Hz
+                    continue
+                self.profiler.record('queue_wait', int((time.time() - frame[1]) * 1e9))
                 
-                # Send microphone audio (client speaking) - FIXED PRIORITY
-                mic_audio = self.audio_manager.get_microphone_audio()
-                if mic_audio:
-                    audio_b64 = b64encode(mic_audio).decode('utf-8')
-                    await self.websocket.send(json.dumps({
-                        'type': 'client_microphone_audio',
-                        'uuid': self.uuid,
-                        'audio': audio_b64,
-                        'timestamp': time.time()
-                    }))
-                    print(f"🎤 Sent microphone audio to viewer (mode: {self.audio_manager.call_mode})")
+                if self.udp_active:
+                    # One datagram per frame - a lost packet only costs that frame
+                    stream_name, captured_at, pcm = frame
+                    mark = time.perf_counter_ns()
+                    self.udp_channel.send(self.udp_kinds[stream_name], captured_at,
+                                          *self.prepare_pcm(stream_name, pcm))
+                    self.profiler.lap('send', mark)
+                    await asyncio.sleep(0)
+                    continue
+                
+                if self.coalesce_ms > 0:
+                    batch = await self.collect_batch(frame)
+                else:
+                    batch = [frame]
                 
-                await asyncio.sleep(0.02)  # Faster updates for better quality - 50Hz
+                mark = time.perf_counter_ns()
+                if len(batch) == 1:
+                    message = self.encode_frame(*batch[0])
+                    message['uuid'] = self.uuid
+                else:
+                    # One message (and one TLS record) for several frames
+                    message = {
+                        'type': 'audio_batch',
+                        'uuid': self.uuid,
+                        'frames': [self.encode_frame(*f) for f in batch]
+                    }
+                message = json.dumps(message)
+                mark = self.profiler.lap('encode', mark)
+                await self.websocket.send(message)
+                self.profiler.lap('send', mark)
+                await asyncio.sleep(0)  # Let incoming messages through while draining a backlog
                 
             except Exception as e:
                 print(f"❌ Audio update error: {e}")
@@ -538,42 +1371,144 @@ class AudioCallClient:
                     'timestamp': ping_time
                 }))
                 
-                await asyncio.sleep(2)  # Ping every 2 seconds instead of 5
+                # Measure RTT with a WebSocket ping - it queues behind audio, so
+                # it reflects what the audio frames are experiencing
+                start = time.perf_counter()
+                pong_waiter = await self.websocket.ping()
+                try:
+                    await asyncio.wait_for(pong_waiter, timeout=5)
+                    self.rtt_ms = round((time.perf_counter() - start) * 1000, 1)
+                except asyncio.TimeoutError:
+                    self.rtt_ms = 5000
+                
+                # Ping every 2 seconds instead of 5 (idle_ping_seconds with no call)
+                await self.idle_wait(2, self.idle_ping_seconds)
                 
             except Exception as e:
                 print(f"❌ Ping error: {e}")
                 break
     
+    async def udp_monitor(self):
+        """Probe the UDP path every second and switch transports on liveness"""
+        was_idle = False
+        while self.running and self.websocket:
+            try:
+                if self.udp_channel:
+                    self.udp_channel.send(udp_media.KIND_PROBE, time.time())
+                    # Idle probes only keep the path open - after one, wait
+                    # for a fresh reply before judging liveness
+                    alive = self.udp_channel.alive
+                    if alive != self.udp_active and not was_idle:
+                        self.udp_active = alive
+                        print("📦 Audio on UDP" if alive else "⚠ UDP media silent - falling back to WebSocket")
+                was_idle = await self.idle_wait(1, self.idle_ping_seconds)
+                
+            except Exception as e:
+                print(f"❌ UDP monitor error: {e}")
+                break
+    
+    async def quality_monitor(self):
+        """Adapt send quality to the network once per second"""
+        last_report = 0
+        while self.running and self.websocket:
+            try:
+                await self.idle_wait(1, self.idle_ping_seconds)
+                
+                queue_depth = self.scheduler.queued
+                drops = (self.audio_manager.dropped_frames + self.scheduler.deadline_misses +
+                         self.congestion_signals)
+                decision = self.quality.update(self.rtt_ms, queue_depth, drops)
+                
+                if decision:
+                    self.audio_manager.set_chunk(decision['chunk'])
+                    print(f"📶 Quality {decision['action']}: level {decision['from_level']} → "
+                          f"{decision['level']} ({decision['rate']} Hz, {decision['chunk']} frames, "
+                          f"{decision['bitrate_kbps']} kbps) - RTT {decision['rtt_ms'] or '?'}ms, "
+                          f"queue {decision['queue_depth']}, drops +{decision['new_drops']}")
+                
+                # Report on every change and every 5s so the server/viewer can follow
+                if decision or time.time() - last_report >= 5:
+                    last_report = time.time()
+                    await self.websocket.send(json.dumps({
+                        'type': 'quality_report',
+                        'uuid': self.uuid,
+                        'report': {
+                            **self.quality.report(),
+                            'egress': self.scheduler.stats(),
+                            'aec': self.audio_manager.echo_stats(),
+                            'denoise': self.audio_manager.noise_stats(),
+                            'playout': self.audio_manager.playout.stats(),
+                            'power': {**self.audio_manager.power_stats(), 'loop_wakeups': self.loop_wakeups},
+                            'transport': 'udp' if self.udp_active else 'websocket'
+                        }
+                    }))
+                
+            except Exception as e:
+                print(f"❌ Quality monitor error: {e}")
+                break
+    
+    async def run_session(self):
+        """Run message handling, audio and ping tasks until the connection drops"""
+        tasks = [
+            asyncio.create_task(self.handle_messages()),
+            asyncio.create_task(self.send_audio_updates()),
+            asyncio.create_task(self.ping_monitor()),
+            asyncio.create_task(self.quality_monitor()),
+            asyncio.create_task(self.udp_monitor())
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.close_udp_channel()  # the server drops the session key with the connection
+            if self.websocket:
+                await self.websocket.close()
+                self.websocket = None
+    
     async def run(self, server_url):
-        """Main client loop"""
-        if not await self.connect_to_server(server_url):
-            return
-        
+        """Main client loop - reconnects until the call is ended"""
         self.running = True
-        
-        # Start audio system
-        if not self.audio_manager.start():
-            print("⚠ Audio system failed to start completely")
-            print("Some features may not work")
-        
-        print("\n📞 AUDIO-ONLY REMOTE CALL CLIENT READY")
-        print("=====================================")
-        print("Features:")
-        print("• System Audio Capture (Zoom meetings, music, etc.)")
-        print("• Microphone Capture (your voice)")
-        print("• Speaker Output (viewer's voice)")
-        print("• Call modes: Off/Listen/Talk/Both")
-        print("• Real-time ping monitoring")
-        print("\nWaiting for viewer to connect...")
-        print("Press Ctrl+C to stop")
-        print("=====================================")
+        self.server_url = server_url
+        audio_started = False
+        attempt = 0
         
         try:
-            await asyncio.gather(
-                self.handle_messages(),
-                self.send_audio_updates(),
-                self.ping_monitor()
-            )
+            while self.running:
+                if not await self.connect_to_server(server_url):
+                    delay = self.get_reconnect_delay(attempt)
+                    attempt += 1
+                    print(f"🔄 Reconnecting in {delay:.1f}s (attempt {attempt})")
+                    await asyncio.sleep(delay)
+                    continue
+                attempt = 0
+                
+                # Start audio system once - devices stay open across reconnects
+                if not audio_started:
+                    audio_started = True
+                    if not self.audio_manager.start():
+                        print("⚠ Audio system failed to start completely")
+                        print("Some features may not work")
+                    
+                    print("\n📞 AUDIO-ONLY REMOTE CALL CLIENT READY")
+                    print("=====================================")
+                    print("Features:")
+                    print("• System Audio Capture (Zoom meetings, music, etc.)")
+                    print("• Microphone Capture (your voice)")
+                    print("• Speaker Output (viewer's voice)")
+                    print("• Call modes: Off/Listen/Talk/Both")
+                    print("• Real-time ping monitoring")
+                    print("• Automatic reconnect with call resume")
+                    print("\nWaiting for viewer to connect...")
+                    print("Press Ctrl+C to stop")
+                    print("=====================================")
+                
+                await self.run_session()
+                
+                if self.running:
+                    self.disconnected_at = time.time()
+                    print("🔄 Connection lost - keeping audio open and reconnecting...")
         except KeyboardInterrupt:
             print("\n📞 Call ended by client")
         finally:
@@ -583,21 +1518,93 @@ class AudioCallClient:
                 await self.websocket.close()
 
 async def main():
-    if len(sys.argv) < 2:
-        print("Usage: python audio_client.py <server_wss_url>")
-        print("Example: python audio_client.py wss://192.168.48.53:5444/ws")
-        return
+    parser = argparse.ArgumentParser(
+        description='Audio-Only Remote Call Client',
+        epilog='Example: python client.py wss://192.168.48.53:5444/ws')
+    parser.add_argument('server_url', help='Server WebSocket URL')
+    parser.add_argument('--mic-share', type=float, default=3,
+                        help='Egress weight of the microphone stream')
+    parser.add_argument('--system-share', type=float, default=1,
+                        help='Egress weight of the system audio stream')
+    parser.add_argument('--mic-deadline-ms', type=int, default=300,
+                        help='Drop mic frames that waited longer than this')
+    parser.add_argument('--system-deadline-ms', type=int, default=600,
+                        help='Drop system audio frames that waited longer than this')
+    parser.add_argument('--coalesce-ms', type=float, default=0,
+                        help='Pack frames arriving within this many ms into one message (0 = off)')
+    parser.add_argument('--udp', action='store_true',
+                        help='Send audio over encrypted UDP when the server offers it')
+    parser.add_argument('--aec', nargs='?', const='fdaf', choices=sorted(ECHO_CANCELLERS),
+                        help='Cancel speaker echo from the mic (backend, default fdaf)')
+    parser.add_argument('--aec-loopback', action='store_true',
+                        help='Also cancel the viewer voice from captured system audio')
+    parser.add_argument('--denoise-mic', nargs='?', const='wiener', choices=sorted(NOISE_SUPPRESSORS),
+                        help='Remove steady background noise from the mic (backend, default wiener)')
+    parser.add_argument('--denoise-system', nargs='?', const='wiener', choices=sorted(NOISE_SUPPRESSORS),
+                        help='Remove steady background noise from captured system audio')
+    parser.add_argument('--denoise-gate-db', type=float, default=6,
+                        help='A denoised stream is only sent this many dB over its noise estimate')
+    parser.add_argument('--capture-layout', choices=AudioOnlyManager.CAPTURE_LAYOUTS, default='separate',
+                        help='Send system audio and mic separately, as one stereo frame, or pre-mixed')
+    parser.add_argument('--system-gain', type=float, default=1.0, help='System audio gain in the mix layout')
+    parser.add_argument('--mic-gain', type=float, default=1.0, help='Microphone gain in the mix layout')
+    parser.add_argument('--playout', choices=sorted(PLAYOUT_POLICIES), default='wsola',
+                        help='Drain a viewer audio backlog by time-stretching (wsola) or dropping')
+    parser.add_argument('--playout-target-ms', type=int, default=150,
+                        help='Viewer audio to keep buffered before the speaker')
+    parser.add_argument('--no-profile', action='store_true',
+                        help='Turn off per-stage pipeline timings')
+    parser.add_argument('--codec', choices=sorted(CODECS), default='pcm16',
+                        help='Codec for WebSocket audio frames (mulaw halves the bandwidth)')
+    parser.add_argument('--idle-streams', choices=AudioOnlyManager.IDLE_POLICIES, default='pause',
+                        help='Audio streams the call mode does not need: pause them, close them '
+                             '(frees the devices) or keep them running')
+    parser.add_argument('--switch-target-ms', type=float, default=100,
+                        help='Warn when starting the streams for a call mode takes longer')
+    parser.add_argument('--idle-ping-seconds', type=float, default=20,
+                        help='Ping and monitor interval while the call mode is off')
+    args = parser.parse_args()
     
-    server_url = sys.argv[1]
-    client = AudioCallClient()
+    server_url = args.server_url
+    client = AudioCallClient(
+        mic_share=args.mic_share,
+        system_share=args.system_share,
+        mic_deadline_ms=args.mic_deadline_ms,
+        system_deadline_ms=args.system_deadline_ms,
+        coalesce_ms=args.coalesce_ms,
+        use_udp=args.udp,
+        aec_backend=args.aec,
+        aec_loopback=args.aec_loopback,
+        capture_layout=args.capture_layout,
+        system_gain=args.system_gain,
+        mic_gain=args.mic_gain,
+        playout=args.playout,
+        playout_target_ms=args.playout_target_ms,
+        profile=not args.no_profile,
+        codec=args.codec,
+        idle_streams=args.idle_streams,
+        switch_target_ms=args.switch_target_ms,
+        idle_ping_seconds=args.idle_ping_seconds,
+        mic_denoise=args.denoise_mic,
+        system_denoise=args.denoise_system,
+        denoise_gate_db=args.denoise_gate_db
+    )
     
     print("📞 AUDIO-ONLY REMOTE CALL CLIENT")
     print("================================")
     print(f"System UUID: {client.uuid}")
     print(f"Connecting to: {server_url}")
+    if args.udp and not udp_media.is_available():
+        print("⚠ --udp needs the 'cryptography' package - using WebSocket only")
     print("No screen/keyboard/mouse access - Audio only!")
     
+    # Stage timings on demand: kill -USR1 <pid> (Ctrl+Break on Windows)
+    dump_signal = getattr(signal, 'SIGUSR1', None) or getattr(signal, 'SIGBREAK', None)
+    if dump_signal and not args.no_profile:
+        signal.signal(dump_signal, lambda signum, frame: client.profiler.dump())
+        print(f"📊 Send {signal.Signals(dump_signal).name} to print pipeline stage timings")
+    
     await client.run(server_url)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Call Log Index - Run this on SERVER machine
+- Reads L_sys_log.txt / audio_call_log.txt from where the last run stopped and
+  keeps the CONNECT/DISCONNECT, CALL MODE CHANGE and AUDIO STATS lines in a
+  small SQLite file (log_index.db); access log lines and tracebacks are skipped
+- Connects and disconnects are paired into sessions, so "how long was this
+  machine connected last week, and from where" is an indexed lookup instead
+  of a grep through the whole log
+- Every query brings the index up to date first; only bytes appended since
+  the previous run are read. A log that was truncated or replaced is read
+  again from the start
+
+Usage:
+    python log_index.py index
+    python log_index.py uuid 2066740F-8905-8D43-B5D1-56C42AE77D82 --since 7d
+    python log_index.py ip 192.168.48.20 --since 2025-05-29 --until 2025-06-01
+    python log_index.py sessions --since 24h --json
+"""
+
+import argparse
+import calendar
+import json
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+DEFAULT_LOGS = ['L_sys_log.txt', 'audio_call_log.txt']
+DEFAULT_DB = 'log_index.db'
+CHUNK_BYTES = 4 * 1024 * 1024
+HEAD_BYTES = 64  # start of the file, to notice it was replaced
+DAY_STARTS = {}  # "YYYY-MM-DD" -> seconds, log_time's cache
+
+# Older servers logged "CLIENT CONNECT", current ones "AUDIO CLIENT CONNECT"
+EVENT_RE = re.compile(
+    r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) - \w+ - (?:'
+    r'(?:AUDIO )?(CLIENT|VIEWER) (CONNECT|DISCONNECT) - UUID: ([^,\s]+), IP: (\S+)'
+    r'|CALL MODE CHANGE - UUID: ([^,\s]+), Mode: (\S+)'
+    r'|AUDIO CLIENT RESUME - UUID: ([^,\s]+), IP: \S+, Mode: (\S+)'
+    r'|AUDIO STATS - UUID: ([^,\s]+), System: (\d+), Mic: (\d+))',
+    re.MULTILINE)
+EVENT_MARK = ' - UUID: '
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, head BLOB, offset INTEGER);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS sessions (
+    uuid TEXT, role TEXT, ip TEXT, started REAL, ended REAL, status TEXT, source TEXT);
+CREATE TABLE IF NOT EXISTS modes (uuid TEXT, ts REAL, mode TEXT);
+CREATE TABLE IF NOT EXISTS audio_stats (uuid TEXT, ts REAL, system INTEGER, mic INTEGER);
+CREATE INDEX IF NOT EXISTS sessions_uuid ON sessions (uuid, started);
+CREATE INDEX IF NOT EXISTS sessions_ip ON sessions (ip, started);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (status) WHERE status = 'open';
+CREATE INDEX IF NOT EXISTS modes_uuid ON modes (uuid, ts);
+CREATE INDEX IF NOT EXISTS audio_stats_uuid ON audio_stats (uuid, ts);
+"""
+
+# Session time inside the query window
+CLIPPED = "MAX(0, MIN(COALESCE(ended, :last), :until) - MAX(started, :since))"
+
+def iter_events(text):
+    """Matches for the event lines in text
+
+    Every event line has " - UUID: " and access lines never do, so finding
+    that first and matching only those lines is several times faster than
+    running the full pattern over megabytes of access log.
+    """
+    find = text.find
+    i = find(EVENT_MARK)
+    while i >= 0:
+        m = EVENT_RE.match(text, text.rfind('\n', 0, i) + 1)
+        if m:
+            yield m
+        i = find(EVENT_MARK, i + len(EVENT_MARK))
+
+def log_time(stamp, millis):
+    """Seconds for a log timestamp, read as UTC so it formats back to the same text"""
+    day = DAY_STARTS.get(stamp[:10])
+    if day is None:
+        day = DAY_STARTS[stamp[:10]] = calendar.timegm((int(stamp[:4]), int(stamp[5:7]), int(stamp[8:10]), 0, 0, 0))
+    return day + int(stamp[11:13]) * 3600 + int(stamp[14:16]) * 60 + int(stamp[17:19]) + int(millis) / 1000
+
+def format_time(seconds):
+    """Log-style text for a log_time value"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds)) if seconds is not None else ''
+
+def format_duration(seconds):
+    """1h 02m 03s style duration"""
+    seconds = int(round(seconds or 0))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m {seconds:02d}s"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+def parse_when(text):
+    """--since/--until value: 7d, 12h, 30m back from now, or a log-style date/time"""
+    if not text:
+        return None
+    unit = {'d': 86400, 'h': 3600, 'm': 60}.get(text[-1:])
+    if unit and text[:-1].isdigit():
+        return calendar.timegm(time.localtime()) - int(text[:-1]) * unit
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(text, fmt))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"not a time: {text!r} (use 7d, 12h, YYYY-MM-DD or 'YYYY-MM-DD HH:MM')")
+
+class LogIndex:
+    """Session index over the server's text logs
+
+    A session is one client or viewer connection, from its CONNECT line to
+    the matching DISCONNECT. Disconnects close the oldest open session for
+    the same UUID, role and IP, because a reconnecting peer logs its new
+    CONNECT before the replaced socket logs its DISCONNECT. A session that
+    never saw a DISCONNECT (the server was killed) is marked 'lost' at the
+    next-but-one connect for that UUID and role; its end is unknown, so it
+    adds no connected time. Until then it counts as 'open' up to the newest
+    indexed line.
+    """
+    def __init__(self, path=DEFAULT_DB):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.open_sessions = None
+        self.last_ts = self.meta('last_ts', 0.0)
+
+    def meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def load_open_sessions(self):
+        """Open sessions by (uuid, role), oldest first, as [rowid, ip, started]"""
+        self.open_sessions = {}
+        for rowid, uuid, role, ip, started in self.db.execute(
+                "SELECT rowid, uuid, role, ip, started FROM sessions WHERE status = 'open' ORDER BY started"):
+            self.open_sessions.setdefault((uuid, role), []).append([rowid, ip, started])
+
+    def update(self, log_path):
+        """Index whatever was appended to log_path since the last run
+
+        Only complete lines are read; a half-written last line is left for
+        the next run. The events of each chunk and the new offset are
+        committed together, so an interrupted run never indexes a line twice.
+        Returns (bytes read, events indexed).
+        """
+        path = str(Path(log_path).resolve())
+        try:
+            f = open(log_path, 'rb')
+        except FileNotFoundError:
+            return 0, 0
+        if self.open_sessions is None:
+            self.load_open_sessions()
+
+        with f:
+            head = f.read(HEAD_BYTES)
+            size = os.fstat(f.fileno()).st_size
+            row = self.db.execute("SELECT head, offset FROM files WHERE path = ?", (path,)).fetchone()
+            offset = 0
+            if row and size >= row[1] and head[:len(row[0])] == row[0]:
+                offset = row[1]
+            elif row:
+                print(f"🔄 {log_path} was truncated or replaced - reading it from the start")
+
+            read = events = 0
+            f.seek(offset)
+            pending = b''
+            while True:
+                chunk = f.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                data = pending + chunk
+                end = data.rfind(b'\n') + 1
+                pending = data[end:]
+                if not end:
+                    continue
+                with self.db:
+                    events += self.ingest(data[:end].decode('utf-8', 'replace'), path)
+                    offset += end
+                    read += end
+                    self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, head, offset))
+                    self.db.execute("INSERT OR REPLACE INTO meta VALUES ('last_ts', ?)", (self.last_ts,))
+            if not read and (not row or row[0] != head):
+                with self.db:
+                    self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, head, offset))
+        return read, events
+
+    def ingest(self, text, source):
+        """Index the event lines in a block of complete log lines"""
+        execute = self.db.execute
+        modes = []
+        stats = []
+        count = 0
+        ts = None
+        for m in iter_events(text):
+            ts = log_time(m[1], m[2])
+            count += 1
+            if m[3]:
+                key = (m[5], m[3].lower())
+                if m[4] == 'CONNECT':
+                    self.connect(key, m[6], ts, source)
+                else:
+                    self.disconnect(key, m[6], ts)
+            elif m[7]:
+                modes.append((m[7], ts, m[8]))
+            elif m[9]:
+                modes.append((m[9], ts, m[10]))
+            else:
+                stats.append((m[11], ts, int(m[12]), int(m[13])))
+        if modes:
+            self.db.executemany("INSERT INTO modes VALUES (?, ?, ?)", modes)
+        if stats:
+            self.db.executemany("INSERT INTO audio_stats VALUES (?, ?, ?, ?)", stats)
+        if ts is not None and ts > self.last_ts:
+            self.last_ts = ts
+        return count
+
+    def connect(self, key, ip, ts, source):
+        open_list = self.open_sessions.setdefault(key, [])
+        # Only the most recent earlier connection may still be waiting for
+        # its DISCONNECT; anything older ended without one
+        while len(open_list) > 1:
+            rowid, _, _ = open_list.pop(0)
+            self.db.execute("UPDATE sessions SET ended = started, status = 'lost' WHERE rowid = ?", (rowid,))
+        cursor = self.db.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, NULL, 'open', ?)",
+                                 (key[0], key[1], ip, ts, source))
+        open_list.append([cursor.lastrowid, ip, ts])
+
+    def disconnect(self, key, ip, ts):
+        open_list = self.open_sessions.get(key, ())
+        for i, (rowid, session_ip, _) in enumerate(open_list):
+            if session_ip == ip:
+                del open_list[i]
+                self.db.execute("UPDATE sessions SET ended = ?, status = 'closed' WHERE rowid = ?", (ts, rowid))
+                return
+
+    def window(self, since, until):
+        """Query parameters for a time window; open sessions run to the newest indexed line"""
+        return {'since': since or 0.0, 'until': until or float('inf'), 'last': self.last_ts}
+
+    def uuid_sessions(self, uuid, since=None, until=None):
+        """Every session of one UUID overlapping the window, oldest first"""
+        params = dict(self.window(since, until), uuid=uuid)
+        return self.db.execute(f"""
+            SELECT role, ip, started, ended, status, {CLIPPED} AS seconds FROM sessions
+            WHERE uuid = :uuid AND started < :until AND COALESCE(ended, :last) > :since
+            ORDER BY started""", params).fetchall()
+
+    def uuid_modes(self, uuid, since=None, until=None):
+        params = dict(self.window(since, until), uuid=uuid)
+        return self.db.execute("""
+            SELECT ts, mode FROM modes WHERE uuid = :uuid AND ts >= :since AND ts < :until
+            ORDER BY ts""", params).fetchall()
+
+    def uuid_audio(self, uuid, since=None, until=None):
+        """Frames sent over the client sessions that ended in the window"""
+        params = dict(self.window(since, until), uuid=uuid)
+        return self.db.execute("""
+            SELECT COUNT(*), COALESCE(SUM(system), 0), COALESCE(SUM(mic), 0) FROM audio_stats
+            WHERE uuid = :uuid AND ts >= :since AND ts < :until""", params).fetchone()
+
+    def grouped(self, where, since=None, until=None, **params):
+        """Connected time per UUID and role for the sessions matching where"""
+        params.update(self.window(since, until))
+        return self.db.execute(f"""
+            SELECT uuid, role, COUNT(*), SUM({CLIPPED}), MIN(started), MAX(COALESCE(ended, :last)),
+                   GROUP_CONCAT(DISTINCT ip), SUM(status = 'open'), SUM(status = 'lost')
+            FROM sessions
+            WHERE {where} AND started < :until AND COALESCE(ended, :last) > :since
+            GROUP BY uuid, role ORDER BY SUM({CLIPPED}) DESC""", params).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def update_all(index, logs, quiet=False):
+    """Bring the index up to date with every log"""
+    start = time.perf_counter()
+    read = events = 0
+    for log in logs:
+        r, e = index.update(log)
+        read += r
+        events += e
+    if not quiet:
+        print(f"📚 Indexed {read / 1e6:.2f} MB, {events} events in {time.perf_counter() - start:.2f}s")
+    return read, events
+
+def print_table(title, rows):
+    """Print result rows as an aligned table"""
+    print(f"\n{title}")
+    if not rows:
+        print("  (none)")
+        return
+    keys = list(dict.fromkeys(k for row in rows for k in row))
+    widths = {k: max(len(k), *(len(str(r.get(k, ''))) for r in rows)) for k in keys}
+    print("  ".join(k.ljust(widths[k]) for k in keys))
+    for row in rows:
+        print("  ".join(str(row.get(k, '')).ljust(widths[k]) for k in keys))
+
+def grouped_rows(rows):
+    return [{
+        'uuid': uuid, 'role': role, 'sessions': count, 'connected': format_duration(seconds),
+        'seconds': round(seconds or 0, 1), 'first': format_time(first), 'last': format_time(last),
+        'ips': ips or '', 'open': still_open or 0, 'lost': lost or 0,
+    } for uuid, role, count, seconds, first, last, ips, still_open, lost in rows]
+
+def query_uuid(index, args):
+    sessions = [{
+        'role': role, 'ip': ip, 'start': format_time(started), 'end': '?' if status == 'lost' else format_time(ended),
+        'status': status, 'connected': format_duration(seconds), 'seconds': round(seconds, 1),
+    } for role, ip, started, ended, status, seconds in index.uuid_sessions(args.uuid, args.since, args.until)]
+
+    totals = {}
+    for s in sessions:
+        t = totals.setdefault((s['role'], s['ip']), {'role': s['role'], 'ip': s['ip'], 'sessions': 0, 'seconds': 0.0})
+        t['sessions'] += 1
+        t['seconds'] += s['seconds']
+    for t in totals.values():
+        t['connected'] = format_duration(t['seconds'])
+        t['seconds'] = round(t['seconds'], 1)
+
+    reports, system, mic = index.uuid_audio(args.uuid, args.since, args.until)
+    return {
+        'uuid': args.uuid,
+        'by_ip': sorted(totals.values(), key=lambda t: -t['seconds']),
+        'sessions': sessions,
+        'modes': [{'time': format_time(ts), 'mode': mode} for ts, mode in index.uuid_modes(args.uuid, args.since, args.until)],
+        'audio': {'reports': reports, 'system_frames': system, 'mic_frames': mic},
+    }
+
+def query_ip(index, args):
+    return {'ip': args.ip, 'uuids': grouped_rows(index.grouped("ip = :ip", args.since, args.until, ip=args.ip))}
+
+def query_sessions(index, args):
+    return {'uuids': grouped_rows(index.grouped("1", args.since, args.until))}
+
+def print_result(args, result):
+    if args.command == 'uuid':
+        print_table(f"🖥 {result['uuid']} - connected time by IP", result['by_ip'])
+        print_table("📋 Sessions", result['sessions'])
+        print_table("📞 Call mode changes", result['modes'])
+        audio = result['audio']
+        print(f"\n🎵 Audio frames from {audio['reports']} client session(s): "
+              f"system {audio['system_frames']}, mic {audio['mic_frames']}")
+    elif args.command == 'ip':
+        print_table(f"🌐 {result['ip']} - UUIDs seen", result['uuids'])
+    else:
+        print_table("📊 Connected time per UUID", result['uuids'])
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', default=DEFAULT_DB, help='Index file')
+    common.add_argument('--log', nargs='+', default=DEFAULT_LOGS, help='Log files to index')
+    common.add_argument('--no-update', action='store_true', help='Query the index as it is, without reading the logs')
+    common.add_argument('--since', type=parse_when, help='7d, 12h, 30m, YYYY-MM-DD or "YYYY-MM-DD HH:MM"')
+    common.add_argument('--until', type=parse_when, help='End of the window, same formats as --since')
+    common.add_argument('--json', action='store_true', help='Print machine-readable results')
+
+    parser = argparse.ArgumentParser(description='Index and query the call logs')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('index', parents=[common], help='Read new log lines into the index')
+    p = sub.add_parser('uuid', parents=[common], help='Sessions, IPs and call modes of one machine')
+    p.add_argument('uuid')
+    p = sub.add_parser('ip', parents=[common], help='UUIDs that connected from one address')
+    p.add_argument('ip')
+    sub.add_parser('sessions', parents=[common], help='Connected time for every UUID')
+    args = parser.parse_args()
+
+    index = LogIndex(args.db)
+    try:
+        if args.command == 'index' or not args.no_update:
+            update_all(index, args.log, quiet=args.json and args.command != 'index')
+        if args.command == 'index':
+            return
+
+        start = time.perf_counter()
+        query = {'uuid': query_uuid, 'ip': query_ip, 'sessions': query_sessions}[args.command]
+        result = query(index, args)
+        elapsed = (time.perf_counter() - start) * 1000
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print_result(args, result)
+            print(f"\n⏱ Query took {elapsed:.1f} ms")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Control Message Codec
+- One interface over the stdlib json module and, when installed, orjson or
+  msgspec: decode(text) -> dict, encode(obj) -> str
+- Control messages (connects, call mode changes, pings, reports) are
+  checked against CONTROL_SCHEMAS once, at decode time, so handlers can
+  trust their fields; media frames and unknown types pass through as
+  decoded
+- 'auto' picks the fastest codec that is installed
+
+Usage:
+    codec = create_message_codec('auto')
+    data = codec.decode(msg.data)        # raises MessageError on bad JSON or fields
+    await ws.send_str(codec.encode(reply))
+"""
+
+import json
+from typing import Literal, get_args, get_origin
+
+try:
+    import orjson
+except ImportError:  # optional, pip install orjson
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional, pip install msgspec
+    msgspec = None
+
+CALL_MODES = Literal['off', 'listen', 'talk', 'both']
+
+# Fields a control message must have, by type; other fields are not checked
+CONTROL_SCHEMAS = {
+    'audio_client_connect': {'uuid': str},
+    'audio_viewer_connect': {'uuid': str},
+    'call_mode_change': {'uuid': str, 'mode': CALL_MODES},
+    'ping_request': {'uuid': str},
+    'ping_response': {'uuid': str},
+    'profile_request': {'uuid': str},
+    'profile_report': {'uuid': str, 'profile': dict},
+    'quality_report': {'uuid': str, 'report': dict},
+    'udp_offer': {'uuid': str},
+    'wall_connect': {'uuids': list, 'selected': list},
+}
+
+class MessageError(ValueError):
+    """A message that is not JSON, not an object, or breaks its schema"""
+
+def compile_schema(schema):
+    """(field, type, allowed values or None) checks for check_fields"""
+    return [(field, str, frozenset(get_args(kind))) if get_origin(kind) is Literal else (field, kind, None)
+            for field, kind in schema.items()]
+
+def check_fields(data, checks):
+    """Schema check for the codecs without their own validation"""
+    for field, kind, choices in checks:
+        value = data.get(field)
+        if choices is not None:
+            if value not in choices:
+                raise MessageError(f"{data['type']}.{field} must be one of {sorted(choices)}, got {value!r}")
+        elif not isinstance(value, kind):
+            raise MessageError(f"{data['type']}.{field} must be {kind.__name__}, got {type(value).__name__}")
+
+class JsonCodec:
+    """stdlib json - always available"""
+    name = 'json'
+
+    def __init__(self):
+        self.dumps = json.JSONEncoder(separators=(',', ':')).encode
+        self.schemas = {msg_type: compile_schema(schema) for msg_type, schema in CONTROL_SCHEMAS.items()}
+
+    def loads(self, text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise MessageError(f"invalid JSON: {e}") from None
+
+    def decode(self, text):
+        """Parse a message and check it against its schema"""
+        data = self.loads(text)
+        if not isinstance(data, dict):
+            raise MessageError("message is not a JSON object")
+        msg_type = data.get('type')
+        if msg_type is not None and not isinstance(msg_type, str):
+            raise MessageError(f"message type must be str, got {type(msg_type).__name__}")
+        schema = self.schemas.get(msg_type)
+        if schema:
+            self.validate(data, schema)
+        return data
+
+    def validate(self, data, schema):
+        check_fields(data, schema)
+
+    def encode(self, obj):
+        return self.dumps(obj)
+
+class OrjsonCodec(JsonCodec):
+    """orjson - C parser and serializer"""
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError("the orjson codec needs 'pip install orjson'")
+        super().__init__()
+
+    def loads(self, text):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError as e:
+            raise MessageError(f"invalid JSON: {e}") from None
+
+    def encode(self, obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+class MsgspecCodec(JsonCodec):
+    """msgspec - C parser, with the schemas compiled into typed structs"""
+    name = 'msgspec'
+
+    def __init__(self):
+        if msgspec is None:
+            raise RuntimeError("the msgspec codec needs 'pip install msgspec'")
+        self.decoder = msgspec.json.Decoder()
+        self.encoder = msgspec.json.Encoder()
+        self.schemas = {msg_type: msgspec.defstruct(msg_type, list(schema.items()))
+                        for msg_type, schema in CONTROL_SCHEMAS.items()}
+
+    def loads(self, text):
+        try:
+            return self.decoder.decode(text)
+        except msgspec.DecodeError as e:
+            raise MessageError(f"invalid JSON: {e}") from None
+
+    def validate(self, data, schema):
+        try:
+            msgspec.convert(data, schema)
+        except msgspec.ValidationError as e:
+            raise MessageError(f"{data['type']}: {e}") from None
+
+    def encode(self, obj):
+        return self.encoder.encode(obj).decode('utf-8')
+
+MESSAGE_CODECS = {
+    'json': JsonCodec,
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+}
+
+def available_codecs():
+    """Names of the codecs whose libraries are installed"""
+    return [name for name, module in (('json', json), ('orjson', orjson), ('msgspec', msgspec)) if module]
+
+def create_message_codec(name='auto'):
+    """Codec by name; 'auto' is the fastest one installed"""
+    if name == 'auto':
+        name = 'orjson' if orjson else 'msgspec' if msgspec else 'json'
+    try:
+        return MESSAGE_CODECS[name]()
+    except KeyError:
+        raise ValueError(f"unknown message codec {name!r} (choose from {', '.join(MESSAGE_CODECS)})") from None
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+PROXY Protocol Listener
+- For running the server behind a local TLS-terminating proxy (haproxy,
+  nginx stream, stunnel, ...) on a Unix socket or a plain TCP port
+- The proxy starts every connection with a PROXY protocol header (v1 text
+  or v2 binary) naming the real client; the server sees that address as
+  the connection's peer, so request.remote and the logs stay correct
+- Connections without a valid header are closed - with the option on,
+  only the proxy should be able to reach the socket
+
+Header formats:
+    v1 = "PROXY TCP4 <src> <dst> <sport> <dport>\\r\\n"   (at most 107 bytes)
+    v2 = signature (12) | version/command (1) | family (1) | length (2) | addresses
+"""
+
+import asyncio
+import ipaddress
+import struct
+
+V1_PREFIX = b'PROXY '
+V1_MAX_LENGTH = 107
+V2_SIGNATURE = b'\r\n\r\n\x00\r\nQUIT\n'
+V2_HEADER = struct.Struct('!12sBBH')       # signature, version/command, family, length
+V2_INET = struct.Struct('!4s4sHH')         # source, destination, ports
+V2_INET6 = struct.Struct('!16s16sHH')
+
+V2_LOCAL = 0x20      # health check from the proxy itself - keep the real peer
+V2_PROXY = 0x21
+V2_TCP4 = 0x11
+V2_TCP6 = 0x21
+
+HEADER_TIMEOUT = 5.0  # seconds a new connection gets to send its header
+
+def parse_header(data):
+    """Parse a PROXY header at the start of data
+
+    Returns (header_length, peer) once the header is complete, where peer
+    is (host, port) or None when the header does not name a client (v1
+    UNKNOWN, v2 LOCAL). Returns None if more data is needed and raises
+    ValueError for anything that is not a PROXY header.
+    """
+    if data[:len(V2_SIGNATURE)] == V2_SIGNATURE[:len(data)] and data[:1] == b'\r':
+        return parse_v2(data)
+    if data[:len(V1_PREFIX)] != V1_PREFIX[:len(data)]:
+        raise ValueError("connection did not start with a PROXY header")
+    return parse_v1(data)
+
+def parse_v1(data):
+    """Text header: PROXY TCP4|TCP6|UNKNOWN ... CRLF"""
+    end = data.find(b'\r\n', 0, V1_MAX_LENGTH)
+    if end < 0:
+        if len(data) >= V1_MAX_LENGTH:
+            raise ValueError("PROXY v1 header too long")
+        return None
+    fields = data[:end].decode('ascii', 'replace').split(' ')
+    if len(fields) >= 2 and fields[1] == 'UNKNOWN':
+        return end + 2, None
+    if len(fields) != 6 or fields[1] not in ('TCP4', 'TCP6'):
+        raise ValueError(f"bad PROXY v1 header: {data[:end]!r}")
+    source = str(ipaddress.ip_address(fields[2]))
+    return end + 2, (source, int(fields[4]))
+
+def parse_v2(data):
+    """Binary header: signature, command, address family, addresses"""
+    if len(data) < V2_HEADER.size:
+        return None
+    _, command, family, length = V2_HEADER.unpack_from(data)
+    total = V2_HEADER.size + length
+    if command >> 4 != 2:
+        raise ValueError("unsupported PROXY protocol version")
+    if len(data) < total:
+        return None
+    if command == V2_LOCAL:
+        return total, None
+    if command != V2_PROXY:
+        raise ValueError(f"bad PROXY v2 command {command:#x}")
+    if family == V2_TCP4 and length >= V2_INET.size:
+        source, _, port, _ = V2_INET.unpack_from(data, V2_HEADER.size)
+    elif family == V2_TCP6 and length >= V2_INET6.size:
+        source, _, port, _ = V2_INET6.unpack_from(data, V2_HEADER.size)
+    else:
+        return total, None   # Unix sockets, UDP, unspecified - no client address to use
+    return total, (str(ipaddress.ip_address(source)), port)
+
+class ProxiedTransport(asyncio.Transport):
+    """A connection's transport, reporting the client the PROXY header named"""
+    def __init__(self, listener, transport, peer):
+        super().__init__()
+        self.listener = listener
+        self.transport = transport
+        self.peer = peer
+
+    def get_extra_info(self, name, default=None):
+        if name == 'peername' and self.peer:
+            return self.peer
+        return self.transport.get_extra_info(name, default)
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def writelines(self, list_of_data):
+        self.transport.writelines(list_of_data)
+
+    def write_eof(self):
+        self.transport.write_eof()
+
+    def can_write_eof(self):
+        return self.transport.can_write_eof()
+
+    def close(self):
+        self.transport.close()
+
+    def abort(self):
+        self.transport.abort()
+
+    def is_closing(self):
+        return self.transport.is_closing()
+
+    def get_write_buffer_size(self):
+        return self.transport.get_write_buffer_size()
+
+    def get_write_buffer_limits(self):
+        return self.transport.get_write_buffer_limits()
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        self.transport.set_write_buffer_limits(high, low)
+
+    def pause_reading(self):
+        self.transport.pause_reading()
+
+    def resume_reading(self):
+        self.transport.resume_reading()
+
+    def is_reading(self):
+        return self.transport.is_reading()
+
+    def set_protocol(self, protocol):
+        self.listener.inner = protocol
+
+    def get_protocol(self):
+        return self.listener.inner
+
+class ProxyProtocolListener(asyncio.Protocol):
+    """Reads the PROXY header, then hands the connection to the real protocol
+
+    inner is the protocol that serves the connection (for the server, an
+    aiohttp request handler); it only sees the bytes after the header.
+    """
+    def __init__(self, inner, on_error=None):
+        self.inner = inner
+        self.on_error = on_error      # called with (peer, reason) for rejected connections
+        self.transport = None
+        self.buffer = b''
+        self.ready = False
+        self.timeout = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.timeout = asyncio.get_running_loop().call_later(HEADER_TIMEOUT, self.reject, "no PROXY header")
+
+    def data_received(self, data):
+        if self.ready:
+            self.inner.data_received(data)
+            return
+        self.buffer += data
+        try:
+            parsed = parse_header(self.buffer)
+        except ValueError as e:
+            self.reject(str(e))
+            return
+        if parsed is None:
+            return
+
+        length, peer = parsed
+        rest = self.buffer[length:]
+        self.buffer = b''
+        self.ready = True
+        self.timeout.cancel()
+        self.inner.connection_made(ProxiedTransport(self, self.transport, peer))
+        if rest:
+            self.inner.data_received(rest)
+
+    def reject(self, reason):
+        """Close a connection that did not start with a valid header"""
+        if self.on_error:
+            self.on_error(self.transport.get_extra_info('peername'), reason)
+        self.transport.abort()
+
+    def eof_received(self):
+        if self.ready:
+            return self.inner.eof_received()
+        return False
+
+    def connection_lost(self, exc):
+        if self.timeout:
+            self.timeout.cancel()
+        if self.ready:
+            self.inner.connection_lost(exc)
+
+    def pause_writing(self):
+        if self.ready:
+            self.inner.pause_writing()
+
+    def resume_writing(self):
+        if self.ready:
+            self.inner.resume_writing()
+
+def encode_v1(peer, local):
+    """PROXY v1 header for a TCP connection from peer to local ((host, port) each)"""
+    family = 'TCP6' if ':' in peer[0] else 'TCP4'
+    return f"PROXY {family} {peer[0]} {local[0]} {peer[1]} {local[1]}\r\n".encode('ascii')
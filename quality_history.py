@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Call Quality History
+- One sample per second for every session: frames and bytes per stream,
+  the client's last reported RTT and send queue depth, and frames dropped
+  on either side
+- Each session's samples live in a ring of fixed-size typed arrays
+  (36 bytes per second), so memory per session is set by the number of
+  minutes kept and never grows
+- When a session ends, its ring is written to disk as one compressed file;
+  read_history() loads it back
+
+File layout:
+    header = magic (8) | samples (4)
+    body   = zlib of each column in FIELDS order, oldest sample first,
+             little-endian
+"""
+
+import asyncio
+import math
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime
+from pathlib import Path
+
+MAGIC = b'ACQUAL01'
+HEADER = struct.Struct('!8sI')
+
+# (column, array type code) - frames and drops per second fit 16 bits
+FIELDS = (
+    ('time', 'I'),
+    ('system_frames', 'H'), ('system_bytes', 'I'),
+    ('mic_frames', 'H'), ('mic_bytes', 'I'),
+    ('combined_frames', 'H'), ('combined_bytes', 'I'),
+    ('viewer_frames', 'H'), ('viewer_bytes', 'I'),
+    ('rtt_ms', 'f'),          # NaN when the client has not measured one
+    ('queue_depth', 'H'),
+    ('drops', 'H'),
+)
+STREAMS = ('system', 'mic', 'combined', 'viewer')
+FRAME_STREAMS = {
+    'client_system_audio': 0,
+    'client_microphone_audio': 1,
+    'client_combined_audio': 2,
+}
+VIEWER = 3
+LIMITS = {code: 2 ** (8 * array(code).itemsize) - 1 for code in 'HI'}
+
+def audio_bytes(frame):
+    """PCM bytes carried by a frame (from its base64 length)"""
+    audio = frame.get('audio')
+    return len(audio) * 3 // 4 if isinstance(audio, str) else 0
+
+def reported_drops(quality):
+    """Frames a client says it dropped so far (egress deadline misses)"""
+    egress = (quality or {}).get('egress') or {}
+    return sum(stream.get('deadline_misses') or 0 for stream in egress.values() if isinstance(stream, dict))
+
+class QualityRing:
+    """The last `seconds` per-second samples of one session
+
+    Traffic is counted into the current second as it arrives; sample()
+    closes the second and writes it over the oldest slot.
+    """
+    __slots__ = ('seconds', 'columns', 'next', 'count', 'frames', 'bytes', 'last_drops')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.columns = [array(code, bytes(array(code).itemsize * seconds)) for _, code in FIELDS]
+        self.next = 0                 # slot the next sample goes into
+        self.count = 0                # slots filled
+        self.frames = [0] * len(STREAMS)
+        self.bytes = [0] * len(STREAMS)
+        self.last_drops = 0
+
+    def add(self, stream, frames, nbytes):
+        self.frames[stream] += frames
+        self.bytes[stream] += nbytes
+
+    def sample(self, second, rtt_ms, queue_depth, drops_total):
+        """Close one second; drops_total is a running count (a reset starts over)"""
+        drops = drops_total - self.last_drops if drops_total >= self.last_drops else drops_total
+        self.last_drops = drops_total
+        values = [second]
+        for frames, nbytes in zip(self.frames, self.bytes):
+            values += (frames, nbytes)
+        values += (math.nan if rtt_ms is None else rtt_ms, queue_depth, drops)
+
+        slot = self.next
+        for column, (_, code), value in zip(self.columns, FIELDS, values):
+            column[slot] = min(max(int(value), 0), LIMITS[code]) if code in LIMITS else value
+        self.next = (slot + 1) % self.seconds
+        self.count = min(self.count + 1, self.seconds)
+        self.frames = [0] * len(STREAMS)
+        self.bytes = [0] * len(STREAMS)
+
+    def ordered(self, column, last=None):
+        """One column, oldest sample first, optionally only the last samples"""
+        start = self.next - self.count
+        values = column[start:] + column[:self.next] if start < 0 else column[start:self.next]
+        return values[-last:] if last else values
+
+    def to_bytes(self):
+        """The file form: header and compressed little-endian columns"""
+        body = []
+        for column in self.columns:
+            values = self.ordered(column)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            body.append(values.tobytes())
+        return HEADER.pack(MAGIC, self.count) + zlib.compress(b''.join(body))
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.columns)
+
+def to_columns(columns, last=None):
+    """JSON-ready columns: lists, with NaN RTTs as None"""
+    result = {}
+    for (name, _), values in zip(FIELDS, columns):
+        values = list(values[-last:] if last else values)
+        result[name] = [None if v != v else round(v, 1) for v in values] if name == 'rtt_ms' else values
+    return result
+
+def read_history(path):
+    """Load a saved ring: one array per column in FIELDS order, oldest first"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a call quality history")
+    body = zlib.decompress(data[HEADER.size:])
+    columns = []
+    offset = 0
+    for _, code in FIELDS:
+        values = array(code)
+        size = values.itemsize * count
+        values.frombytes(body[offset:offset + size])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        columns.append(values)
+        offset += size
+    return columns
+
+class QualityHistory:
+    """Quality rings for every session, sampled once a second
+
+    The ring is kept on the session, so counting a frame is one attribute
+    lookup. A session only gets a ring once its client connects or it
+    carries audio; viewer-only sessions cost nothing until then. Rings are
+    written out by a worker thread when their session closes; a failed
+    write is logged and the samples are dropped.
+    """
+    def __init__(self, call_manager, minutes=30, history_dir='call_quality', logger=None):
+        self.call_manager = call_manager
+        self.call_manager.on_closed = self.session_closed
+        self.seconds = max(1, int(minutes * 60))
+        self.history_dir = Path(history_dir) if history_dir else None
+        self.logger = logger
+        self.saved = 0
+        self.save_errors = 0
+
+    def ring(self, session):
+        if session.history is None:
+            session.history = QualityRing(self.seconds)
+        return session.history
+
+    def count_frames(self, session, frames):
+        """Count client frames (single or batched) into the current second"""
+        ring = session.history or self.ring(session)
+        for frame in frames:
+            stream = FRAME_STREAMS.get(frame.get('type'))
+            if stream is not None:
+                ring.add(stream, 1, audio_bytes(frame))
+
+    def count_viewer_frames(self, session, frames):
+        """Count viewer microphone frames into the current second"""
+        ring = session.history or self.ring(session)
+        ring.add(VIEWER, len(frames), sum(audio_bytes(frame) for frame in frames))
+
+    def sample(self, second):
+        """Close the current second for every session with a client or traffic"""
+        for session in self.call_manager.sessions.values():
+            if session.history is None and session.client_ws is None:
+                continue
+            quality = session.quality if session.client_ws else None
+            rtt_ms = queue_depth = None
+            if quality:
+                rtt_ms = quality.get('rtt_ms')
+                queue_depth = quality.get('queue_depth')
+            self.ring(session).sample(second, rtt_ms if isinstance(rtt_ms, (int, float)) else None,
+                                      queue_depth if isinstance(queue_depth, int) else 0,
+                                      session.viewer_dropped_frames + reported_drops(quality))
+
+    async def run(self):
+        """Close each second as the next one starts (a stalled loop skips seconds)"""
+        second = int(time.time())
+        while True:
+            second = max(second + 1, int(time.time()))
+            await asyncio.sleep(second - time.time())
+            self.sample(second - 1)
+
+    def query(self, uuid, minutes):
+        """The last minutes of a session, live or from its most recent file"""
+        last = max(1, int(minutes * 60))
+        session = self.call_manager.get_session(uuid)
+        if session:
+            ring = session.history
+            columns = ([ring.ordered(column, last) for column in ring.columns] if ring else
+                       [array(code) for _, code in FIELDS])   # nothing sampled yet
+            return {'uuid': uuid, 'live': True, 'samples': len(columns[0]),
+                    'columns': to_columns(columns)}
+        path = self.latest_file(uuid)
+        if path is None:
+            return None
+        columns = read_history(path)
+        return {'uuid': uuid, 'live': False, 'file': path.name, 'samples': min(len(columns[0]), last),
+                'columns': to_columns(columns, last)}
+
+    def latest_file(self, uuid):
+        if not self.history_dir or not self.history_dir.is_dir():
+            return None
+        paths = sorted(p for p in self.history_dir.glob('*.cq') if p.stem.rsplit('_', 2)[0] == uuid)
+        return paths[-1] if paths else None
+
+    def session_closed(self, session):
+        """Call manager hook - write the ring of a session that ended"""
+        ring, session.history = session.history, None
+        if not ring or not ring.count or not self.history_dir:
+            return
+        path = self.file_path(session.uuid)
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self.save, ring, path)
+        except RuntimeError:   # no event loop (shutting down)
+            self.save(ring, path)
+
+    def file_path(self, uuid):
+        return self.history_dir / f"{uuid}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.cq"
+
+    def save(self, ring, path):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(ring.to_bytes())
+            self.saved += 1
+            if self.logger:
+                self.logger.log_quality_saved(path.stem.rsplit('_', 2)[0], path, ring.count)
+        except OSError as e:
+            self.save_errors += 1
+            if self.logger:
+                self.logger.log_error(f"Failed to save call quality history {path}: {e}")
+
+    def save_all(self):
+        """Write every live ring (server shutdown)"""
+        for session in list(self.call_manager.sessions.values()):
+            ring, session.history = session.history, None
+            if ring and ring.count and self.history_dir:
+                self.save(ring, self.file_path(session.uuid))
+
+    def get_stats(self):
+        return {
+            'sessions': sum(1 for s in self.call_manager.sessions.values() if s.history),
+            'seconds_kept': self.seconds,
+            'bytes_per_session': QualityRing(1).nbytes * self.seconds,
+            'saved': self.saved,
+            'save_errors': self.save_errors
+        }
@@ -5,17 +5,44 @@ Handles only audio communication - no screen/keyboard/mouse
 """
 
 import asyncio
+import bisect
 import json
+import os
+import queue
+import secrets
+import signal
+import socket
 import ssl
+import subprocess
+import sys
+import threading
 import time
 import logging
+import math
+import wave
+from base64 import b64decode, b64encode
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 import aiohttp
-from aiohttp import web, WSMsgType
+from aiohttp import web, WSCloseCode, WSMsgType
 import aiofiles
 
+try:
+    import uvloop
+except ImportError:  # optional faster event loop, pip install uvloop
+    uvloop = None
+
+import proxy_protocol
+import udp_media
+from message_codec import MESSAGE_CODECS, MessageError, create_message_codec
+from quality_history import QualityHistory
+from traffic_trace import PAYLOAD_MODES, TrafficTrace
+from audio_dsp import (CODECS, downmix_pcm, mix_pcm, pcm_level, pcm_to_array, resample_pcm, resample_stream,
+                       split_pcm, transcode_batch)
+
 class AudioCallLogger:
     def __init__(self, log_file="audio_call_log.txt"):
         self.log_file = log_file
@@ -48,16 +75,48 @@ class AudioCallLogger:
         msg = f"AUDIO VIEWER DISCONNECT - UUID: {uuid}, IP: {viewer_ip}"
         self.logger.info(msg)
     
+    def log_wall_connect(self, clients, viewer_ip):
+        msg = f"MONITORING WALL CONNECT - Clients: {clients}, IP: {viewer_ip}"
+        self.logger.info(msg)
+    
+    def log_wall_disconnect(self, clients, viewer_ip):
+        msg = f"MONITORING WALL DISCONNECT - Clients: {clients}, IP: {viewer_ip}"
+        self.logger.info(msg)
+    
     def log_call_mode_change(self, uuid, mode):
         msg = f"CALL MODE CHANGE - UUID: {uuid}, Mode: {mode}"
         self.logger.info(msg)
     
+    def log_client_resume(self, uuid, client_ip, mode):
+        msg = f"AUDIO CLIENT RESUME - UUID: {uuid}, IP: {client_ip}, Mode: {mode}"
+        self.logger.info(msg)
+    
     def log_audio_stats(self, uuid, system_audio_count, mic_audio_count):
         msg = f"AUDIO STATS - UUID: {uuid}, System: {system_audio_count}, Mic: {mic_audio_count}"
         self.logger.info(msg)
     
+    def log_recording_saved(self, uuid, path, frames, dropped):
+        msg = f"RECORDING SAVED - UUID: {uuid}, Path: {path}, Frames: {frames}, Dropped: {dropped}"
+        self.logger.info(msg)
+    
+    def log_quality_saved(self, uuid, path, seconds):
+        msg = f"QUALITY HISTORY SAVED - UUID: {uuid}, Path: {path}, Seconds: {seconds}"
+        self.logger.info(msg)
+    
+    def log_idle_reaped(self, uuid, side, seconds):
+        msg = f"IDLE {side.upper()} CLOSED - UUID: {uuid}, Silent for: {seconds}s"
+        self.logger.info(msg)
+    
+    def log_server_restart(self, new_pid, calls, seconds):
+        msg = f"SERVER RESTART - New PID: {new_pid}, Calls handed over: {calls}, Took: {seconds:.2f}s"
+        self.logger.info(msg)
+    
     def log_error(self, error_msg):
         self.logger.error(error_msg)
+    
+    def log_exception(self, error_msg, exc_info=True):
+        """Log an error with a traceback (by default, of the exception being handled)"""
+        self.logger.error(error_msg, exc_info=exc_info)
 
 class UUIDValidator:
     def __init__(self, allowed_file="allowed.json"):
@@ -94,95 +153,1316 @@ class UUIDValidator:
         """Check if UUID is allowed to connect"""
         return uuid in self.allowed_uuids
 
+# What a peer that does not announce codecs accepts: 16-bit PCM at any rate
+LEGACY_CAPS = (('pcm16',), None)
+
+# The only messages a socket may send before it has said who it is
+CONNECT_TYPES = ('audio_client_connect', 'audio_viewer_connect', 'wall_connect')
+
+def peer_caps(data):
+    """(codecs, max_rate) a peer accepts, from its connect message"""
+    codecs = data.get('codecs')
+    codecs = tuple(c for c in codecs if isinstance(c, str) and c in CODECS) if isinstance(codecs, list) else ()
+    try:
+        max_rate = int(data.get('max_rate') or 0)
+    except (TypeError, ValueError, OverflowError):   # malformed caps mean the defaults
+        max_rate = 0
+    return codecs or LEGACY_CAPS[0], max_rate if max_rate > 0 else None
+
+class CallSession:
+    """Everything the server tracks for one UUID's call, in fixed slots
+    
+    One record per call instead of one entry in each of several dicts: a
+    frame is routed with a single lookup, and tearing a call down cannot
+    leave half of its state behind. The session lives while either the
+    client or the viewer is connected.
+    """
+    __slots__ = (
+        'uuid',
+        # Client connection
+        'client_ws', 'client_ip', 'client_connected_at', 'resume_token', 'client_caps',
+        # Viewer connection
+        'viewer_ws', 'viewer_ip', 'viewer_connected_at', 'viewer_transport', 'viewer_caps',
+        # Routing - derived from the call mode so frames need no string compares
+        'call_mode', 'to_viewer', 'to_client',
+        # Counters and timing
+        'system_audio', 'mic_audio', 'last_ping', 'quality', 'client_seen', 'viewer_seen',
+        'viewer_dropped_frames', 'viewer_congestion_events', 'last_congestion_signal',
+        # Per-second quality samples of the whole session (QualityRing, kept across reconnects)
+        'history'
+    )
+    
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.history = None
+        self.clear_client()
+        self.clear_viewer()
+    
+    def clear_client(self):
+        """Forget the client connection and everything that belongs to it"""
+        self.client_ws = None
+        self.client_ip = None
+        self.client_connected_at = 0
+        self.resume_token = None
+        self.client_caps = LEGACY_CAPS   # (codecs, max_rate) it accepts
+        self.client_seen = 0             # last message or media from the client
+        self.system_audio = 0
+        self.mic_audio = 0
+        self.last_ping = 0
+        self.quality = None
+        self.set_call_mode('off')
+    
+    def clear_viewer(self):
+        """Forget the viewer connection and its congestion counters"""
+        self.viewer_ws = None
+        self.viewer_ip = None
+        self.viewer_connected_at = 0
+        self.viewer_transport = None     # to watch the socket send backlog
+        self.viewer_caps = LEGACY_CAPS
+        self.viewer_seen = 0
+        self.viewer_dropped_frames = 0
+        self.viewer_congestion_events = 0
+        self.last_congestion_signal = 0
+    
+    def set_call_mode(self, mode):
+        """Set the call mode and the routing flags that follow from it"""
+        self.call_mode = mode
+        self.to_viewer = mode in ('listen', 'both')   # client audio -> viewer
+        self.to_client = mode in ('talk', 'both')     # viewer mic -> client
+    
+    @property
+    def idle(self):
+        """True once neither side is connected"""
+        return self.client_ws is None and self.viewer_ws is None
+
 class AudioCallManager:
-    def __init__(self):
-        self.audio_clients = {}  # uuid -> {'ws': websocket, 'ip': ip, 'connected_at': time}
-        self.audio_viewers = {}  # uuid -> {'ws': websocket, 'ip': ip, 'connected_at': time}
-        self.call_modes = {}     # uuid -> call_mode (off, listen, talk, both)
-        self.ping_times = {}     # uuid -> last_ping_time
-        self.audio_stats = {}    # uuid -> {'system_audio': count, 'mic_audio': count}
+    def __init__(self, resume_window=60):
+        self.sessions = {}       # uuid -> CallSession
+        
+        # Session resume: a dropped client can come back with its token and
+        # get its call mode back instead of starting over in 'off'
+        self.resume_window = resume_window
+        self.suspended_calls = {}    # uuid -> {'token': token, 'call_mode': mode, 'expires': time}
+        
+        self.on_change = None        # called with (event, session) on every state change
+        self.on_closed = None        # called with a session once both sides have gone
+    
+    def notify(self, event, session):
+        """Tell the status feed (if any) that a session changed"""
+        if self.on_change:
+            self.on_change(event, session)
+    
+    def get_session(self, uuid):
+        """Get the call session for a UUID, or None"""
+        return self.sessions.get(uuid)
+    
+    def open_session(self, uuid):
+        """Get the call session for a UUID, creating it if needed"""
+        session = self.sessions.get(uuid)
+        if session is None:
+            session = self.sessions[uuid] = CallSession(uuid)
+        return session
+    
+    def close_session_if_idle(self, session):
+        """Drop a session once both sides have gone"""
+        if session.idle and self.sessions.get(session.uuid) is session:
+            del self.sessions[session.uuid]
+            self.notify('closed', session)
+            if self.on_closed:
+                self.on_closed(session)
     
     def add_audio_client(self, uuid, websocket, client_ip):
         """Add audio client connection"""
-        self.audio_clients[uuid] = {
-            'ws': websocket,
-            'ip': client_ip,
-            'connected_at': time.time()
-        }
-        self.call_modes[uuid] = 'off'
-        self.audio_stats[uuid] = {'system_audio': 0, 'mic_audio': 0}
+        session = self.open_session(uuid)
+        session.clear_client()
+        session.client_ws = websocket
+        session.client_ip = client_ip
+        session.client_connected_at = session.client_seen = time.time()
+        self.notify('client_connected', session)
+        return session
     
-    def add_audio_viewer(self, uuid, websocket, viewer_ip):
+    def add_audio_viewer(self, uuid, websocket, viewer_ip, transport=None):
         """Add audio viewer connection"""
-        self.audio_viewers[uuid] = {
-            'ws': websocket,
-            'ip': viewer_ip,
-            'connected_at': time.time()
-        }
+        session = self.open_session(uuid)
+        session.clear_viewer()
+        session.viewer_ws = websocket
+        session.viewer_ip = viewer_ip
+        session.viewer_connected_at = session.viewer_seen = time.time()
+        session.viewer_transport = transport
+        self.notify('viewer_connected', session)
+        return session
+    
+    def remove_audio_client(self, uuid, websocket=None):
+        """Remove audio client connection
+        
+        If a websocket is given, only remove the client when it is still the
+        registered one (a reconnected client may already have replaced it).
+        Returns True if the client was removed.
+        """
+        session = self.sessions.get(uuid)
+        if session is None:
+            return websocket is None
+        if websocket is not None and session.client_ws is not websocket:
+            return False
+        
+        # Keep the call mode around so the client can resume it
+        if session.resume_token:
+            self.suspended_calls[uuid] = {
+                'token': session.resume_token,
+                'call_mode': session.call_mode,
+                'expires': time.time() + self.resume_window
+            }
+        
+        session.clear_client()
+        self.notify('client_disconnected', session)
+        self.close_session_if_idle(session)
+        return True
     
-    def remove_audio_client(self, uuid):
-        """Remove audio client connection"""
-        if uuid in self.audio_clients:
-            del self.audio_clients[uuid]
-        if uuid in self.call_modes:
-            del self.call_modes[uuid]
-        if uuid in self.ping_times:
-            del self.ping_times[uuid]
-        if uuid in self.audio_stats:
-            del self.audio_stats[uuid]
-    
-    def remove_audio_viewer(self, uuid):
+    def remove_audio_viewer(self, uuid, websocket=None):
         """Remove audio viewer connection"""
-        if uuid in self.audio_viewers:
-            del self.audio_viewers[uuid]
+        session = self.sessions.get(uuid)
+        if session is None:
+            return websocket is None
+        if websocket is not None and session.viewer_ws is not websocket:
+            return False
+        session.clear_viewer()
+        self.notify('viewer_disconnected', session)
+        self.close_session_if_idle(session)
+        return True
+    
+    def issue_resume_token(self, uuid):
+        """Issue a fresh resume token for a connected client"""
+        token = secrets.token_urlsafe(16)
+        self.open_session(uuid).resume_token = token
+        return token
+    
+    def resume_call(self, uuid, token):
+        """Look up the call mode a resuming client should get back
+        
+        Accepts the token of a suspended call, or of a live connection the
+        server has not noticed dropping yet. Returns the call mode to
+        restore, or None if the token is unknown, wrong or expired.
+        """
+        if not token:
+            return None
+        
+        now = time.time()
+        for expired_uuid in [u for u, s in self.suspended_calls.items() if s['expires'] < now]:
+            del self.suspended_calls[expired_uuid]
+        
+        session = self.sessions.get(uuid)
+        if session and session.resume_token and secrets.compare_digest(session.resume_token, token):
+            return session.call_mode
+        
+        suspended = self.suspended_calls.get(uuid)
+        if suspended and secrets.compare_digest(suspended['token'], token):
+            del self.suspended_calls[uuid]
+            return suspended['call_mode']
+        return None
     
-    def get_audio_client(self, uuid):
-        """Get audio client connection by UUID"""
-        return self.audio_clients.get(uuid)
+    def export_resumable(self):
+        """Every call a client could resume, for handing over to a new process
+        
+        Connected clients are included as if they had just dropped, so
+        their current token brings their call mode back on the new server.
+        """
+        expires = time.time() + self.resume_window
+        calls = dict(self.suspended_calls)
+        for uuid, session in self.sessions.items():
+            if session.client_ws and session.resume_token:
+                calls[uuid] = {'token': session.resume_token, 'call_mode': session.call_mode,
+                               'expires': expires}
+        return calls
     
-    def get_audio_viewer(self, uuid):
-        """Get audio viewer connection by UUID"""
-        return self.audio_viewers.get(uuid)
+    def import_resumable(self, calls):
+        """Accept calls handed over by the process this one replaced"""
+        now = time.time()
+        self.suspended_calls.update((uuid, call) for uuid, call in calls.items()
+                                    if call.get('expires', 0) > now)
     
     def set_call_mode(self, uuid, mode):
         """Set call mode for a UUID"""
-        self.call_modes[uuid] = mode
+        session = self.sessions.get(uuid)
+        if session:
+            session.set_call_mode(mode)
+            self.notify('call_mode', session)
     
     def get_call_mode(self, uuid):
         """Get current call mode for a UUID"""
-        return self.call_modes.get(uuid, 'off')
+        session = self.sessions.get(uuid)
+        return session.call_mode if session else 'off'
+    
+    def touch_client(self, uuid):
+        """Note that a client was heard from (for the idle reaper)"""
+        session = self.sessions.get(uuid)
+        if session:
+            session.client_seen = time.time()
+    
+    def touch_viewer(self, uuid):
+        """Note that a viewer was heard from (for the idle reaper)"""
+        session = self.sessions.get(uuid)
+        if session:
+            session.viewer_seen = time.time()
     
     def update_ping(self, uuid):
         """Update last ping time"""
-        self.ping_times[uuid] = time.time()
+        session = self.sessions.get(uuid)
+        if session:
+            session.last_ping = time.time()
+    
+    def set_quality_report(self, uuid, report):
+        """Store the latest adaptive quality report from a client"""
+        session = self.sessions.get(uuid)
+        if session:
+            session.quality = report
+            self.notify('quality', session)
     
-    def update_audio_stats(self, uuid, audio_type):
-        """Update audio statistics"""
-        if uuid in self.audio_stats:
-            self.audio_stats[uuid][audio_type] += 1
+    def count_connections(self):
+        """Number of connected (clients, viewers)"""
+        clients = viewers = 0
+        for session in self.sessions.values():
+            clients += session.client_ws is not None
+            viewers += session.viewer_ws is not None
+        return clients, viewers
     
     def get_connection_status(self, uuid):
         """Get connection status for UUID"""
-        client = self.audio_clients.get(uuid)
-        viewer = self.audio_viewers.get(uuid)
-        stats = self.audio_stats.get(uuid, {})
+        session = self.sessions.get(uuid) or CallSession(uuid)
+        client = session.client_ws is not None
+        viewer = session.viewer_ws is not None
+        
+        return {
+            'audio_client_connected': client,
+            'audio_viewer_connected': viewer,
+            'client_ip': session.client_ip,
+            'viewer_ip': session.viewer_ip,
+            'call_mode': session.call_mode,
+            'system_audio_count': session.system_audio,
+            'mic_audio_count': session.mic_audio,
+            'uptime': time.time() - session.client_connected_at if client else 0,
+            'quality': session.quality,
+            'viewer_dropped_frames': session.viewer_dropped_frames,
+            'viewer_congestion_events': session.viewer_congestion_events
+        }
+
+class StatusFeed:
+    """Push-based session status for dashboards
+    
+    Keeps one status row per session, updated in place when the call
+    manager reports a change, so /api/sessions pages are served from the
+    snapshot instead of being rebuilt per request. Every change becomes a
+    delta with a version number; each delta is serialized once and queued
+    to all watchers of /api/status_feed. Traffic counters are folded into
+    one 'stats' delta every stats_interval seconds. A watcher that
+    reconnects with Last-Event-ID gets the deltas it missed from a short
+    backlog, or a 'resync' event telling it to reload /api/sessions.
+    """
+    RESYNC = b'event: resync\ndata: {}\n\n'
+    
+    def __init__(self, call_manager, codec, stats_interval=5, backlog=1024, watcher_queue=256):
+        self.call_manager = call_manager
+        self.call_manager.on_change = self.session_changed
+        self.codec = codec
+        self.stats_interval = stats_interval
+        self.watcher_queue = watcher_queue
+        
+        self.rows = {}              # uuid -> status row (updated in place)
+        self.order = []             # sorted uuids, for cursor pagination
+        self.version = 0
+        self.backlog = deque(maxlen=backlog)  # (version, encoded event)
+        self.watchers = set()       # one asyncio.Queue per connected watcher
+    
+    def build_row(self, session):
+        """Status row for a session - the fields dashboards show"""
+        quality = session.quality or {}
+        return {
+            'uuid': session.uuid,
+            'client_connected': session.client_ws is not None,
+            'viewer_connected': session.viewer_ws is not None,
+            'client_ip': session.client_ip,
+            'viewer_ip': session.viewer_ip,
+            'call_mode': session.call_mode,
+            'client_connected_at': session.client_connected_at or None,
+            'system_audio_count': session.system_audio,
+            'mic_audio_count': session.mic_audio,
+            'viewer_dropped_frames': session.viewer_dropped_frames,
+            'quality_level': quality.get('level'),
+            'send_rate': quality.get('rate')
+        }
+    
+    def refresh_row(self, session):
+        """Update a session's row in place; returns the fields that changed"""
+        new_row = self.build_row(session)
+        row = self.rows.get(session.uuid)
+        if row is None:
+            self.rows[session.uuid] = new_row
+            bisect.insort(self.order, session.uuid)
+            return new_row
+        changes = {k: v for k, v in new_row.items() if row[k] != v}
+        row.update(changes)
+        return changes
+    
+    def session_changed(self, event, session):
+        """Call manager hook - turn one state change into a delta"""
+        if event == 'closed':
+            if self.rows.pop(session.uuid, None) is not None:
+                self.order.pop(bisect.bisect_left(self.order, session.uuid))
+                self.publish(event, {'uuid': session.uuid})
+            return
+        changes = self.refresh_row(session)
+        if changes:
+            self.publish(event, {'uuid': session.uuid, 'changes': changes})
+    
+    def publish(self, event, data):
+        """Version, encode once and queue a delta for every watcher"""
+        self.version += 1
+        encoded = (f"id: {self.version}\nevent: {event}\n"
+                   f"data: {self.codec.encode({'version': self.version, **data})}\n\n").encode('utf-8')
+        self.backlog.append((self.version, encoded))
+        for watcher in self.watchers:
+            try:
+                watcher.put_nowait(encoded)
+            except asyncio.QueueFull:
+                # Too far behind to catch up delta by delta - reload the snapshot
+                while not watcher.empty():
+                    watcher.get_nowait()
+                watcher.put_nowait(self.RESYNC)
+    
+    async def stats_loop(self):
+        """Fold traffic counter changes into one delta per interval"""
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            changed = {}
+            for uuid, session in self.call_manager.sessions.items():
+                changes = self.refresh_row(session)
+                if changes:
+                    changed[uuid] = changes
+            if changed:
+                self.publish('stats', {'sessions': changed})
+    
+    def page(self, after=None, limit=100):
+        """One page of status rows, sorted by UUID, starting after a cursor"""
+        start = bisect.bisect_right(self.order, after) if after else 0
+        uuids = self.order[start:start + limit]
+        return {
+            'version': self.version,
+            'total': len(self.order),
+            'sessions': [self.rows[uuid] for uuid in uuids],
+            'next': uuids[-1] if start + limit < len(self.order) else None
+        }
+    
+    def subscribe(self, last_version=None):
+        """Register a watcher; returns its queue, primed with missed deltas"""
+        watcher = asyncio.Queue(maxsize=self.watcher_queue)
+        if last_version is not None and last_version < self.version:
+            missed = [encoded for version, encoded in self.backlog if version > last_version]
+            oldest = self.backlog[0][0] if self.backlog else self.version + 1
+            if oldest > last_version + 1 or len(missed) > self.watcher_queue:
+                missed = [self.RESYNC]
+            for encoded in missed:
+                watcher.put_nowait(encoded)
+        self.watchers.add(watcher)
+        return watcher
+    
+    def unsubscribe(self, watcher):
+        self.watchers.discard(watcher)
+
+class WallSubscription:
+    """One monitoring wall connection: the clients it watches and listens to"""
+    __slots__ = ('ws', 'transport', 'uuids', 'selected', 'premix', 'mix', 'mix_state', 'primed')
+    
+    def __init__(self, ws, transport):
+        self.ws = ws
+        self.transport = transport   # to watch the socket send backlog
+        self.uuids = set()           # level summaries for these
+        self.selected = set()        # full audio for these
+        self.premix = False
+        self.mix = {}                # uuid -> mono PCM at the mix rate waiting to be mixed
+        self.mix_state = {}          # uuid -> resample_stream state
+        self.primed = set()          # uuids with enough audio buffered to be mixed
+
+class MonitoringWall:
+    """Many clients on one viewer WebSocket
+    
+    A wall watches a set of client UUIDs and gets one 'wall_levels'
+    summary for all of them every level_interval seconds: RMS and peak
+    level, frames and call mode, measured once per client however many
+    walls watch it. Full audio only goes out for the few clients a wall
+    selected - forwarded as the client sent it, or with premix decoded and
+    mixed by the server into one 'wall_mix' stream - so a wall costs what
+    it listens to rather than what it watches.
+    """
+    def __init__(self, call_manager, codec, level_interval=0.5, max_selected=4, mix_rate=16000,
+                 mix_ms=100, buffer_limit=64 * 1024):
+        self.call_manager = call_manager
+        self.codec = codec
+        self.level_interval = level_interval
+        self.max_selected = max_selected
+        self.mix_rate = mix_rate
+        self.mix_samples = mix_rate * mix_ms // 1000
+        self.mix_ms = mix_ms
+        self.buffer_limit = buffer_limit
+        
+        self.subscriptions = {}      # ws -> WallSubscription
+        self.watching = {}           # uuid -> set of subscriptions watching it
+        self.levels = {}             # uuid -> [frames, sum of squares, samples, peak] since the last summary
+        self.stats = {'level_messages': 0, 'audio_frames': 0, 'mix_frames': 0, 'dropped_frames': 0,
+                      'send_errors': 0}
+    
+    def subscribe(self, ws, transport, uuids, selected=(), premix=False):
+        """Register a wall connection; returns its subscription"""
+        sub = self.subscriptions[ws] = WallSubscription(ws, transport)
+        self.update(sub, uuids, selected, premix)
+        return sub
+    
+    def update(self, sub, uuids=None, selected=None, premix=None):
+        """Change what a wall watches, listens to, or whether it gets a premix"""
+        if uuids is not None:
+            for uuid in sub.uuids - set(uuids):
+                self.unwatch(sub, uuid)
+            for uuid in set(uuids) - sub.uuids:
+                self.watching.setdefault(uuid, set()).add(sub)
+            sub.uuids = set(uuids)
+        if isinstance(selected, (list, tuple)):
+            selected = (u for u in selected if isinstance(u, str) and u in sub.uuids)
+            sub.selected = set(list(dict.fromkeys(selected))[:self.max_selected])
+        sub.selected &= sub.uuids
+        if premix is not None:
+            sub.premix = bool(premix)
+        for uuid in list(sub.mix):
+            if not sub.premix or uuid not in sub.selected:
+                self.drop_mix_source(sub, uuid)
+    
+    def unwatch(self, sub, uuid):
+        watchers = self.watching.get(uuid)
+        if watchers:
+            watchers.discard(sub)
+            if not watchers:
+                del self.watching[uuid]
+                self.levels.pop(uuid, None)
+        self.drop_mix_source(sub, uuid)
+    
+    def drop_mix_source(self, sub, uuid):
+        sub.mix.pop(uuid, None)
+        sub.mix_state.pop(uuid, None)
+        sub.primed.discard(uuid)
+    
+    def unsubscribe(self, ws):
+        sub = self.subscriptions.pop(ws, None)
+        if sub:
+            for uuid in list(sub.uuids):
+                self.unwatch(sub, uuid)
+    
+    def decode(self, frame):
+        """Mono 16-bit PCM of a client frame, or None if it carries no audio we know"""
+        codec = frame.get('codec', 'pcm16')
+        if not frame.get('audio') or codec not in CODECS:
+            return None
+        return downmix_pcm(CODECS[codec][1](b64decode(frame['audio'])), frame.get('channels', 1))
+    
+    async def client_frames(self, session, frames, message=None):
+        """Meter client frames for the walls watching the client and forward them to those listening
+        
+        message is the frames as received (one frame or a batch), sent on
+        unchanged to walls that get the client's audio as it is.
+        """
+        watchers = self.watching.get(session.uuid)
+        if not watchers:
+            return
+        level = self.levels.setdefault(session.uuid, [0, 0.0, 0, 0])
+        mixing = [sub for sub in watchers if sub.premix and session.uuid in sub.selected and session.to_viewer]
+        for frame in frames:
+            pcm = self.decode(frame)
+            if pcm is None:
+                continue
+            energy, peak, samples = pcm_level(pcm)
+            level[0] += 1
+            level[1] += energy
+            level[2] += samples
+            level[3] = max(level[3], peak)
+            for sub in mixing:
+                self.push_mix(sub, session.uuid, pcm, frame.get('rate', 22050))
+        
+        if not session.to_viewer:
+            return   # levels only - the call mode does not let the client be heard
+        for sub in list(watchers):   # a failed send unsubscribes the wall
+            if sub.premix or session.uuid not in sub.selected:
+                continue
+            if self.backlog(sub) > self.buffer_limit:
+                self.stats['dropped_frames'] += len(frames)
+                continue
+            message = message or self.codec.encode(
+                frames[0] if len(frames) == 1 else {'type': 'audio_batch', 'uuid': session.uuid, 'frames': frames})
+            if await self.send_text(sub, message):
+                self.stats['audio_frames'] += len(frames)
+    
+    def push_mix(self, sub, uuid, pcm, rate):
+        """Queue a client's audio for the wall's premix, keeping at most half a second"""
+        pcm, sub.mix_state[uuid] = resample_stream(pcm, rate, self.mix_rate, sub.mix_state.get(uuid))
+        buffered = sub.mix.setdefault(uuid, bytearray())
+        buffered += pcm
+        excess = len(buffered) - self.mix_rate  # bytes: 0.5 s of 16-bit samples
+        if excess > 0:
+            del buffered[:excess]
+    
+    def backlog(self, sub):
+        return sub.transport.get_write_buffer_size() if sub.transport else 0
+    
+    def level_summary(self, uuid):
+        """Level row for one watched client; resets its meter"""
+        frames, energy, samples, peak = self.levels.pop(uuid, None) or (0, 0.0, 0, 0)
+        session = self.call_manager.get_session(uuid)
+        rms = math.sqrt(energy / samples) if samples else 0
+        return {
+            'connected': bool(session and session.client_ws),
+            'call_mode': session.call_mode if session else 'off',
+            'frames': frames,
+            'rms_db': round(20 * math.log10(rms / 32768), 1) if rms >= 1 else None,
+            'peak_db': round(20 * math.log10(peak / 32768), 1) if peak else None
+        }
+    
+    async def send_levels(self):
+        """One wall_levels message per wall for everything it watches"""
+        rows = {uuid: self.level_summary(uuid) for uuid in list(self.watching)}
+        for sub in list(self.subscriptions.values()):
+            if await self.send(sub, {'type': 'wall_levels', 'interval': self.level_interval,
+                                     'clients': {uuid: rows[uuid] for uuid in sub.uuids if uuid in rows}}):
+                self.stats['level_messages'] += 1
+    
+    async def send_mix(self, sub):
+        """Mix mix_ms of every selected client and send it as one frame
+        
+        A client's audio joins the mix once two slices are buffered, so
+        network jitter does not punch a gap into every slice.
+        """
+        need = self.mix_samples * 2
+        sources = []
+        for uuid, buffered in sub.mix.items():
+            if uuid not in sub.primed:
+                if len(buffered) < 2 * need:
+                    continue
+                sub.primed.add(uuid)
+            pcm = bytes(buffered[:need])
+            del buffered[:need]
+            if len(pcm) < need:
+                sub.primed.discard(uuid)   # ran dry - buffer again before the next slice
+                pcm += bytes(need - len(pcm))
+            sources.append((uuid, pcm_to_array(pcm)))
+        if not sources:
+            return
+        if self.backlog(sub) > self.buffer_limit:
+            self.stats['dropped_frames'] += 1
+            return
+        if await self.send(sub, {
+            'type': 'wall_mix',
+            'uuids': [uuid for uuid, _ in sources],
+            'audio': b64encode(mix_pcm([samples for _, samples in sources], [1.0] * len(sources))).decode('utf-8'),
+            'codec': 'pcm16',
+            'rate': self.mix_rate,
+            'timestamp': time.time()
+        }):
+            self.stats['mix_frames'] += 1
+    
+    async def send(self, sub, message):
+        return await self.send_text(sub, self.codec.encode(message))
+    
+    async def send_text(self, sub, text):
+        """Send to one wall; a wall whose socket fails is unsubscribed
+        
+        Client frames are metered and forwarded inline from the client's
+        own handler, so a closing wall must never raise into it.
+        """
+        try:
+            await sub.ws.send_str(text)
+            return True
+        except Exception:
+            self.stats['send_errors'] += 1
+            self.unsubscribe(sub.ws)
+            return False
+    
+    async def run(self):
+        """Level summaries every level_interval, premixes every mix_ms"""
+        last_levels = time.monotonic()
+        while True:
+            mixing = [sub for sub in self.subscriptions.values() if sub.premix and sub.selected]
+            await asyncio.sleep(self.mix_ms / 1000 if mixing else self.level_interval)
+            for sub in mixing:
+                if sub.ws in self.subscriptions:
+                    await self.send_mix(sub)
+            if time.monotonic() - last_levels >= self.level_interval:
+                last_levels = time.monotonic()
+                if self.subscriptions:
+                    await self.send_levels()
+    
+    def get_stats(self):
+        return {
+            'walls': len(self.subscriptions),
+            'watched': len(self.watching),
+            'listened': sum(len(sub.selected) for sub in self.subscriptions.values()),
+            'premixed': sum(sub.premix for sub in self.subscriptions.values()),
+            **self.stats
+        }
+    
+    def state(self, sub):
+        """What a wall is subscribed to, for its connect/update replies"""
+        return {
+            'uuids': sorted(sub.uuids),
+            'selected': sorted(sub.selected),
+            'premix': sub.premix,
+            'level_interval': self.level_interval,
+            'max_selected': self.max_selected,
+            'mix_rate': self.mix_rate
+        }
+
+class CallRecorder:
+    """Streams one call to disk as time-aligned WAV tracks
+    
+    The event loop only hands frames over through a bounded queue; decoding
+    and disk writes happen on a background thread. When the writer falls
+    behind, frames are dropped instead of blocking forwarding. Each track is
+    padded with silence so the same sample offset means the same moment in
+    every track, and index.csv lists every written chunk for seeking.
+    """
+    TRACKS = ('system', 'client_mic', 'viewer_mic', 'client_mix')
+    STEREO_TRACKS = ('system', 'client_mic')  # channel order of stereo client frames
+    
+    def __init__(self, record_dir, uuid, rate=22050, queue_size=256, chunk_seconds=1.0):
+        self.uuid = uuid
+        self.rate = rate
+        self.started_at = time.time()
+        self.session_dir = Path(record_dir) / f"{uuid}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.recorded_frames = 0
+        self.dropped_frames = 0
+        
+        # Writer state - only touched by the writer thread
+        self.chunk_bytes = int(rate * chunk_seconds) * 2
+        self.gap_tolerance = int(rate * 0.1)  # Don't pad over network jitter
+        self.silence = bytes(self.chunk_bytes)
+        self.tracks = {}      # track -> wave writer
+        self.written = {}     # track -> samples written
+        self.pending = {}     # track -> bytearray not yet flushed
+        self.index_file = None
+        
+        self.thread = threading.Thread(target=self.writer_thread, daemon=True)
+        self.thread.start()
+    
+    def record(self, track, audio_b64, rate=22050, channels=1, codec='pcm16'):
+        """Queue a base64 audio frame for a track - never blocks
+        
+        Two-channel frames are split into the STEREO_TRACKS on the writer
+        thread, so they line up with separately sent frames. Compressed
+        frames are decoded there too.
+        """
+        try:
+            self.frames.put_nowait((track, time.time(), audio_b64, rate, channels, codec))
+            self.recorded_frames += 1
+        except queue.Full:
+            self.dropped_frames += 1
+    
+    def close(self):
+        """Stop recording once the queued frames are written"""
+        self.stop_event.set()
+    
+    def writer_thread(self):
+        """Background thread that decodes frames and writes the tracks"""
+        try:
+            self.session_dir.mkdir(parents=True, exist_ok=True)
+            self.index_file = open(self.session_dir / 'index.csv', 'w')
+            self.index_file.write('track,start_seconds,sample_offset,samples\n')
+            
+            while True:
+                try:
+                    frame = self.frames.get(timeout=0.25)
+                except queue.Empty:
+                    if self.stop_event.is_set():
+                        break
+                    continue
+                self.write_frame(*frame)
+        except Exception as e:
+            print(f"❌ Recorder error for {self.uuid}: {e}")
+        finally:
+            for track in list(self.tracks):
+                self.flush_track(track)
+                self.tracks[track].close()
+            if self.index_file:
+                self.index_file.close()
+    
+    def write_frame(self, track, received_at, audio_b64, rate, channels=1, codec='pcm16'):
+        """Place one frame at its arrival time on its track(s)"""
+        pcm = CODECS[codec][1](b64decode(audio_b64))
+        if channels == 2:
+            for channel_track, channel_pcm in zip(self.STEREO_TRACKS, split_pcm(pcm, 2)):
+                self.write_pcm(channel_track, received_at, channel_pcm, rate)
+        else:
+            self.write_pcm(track, received_at, pcm, rate)
+    
+    def write_pcm(self, track, received_at, pcm, rate):
+        """Place mono PCM at its arrival time on a track"""
+        # Adaptive quality may have lowered the sender's rate
+        pcm = resample_pcm(pcm, rate, self.rate)
+        if track not in self.tracks:
+            writer = wave.open(str(self.session_dir / f'{track}.wav'), 'wb')
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(self.rate)
+            self.tracks[track] = writer
+            self.written[track] = 0
+            self.pending[track] = bytearray()
+        
+        position = self.written[track] + len(self.pending[track]) // 2
+        target = int((received_at - self.started_at) * self.rate)
+        if target - position > self.gap_tolerance:
+            # Gap in the stream (VAD, mode change) - fill with silence
+            self.flush_track(track)
+            self.write_silence(track, target - position)
+        
+        self.pending[track].extend(pcm)
+        if len(self.pending[track]) >= self.chunk_bytes:
+            self.flush_track(track)
+    
+    def write_silence(self, track, samples):
+        """Pad a track with silence in fixed-size blocks"""
+        remaining = samples * 2
+        while remaining > 0:
+            block = min(remaining, len(self.silence))
+            self.tracks[track].writeframes(self.silence[:block])
+            remaining -= block
+        self.written[track] += samples
+    
+    def flush_track(self, track):
+        """Write buffered audio for a track and index the chunk"""
+        data = self.pending[track]
+        if not data:
+            return
+        samples = len(data) // 2
+        self.tracks[track].writeframes(bytes(data))
+        self.index_file.write(f"{track},{self.written[track] / self.rate:.3f},"
+                              f"{self.written[track]},{samples}\n")
+        self.index_file.flush()
+        self.written[track] += samples
+        data.clear()
+
+class TokenBucket:
+    """Allows rate units per second on average, with bursts up to burst"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def take(self, amount=1, now=None):
+        """Spend amount tokens; False (and nothing spent) if there are not enough"""
+        now = now or time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+class AdmissionControl:
+    """Connection caps and message/byte rate limits, per connection and per IP
+    
+    Connections over a cap are refused before the WebSocket upgrade, which
+    costs the server next to nothing. Accepted connections get their own
+    token buckets and share one pair per IP; a message either bucket cannot
+    cover is dropped, and a connection that keeps overrunning is closed.
+    Connections without an address (a Unix socket without PROXY headers)
+    only count towards the total cap.
+    """
+    def __init__(self, max_connections=1000, max_per_ip=50, handshake_timeout=10,
+                 message_rate=200, byte_rate=1024 * 1024, ip_message_rate=1000, ip_byte_rate=8 * 1024 * 1024,
+                 max_violations=50):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.handshake_timeout = handshake_timeout
+        self.message_rate = message_rate
+        self.byte_rate = byte_rate
+        self.ip_message_rate = ip_message_rate
+        self.ip_byte_rate = ip_byte_rate
+        self.max_violations = max_violations   # dropped messages before a connection is closed
+        
+        self.connections = 0
+        self.per_ip = {}    # ip -> [connections, message bucket, byte bucket]
+        self.stats = {'rejected_capacity': 0, 'rejected_ip': 0, 'handshake_timeouts': 0,
+                      'before_connect': 0, 'rate_limited': 0, 'rate_limit_closes': 0, 'reaped': 0}
+    
+    def admit(self, ip):
+        """Count a new connection; returns why it is refused, or None"""
+        if self.connections >= self.max_connections:
+            self.stats['rejected_capacity'] += 1
+            return 'server is at its connection limit'
+        if ip:
+            entry = self.per_ip.get(ip)
+            if entry is None:
+                entry = self.per_ip[ip] = [0, TokenBucket(self.ip_message_rate, self.ip_message_rate * 2),
+                                           TokenBucket(self.ip_byte_rate, self.ip_byte_rate * 2)]
+            elif entry[0] >= self.max_per_ip:
+                self.stats['rejected_ip'] += 1
+                return 'too many connections from this address'
+            entry[0] += 1
+        self.connections += 1
+        return None
+    
+    def release(self, ip):
+        """Forget a connection that has closed"""
+        self.connections -= 1
+        entry = self.per_ip.get(ip)
+        if entry:
+            entry[0] -= 1
+            if entry[0] <= 0:
+                del self.per_ip[ip]
+    
+    def connection_buckets(self):
+        """Message, byte and overrun buckets for one new connection"""
+        return (TokenBucket(self.message_rate, self.message_rate * 2),
+                TokenBucket(self.byte_rate, self.byte_rate * 2),
+                TokenBucket(self.max_violations / 10, self.max_violations))
+    
+    def check(self, ip, buckets, size):
+        """None if a message of size bytes fits the connection's and the IP's budget
+        
+        Otherwise 'drop', or 'close' once the connection has overrun its
+        budget max_violations times in about ten seconds.
+        """
+        now = time.monotonic()
+        messages, data, overruns = buckets
+        entry = self.per_ip.get(ip)
+        if (messages.take(1, now) and data.take(size, now) and
+                (entry is None or (entry[1].take(1, now) and entry[2].take(size, now)))):
+            return None
+        self.stats['rate_limited'] += 1
+        if overruns.take(1, now):
+            return 'drop'
+        self.stats['rate_limit_closes'] += 1
+        return 'close'
+    
+    def get_stats(self):
+        return {'connections': self.connections, 'addresses': len(self.per_ip), **self.stats}
+
+class UdpMediaRelay(asyncio.DatagramProtocol):
+    """Server end of the optional encrypted UDP media path
+    
+    Sessions are found by the session id in each packet header. Decrypted
+    client frames become the usual JSON audio messages and are routed with
+    the same call-mode rules as WebSocket frames, in arrival order, by a
+    single forwarding task. Probes are echoed so clients can tell whether
+    UDP gets through and fall back to WebSocket when it does not.
+    """
+    # Client frame kinds -> the message fields they stand for
+    CLIENT_FRAMES = {
+        udp_media.KIND_SYSTEM: {'type': 'client_system_audio'},
+        udp_media.KIND_MIC: {'type': 'client_microphone_audio'},
+        udp_media.KIND_STEREO: {'type': 'client_combined_audio', 'layout': 'stereo', 'channels': 2},
+        udp_media.KIND_MIX: {'type': 'client_combined_audio', 'layout': 'mix', 'channels': 1}
+    }
+    
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.sessions = {}   # session_id -> {'uuid', 'cipher', 'addr', 'last_seen'}
+        self.by_uuid = {}    # uuid -> session_id
+        self.inbound = asyncio.Queue(maxsize=256)
+        self.stats = {'packets_in': 0, 'packets_out': 0, 'rejected': 0,
+                      'unknown_session': 0, 'queue_drops': 0}
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def register(self, uuid):
+        """Create a session for a client; returns (session_id, key)"""
+        self.unregister(uuid)
+        session_id = secrets.randbits(32)
+        while session_id in self.sessions:
+            session_id = secrets.randbits(32)
+        key = udp_media.new_session_key()
+        self.sessions[session_id] = {
+            'uuid': uuid,
+            'cipher': udp_media.MediaCipher(key, session_id),
+            'addr': None,
+            'last_seen': 0
+        }
+        self.by_uuid[uuid] = session_id
+        return session_id, key
+    
+    def unregister(self, uuid):
+        """Forget a client's session (its key stops working)"""
+        session_id = self.by_uuid.pop(uuid, None)
+        if session_id is not None:
+            self.sessions.pop(session_id, None)
+    
+    def is_ready(self, uuid):
+        """True if the client has been heard from over UDP recently"""
+        session = self.sessions.get(self.by_uuid.get(uuid))
+        return bool(session and session['addr'] and
+                    time.time() - session['last_seen'] < udp_media.LIVENESS_TIMEOUT)
+    
+    def datagram_received(self, data, addr):
+        if len(data) < udp_media.HEADER.size:
+            return
+        session = self.sessions.get(udp_media.peek_session_id(data))
+        if not session:
+            self.stats['unknown_session'] += 1
+            return
+        frame = session['cipher'].open(udp_media.TO_SERVER, data)
+        if frame is None:
+            self.stats['rejected'] += 1
+            return
+        
+        # Only authenticated packets may move the session's address
+        self.stats['packets_in'] += 1
+        session['addr'] = addr
+        session['last_seen'] = time.time()
+        
+        kind, timestamp, rate, pcm = frame
+        if kind == udp_media.KIND_PROBE:
+            self.send(session, udp_media.KIND_PROBE, timestamp)
+            return
+        if kind not in self.CLIENT_FRAMES:
+            self.stats['rejected'] += 1
+            return
+        try:
+            self.inbound.put_nowait((session['uuid'], kind, timestamp, rate, pcm))
+        except asyncio.QueueFull:
+            self.stats['queue_drops'] += 1
+    
+    async def forward_loop(self):
+        """Route decrypted client frames in the order they arrived"""
+        while True:
+            uuid, kind, timestamp, rate, pcm = await self.inbound.get()
+            try:
+                self.server.traffic['frames_in'] += 1
+                await self.server.route_client_frame(uuid, {
+                    **self.CLIENT_FRAMES[kind],
+                    'uuid': uuid,
+                    'audio': b64encode(pcm).decode('utf-8'),
+                    'rate': rate,
+                    'timestamp': timestamp
+                })
+            except Exception as e:
+                self.server.logger.log_error(f"UDP relay error for {uuid}: {e}")
+    
+    def send(self, session, kind, timestamp, rate=0, pcm=b''):
+        """Seal and send one frame to a session's last known address"""
+        if self.transport and session['addr']:
+            self.transport.sendto(session['cipher'].seal(udp_media.FROM_SERVER, kind, timestamp, rate, pcm),
+                                  session['addr'])
+            self.stats['packets_out'] += 1
+    
+    def send_to_client(self, uuid, kind, timestamp, rate, pcm):
+        """Send a frame to a client over UDP; False if its path is not up"""
+        if not self.is_ready(uuid):
+            return False
+        session = self.sessions[self.by_uuid[uuid]]
+        for slice_timestamp, piece in udp_media.frame_slices(kind, timestamp, rate, pcm):
+            self.send(session, kind, slice_timestamp, rate, piece)
+        return True
+    
+    def get_stats(self):
+        """Relay counters plus per-session loss/rejection totals"""
+        return {
+            **self.stats,
+            'sessions': len(self.sessions),
+            'lost': sum(s['cipher'].lost for s in self.sessions.values())
+        }
+
+class TranscodePool:
+    """Converts audio between codecs and sample rates for peers that differ
+    
+    Each peer says which codecs it accepts and the highest rate it wants
+    when it connects; frames a peer can take as they are pass straight
+    through. The rest are queued on a lane picked by UUID, so one stream's
+    frames stay in order and its resampler state is never used by two
+    workers at once. Each lane hands up to batch_size frames at a time to a
+    thread or process pool, keeping the decode/resample/encode work off the
+    event loop. With workers=0 batches run inline on the loop instead.
+    """
+    def __init__(self, workers=2, processes=False, batch_size=16, lane_queue=128, logger=None):
+        self.workers = workers
+        self.processes = processes
+        self.batch_size = batch_size
+        self.lane_queue = lane_queue
+        self.logger = logger
+        self.executor = None   # created with the lanes, on first use
+        self.lanes = []
+        self.tasks = []
+        self.states = {}       # uuid -> {(uuid, stream): resampler state}
+        self.started_at = time.time()
+        self.stats = {'passthrough': 0, 'frames': 0, 'batches': 0, 'queue_drops': 0,
+                      'errors': 0, 'cost_ns': 0, 'max_cost_ns': 0, 'busy_seconds': 0.0}
+    
+    @staticmethod
+    def plan(frame, caps):
+        """(codec, rate) a frame has to become for a peer, or None if it fits
         
+        Frames in a codec the server does not know pass through as they are.
+        """
+        codec = frame.get('codec', 'pcm16')
+        if not frame.get('audio') or codec not in CODECS:
+            return None
+        codecs, max_rate = caps
+        rate = frame.get('rate', 22050)
+        to_codec = codec if codec in codecs else codecs[0]
+        to_rate = min(rate, max_rate) if max_rate else rate
+        if to_codec == codec and to_rate == rate:
+            return None
+        return to_codec, to_rate
+    
+    def needs_work(self, frames, caps):
+        """True if any frame has to be converted for a peer with these caps"""
+        if any(self.plan(frame, caps) for frame in frames):
+            return True
+        self.stats['passthrough'] += len(frames)
+        return False
+    
+    def start(self):
+        """Create the pool and one lane task per worker"""
+        if self.workers:
+            pool = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+            self.executor = pool(max_workers=self.workers)
+        for _ in range(max(self.workers, 1)):
+            lane = asyncio.Queue(maxsize=self.lane_queue)
+            self.lanes.append(lane)
+            task = asyncio.create_task(self.lane_loop(lane))
+            task.add_done_callback(self.lane_done)
+            self.tasks.append(task)
+    
+    def log_exception(self, message, exc_info=True):
+        if self.logger:
+            self.logger.log_exception(message, exc_info)
+        else:
+            print(f"⚠ {message}")
+    
+    def lane_done(self, task):
+        """A lane only ends on shutdown; anything else is a crash worth a traceback"""
+        if not task.cancelled() and task.exception():
+            self.log_exception(f"Transcode lane crashed: {task.exception()}", task.exception())
+    
+    def submit(self, uuid, frames, caps, deliver):
+        """Queue frames for conversion; deliver(frames) is awaited with the result
+        
+        Never blocks - when a lane is full the frames are dropped, like any
+        other late audio.
+        """
+        if not self.lanes:
+            self.start()
+        try:
+            self.lanes[hash(uuid) % len(self.lanes)].put_nowait((uuid, frames, caps, deliver))
+        except asyncio.QueueFull:
+            self.stats['queue_drops'] += len(frames)
+    
+    def forget(self, uuid):
+        """Drop a session's resampler states (batches in flight keep theirs)"""
+        self.states.pop(uuid, None)
+    
+    async def lane_loop(self, lane):
+        """Convert queued frames a batch at a time and deliver them in order"""
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await lane.get()]
+            count = len(jobs[0][1])
+            while count < self.batch_size and not lane.empty():
+                jobs.append(lane.get_nowait())
+                count += len(jobs[-1][1])
+            
+            work = []
+            states = {}
+            caches = {}
+            for uuid, frames, caps, _ in jobs:
+                cache = caches[uuid] = self.states.setdefault(uuid, {})
+                for frame in frames:
+                    target = self.plan(frame, caps)
+                    if not target:
+                        continue
+                    key = (uuid, frame.get('type'))
+                    if key in cache:
+                        states[key] = cache[key]
+                    work.append((key, frame['audio'], frame.get('codec', 'pcm16'),
+                                 frame.get('rate', 22050), frame.get('channels', 1)) + target)
+            
+            start = time.perf_counter()
+            try:
+                if self.executor:
+                    audio, states, costs = await loop.run_in_executor(self.executor, transcode_batch, work, states)
+                else:
+                    audio, states, costs = transcode_batch(work, states)
+            except Exception as e:
+                self.stats['errors'] += len(work)
+                self.log_exception(f"Transcode batch failed: {e}")
+                continue
+            self.stats['busy_seconds'] += time.perf_counter() - start
+            self.stats['batches'] += 1
+            self.stats['frames'] += len(work)
+            self.stats['cost_ns'] += sum(costs)
+            self.stats['max_cost_ns'] = max(self.stats['max_cost_ns'], max(costs))
+            
+            # A session that ended while the batch ran must not be brought back
+            for uuid, cache in caches.items():
+                if self.states.get(uuid) is cache:
+                    cache.update((key, state) for key, state in states.items() if key[0] == uuid)
+            
+            converted = iter(zip(work, audio))
+            for uuid, frames, caps, deliver in jobs:
+                out = []
+                for frame in frames:
+                    if not self.plan(frame, caps):
+                        out.append(frame)
+                        continue
+                    (_, _, _, _, _, codec, rate), frame_audio = next(converted)
+                    out.append({**frame, 'audio': frame_audio, 'codec': codec, 'rate': rate})
+                try:
+                    await deliver(out)
+                except Exception as e:
+                    self.log_exception(f"Transcoded frame delivery failed for {uuid}: {e}")
+    
+    def get_stats(self):
+        """Per-frame cost and pool load, for sizing the pool"""
+        frames = self.stats['frames']
+        batches = self.stats['batches']
+        elapsed = max(time.time() - self.started_at, 1e-9)
         return {
-            'audio_client_connected': client is not None,
-            'audio_viewer_connected': viewer is not None,
-            'client_ip': client['ip'] if client else None,
-            'viewer_ip': viewer['ip'] if viewer else None,
-            'call_mode': self.get_call_mode(uuid),
-            'system_audio_count': stats.get('system_audio', 0),
-            'mic_audio_count': stats.get('mic_audio', 0),
-            'uptime': time.time() - client['connected_at'] if client else 0
+            'workers': self.workers,
+            'mode': 'process' if self.processes else 'thread' if self.workers else 'inline',
+            'passthrough': self.stats['passthrough'],
+            'frames': frames,
+            'batches': batches,
+            'avg_batch': round(frames / batches, 2) if batches else 0,
+            'us_per_frame': round(self.stats['cost_ns'] / frames / 1000, 1) if frames else 0,
+            'max_us': round(self.stats['max_cost_ns'] / 1000, 1),
+            'busy_pct': round(100 * self.stats['busy_seconds'] / (elapsed * max(self.workers, 1)), 2),
+            'queued': sum(lane.qsize() for lane in self.lanes),
+            'queue_drops': self.stats['queue_drops'],
+            'errors': self.stats['errors'],
+            'sessions': len(self.states)
         }
+    
+    def close(self):
+        """Stop the lanes and the pool; queued frames are dropped"""
+        for task in self.tasks:
+            task.cancel()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+class EventLoopMonitor:
+    """Measures how late the event loop wakes up from a fixed sleep
+    
+    Any callback that runs too long - JSON, base64, transcoding done
+    inline - delays every other socket, and shows up here as lag.
+    """
+    def __init__(self, interval=0.05, window=1200, stall_ms=10):
+        self.interval = interval
+        self.stall_ms = stall_ms
+        self.lags = deque(maxlen=window)   # seconds late, most recent last
+        self.stalls = 0
+        self.stall_seconds = 0.0
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self.lags.append(lag)
+            if lag * 1000 > self.stall_ms:
+                self.stalls += 1
+                self.stall_seconds += lag
+    
+    def get_stats(self):
+        """Lag percentiles over the recent window, in milliseconds"""
+        lags = sorted(self.lags)
+        pick = lambda q: round(lags[min(int(q * len(lags)), len(lags) - 1)] * 1000, 2) if lags else 0
+        return {
+            'lag_p50_ms': pick(0.5),
+            'lag_p99_ms': pick(0.99),
+            'lag_max_ms': round(lags[-1] * 1000, 2) if lags else 0,
+            'stalls': self.stalls,
+            'stall_seconds': round(self.stall_seconds, 3)
+        }
+
+class ProxyProtocolSite(web.SockSite):
+    """A SockSite whose connections start with a PROXY protocol header
+    
+    For a TLS-terminating proxy in front of the server: the client address
+    from the header becomes each request's remote address.
+    """
+    def __init__(self, runner, sock, on_error=None, **kwargs):
+        super().__init__(runner, sock, **kwargs)
+        self.on_error = on_error
+    
+    async def start(self):
+        await web.BaseSite.start(self)
+        loop = asyncio.get_running_loop()
+        handler = self._runner.server
+        self._server = await loop.create_server(
+            lambda: proxy_protocol.ProxyProtocolListener(handler(), self.on_error),
+            sock=self._sock, ssl=self._ssl_context, backlog=self._backlog)
 
 class AudioOnlyServer:
-    def __init__(self):
+    # Command line options that pass sockets to a restarted process
+    HANDOFF_FLAGS = ('--listen-fd', '--udp-fd', '--handoff-fd')
+    
+    def __init__(self, resume_window=60, record_dir=None, udp_port=None, status_interval=5,
+                 transcode_workers=2, transcode_processes=False, admission=None, idle_timeout=90,
+                 max_message_bytes=1024 * 1024, trace=None, codec='auto', wall_interval=0.5,
+                 wall_max_selected=4, quality_minutes=30, quality_dir='call_quality'):
         self.logger = AudioCallLogger()
         self.uuid_validator = UUIDValidator()
-        self.call_manager = AudioCallManager()
+        self.call_manager = AudioCallManager(resume_window=resume_window)
+        self.record_dir = record_dir
+        self.recorders = {}  # uuid -> CallRecorder (only when recording is enabled)
+        
+        # Viewer congestion: above this socket send backlog, background audio
+        # is shed and both ends are told (at most once per second)
+        self.viewer_buffer_limit = 64 * 1024
+        
+        # Traffic counters for /api/server_stats (messages vs audio frames,
+        # so coalescing shows up as fewer messages for the same frames)
+        self.started_at = time.time()
+        self.traffic = {'messages_in': 0, 'frames_in': 0, 'messages_out': 0, 'frames_out': 0}
+        self.tls = {'connections': 0, 'resumed': 0}   # WebSocket connections we terminated TLS for
+        
+        # Optional encrypted UDP media path (started in start_server)
+        self.udp_port = udp_port
+        self.udp_relay = None
+        
+        # Control message parsing/validation and serialization (json, orjson or msgspec)
+        self.codec = create_message_codec(codec)
+        
+        # Status deltas and session snapshot for dashboards
+        self.status_feed = StatusFeed(self.call_manager, self.codec, stats_interval=status_interval)
+        
+        # Per-second quality time series of each session, saved when it ends
+        self.quality_history = QualityHistory(self.call_manager, minutes=quality_minutes,
+                                              history_dir=quality_dir, logger=self.logger)
+        
+        # Codec/rate conversion between peers that differ, and the loop lag
+        # it (or anything else) causes
+        self.transcoder = TranscodePool(workers=transcode_workers, processes=transcode_processes,
+                                        logger=self.logger)
+        self.loop_monitor = EventLoopMonitor()
+        
+        # Connection caps, rate limits and the idle reaper
+        self.admission = admission or AdmissionControl()
+        self.idle_timeout = idle_timeout     # seconds without a message before a peer is dropped (0 = never)
+        self.max_message_bytes = max_message_bytes
+        
+        # Optional record of incoming traffic for replay benchmarks (TrafficTrace)
+        self.trace = trace
+        
+        # Monitoring walls: many clients' levels on one viewer socket
+        self.wall = MonitoringWall(self.call_manager, self.codec, level_interval=wall_interval,
+                                   max_selected=wall_max_selected)
+        
+        # Graceful restart hands the listening socket to a new process
+        self.listen_sock = None
+        self.site = None
+        self.stopping = None     # resolved once the calls have been handed over
+        self.restarting = False
         self.app = web.Application()
         self.setup_routes()
     
@@ -193,8 +1473,14 @@ class AudioOnlyServer:
         self.app.router.add_get('/land.html', self.serve_landing_page)
         self.app.router.add_get('/view.html', self.serve_audio_viewer)
         self.app.router.add_get('/audio_call.html', self.serve_audio_viewer)
+        self.app.router.add_get('/wall.html', self.serve_wall)
         self.app.router.add_get('/api/status/{uuid}', self.api_connection_status)
-        self.app.router.add_static('/', path='static', name='static')
+        self.app.router.add_get('/api/server_stats', self.api_server_stats)
+        self.app.router.add_get('/api/sessions', self.api_sessions)
+        self.app.router.add_get('/api/status_feed', self.api_status_feed)
+        self.app.router.add_get('/api/quality/{uuid}', self.api_quality_history)
+        if Path('static').is_dir():
+            self.app.router.add_static('/', path='static', name='static')
     
     async def serve_landing_page(self, request):
         try:
@@ -213,32 +1499,391 @@ class AudioOnlyServer:
         except FileNotFoundError:
             return web.Response(text="view.html not found - Please save the Audio-Only Remote Call Viewer as 'view.html'", status=404)
     
+    async def serve_wall(self, request):
+        try:
+            async with aiofiles.open('wall.html', 'rb') as f:
+                content = await f.read()
+            return web.Response(body=content, content_type='text/html')
+        except FileNotFoundError:
+            return web.Response(text="wall.html not found", status=404)
+    
     async def api_connection_status(self, request):
         """API endpoint for connection status"""
         uuid = request.match_info['uuid']
         status = self.call_manager.get_connection_status(uuid)
-        return web.json_response(status)
+        return web.json_response(status, dumps=self.codec.encode)
+    
+    async def api_quality_history(self, request):
+        """API endpoint for a session's per-second quality samples over the last N minutes"""
+        uuid = request.match_info['uuid']
+        try:
+            minutes = float(request.query.get('minutes', 5))
+        except ValueError:
+            return web.json_response({'error': 'minutes must be a number'}, status=400)
+        if not self.call_manager.get_session(uuid) and not self.uuid_validator.is_allowed(uuid):
+            return web.json_response({'error': 'unknown uuid'}, status=404)
+        history = self.quality_history.query(uuid, minutes)
+        if history is None:
+            return web.json_response({'error': 'no quality history for this uuid'}, status=404)
+        return web.json_response(history, dumps=self.codec.encode)
+    
+    async def api_sessions(self, request):
+        """API endpoint for all session statuses, paginated by UUID cursor"""
+        try:
+            limit = min(max(int(request.query.get('limit', 100)), 1), 1000)
+        except ValueError:
+            return web.json_response({'error': 'limit must be an integer'}, status=400)
+        return web.json_response(self.status_feed.page(request.query.get('after'), limit), dumps=self.codec.encode)
+    
+    async def api_status_feed(self, request):
+        """Server-sent events stream of session status deltas
+        
+        Load the snapshot from /api/sessions first, then apply the deltas
+        with a version above the snapshot's. Browsers reconnect on their own
+        and send Last-Event-ID, so missed deltas are replayed when possible.
+        """
+        last_id = request.headers.get('Last-Event-ID') or request.query.get('since')
+        try:
+            last_version = int(last_id) if last_id else None
+        except ValueError:
+            last_version = None
+        
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache'
+        })
+        await response.prepare(request)
+        watcher = self.status_feed.subscribe(last_version)
+        try:
+            await response.write(f"event: hello\ndata: {self.codec.encode({'version': self.status_feed.version})}\n\n".encode('utf-8'))
+            while True:
+                try:
+                    encoded = await asyncio.wait_for(watcher.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    encoded = b': keepalive\n\n'  # keeps proxies from closing an idle stream
+                await response.write(encoded)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.status_feed.unsubscribe(watcher)
+        return response
+    
+    async def api_server_stats(self, request):
+        """API endpoint for server-wide traffic and CPU counters"""
+        clients, viewers = self.call_manager.count_connections()
+        return web.json_response({
+            'pid': os.getpid(),
+            'uptime': time.time() - self.started_at,
+            'cpu_seconds': time.process_time(),
+            'audio_clients': clients,
+            'audio_viewers': viewers,
+            **self.traffic,
+            'status_watchers': len(self.status_feed.watchers),
+            'status_version': self.status_feed.version,
+            'udp': self.udp_relay.get_stats() if self.udp_relay else None,
+            'tls': self.tls,
+            'admission': self.admission.get_stats(),
+            'trace': self.trace.get_stats() if self.trace else None,
+            'wall': self.wall.get_stats(),
+            'quality_history': self.quality_history.get_stats(),
+            'transcode': self.transcoder.get_stats(),
+            'event_loop': self.loop_monitor.get_stats(),
+            'runtime': {'loop': type(asyncio.get_running_loop()).__module__.split('.')[0], 'codec': self.codec.name}
+        }, dumps=self.codec.encode)
+    
+    async def notify_viewer(self, uuid, message):
+        """Send a status message to the viewer of a UUID, if any"""
+        session = self.call_manager.get_session(uuid)
+        if session and session.viewer_ws:
+            try:
+                await session.viewer_ws.send_str(self.codec.encode(message))
+            except Exception as e:
+                self.logger.log_error(f"Failed to notify viewer {uuid}: {e}")
+    
+    async def route_client_frame(self, uuid, data, message=None):
+        """Route one client audio frame to the viewer by call mode
+        
+        Used for frames from the WebSocket and from the UDP relay; message is
+        the already-serialized frame if there is one. Frames the viewer
+        cannot take as they are go through the transcoder first.
+        """
+        # Forward client audio in listen + both modes
+        session = self.call_manager.get_session(uuid)
+        if not session:
+            return
+        session.client_seen = time.time()   # UDP frames keep the client alive too
+        self.quality_history.count_frames(session, (data,))
+        if uuid in self.wall.watching:
+            await self.wall.client_frames(session, [data], message)
+        if not session.to_viewer or not session.viewer_ws:
+            return
+        if self.transcoder.needs_work([data], session.viewer_caps):
+            self.transcoder.submit(uuid, [data], session.viewer_caps,
+                                   lambda frames: self.deliver_to_viewer(uuid, frames))
+            return
+        await self.send_client_frame(session, data, message)
+    
+    async def deliver_to_viewer(self, uuid, frames):
+        """Forward transcoded client frames, if the viewer is still listening"""
+        session = self.call_manager.get_session(uuid)
+        if not session or not session.to_viewer or not session.viewer_ws:
+            return
+        if len(frames) == 1:
+            await self.send_client_frame(session, frames[0])
+        else:
+            await self.send_client_batch(session, frames)
+    
+    async def send_client_frame(self, session, data, message=None):
+        """Send one client frame the viewer can play to the viewer"""
+        message = message or self.codec.encode(data)
+        if data.get('type') == 'client_system_audio':
+            # Background audio is the first to go when the viewer lags
+            if await self.forward_to_viewer(session, message, droppable=True):
+                self.account_client_frame(session, data)
+        else:
+            await self.forward_to_viewer(session, message)
+            self.account_client_frame(session, data)
+            if data.get('type') == 'client_microphone_audio':
+                print(f"🎤 Forwarded client microphone to viewer (mode: {session.call_mode})")
+    
+    def account_client_frame(self, session, frame):
+        """Count and record one client frame that reached the viewer"""
+        frame_type = frame.get('type')
+        if frame_type == 'client_system_audio':
+            session.system_audio += 1
+            self.record_frame(session.uuid, 'system', frame)
+        elif frame_type == 'client_combined_audio':
+            # One frame carries both sources
+            session.system_audio += 1
+            session.mic_audio += 1
+            self.record_frame(session.uuid, 'client_mix', frame)
+        else:
+            session.mic_audio += 1
+            self.record_frame(session.uuid, 'client_mic', frame)
+    
+    async def route_viewer_frames(self, uuid, frames, message=None):
+        """Route viewer microphone frames to the client in talk + both modes
+        
+        message is the already-serialized frame or batch if there is one.
+        """
+        session = self.call_manager.get_session(uuid)
+        if not session:
+            return
+        self.quality_history.count_viewer_frames(session, frames)
+        if not session.to_client or not session.client_ws:
+            return
+        if self.transcoder.needs_work(frames, session.client_caps):
+            self.transcoder.submit(uuid, frames, session.client_caps,
+                                   lambda converted: self.deliver_to_client(uuid, converted))
+            return
+        await self.send_viewer_frames(session, frames, message)
+    
+    async def deliver_to_client(self, uuid, frames):
+        """Forward transcoded viewer frames, if the client is still listening"""
+        session = self.call_manager.get_session(uuid)
+        if session and session.to_client and session.client_ws:
+            await self.send_viewer_frames(session, frames)
+    
+    async def send_viewer_frames(self, session, frames, message=None):
+        """Send viewer frames the client can play, preferring its UDP path"""
+        uuid = session.uuid
+        if self.udp_relay and self.udp_relay.is_ready(uuid) and \
+                all(frame.get('codec', 'pcm16') == 'pcm16' for frame in frames):
+            for frame in frames:
+                self.send_viewer_audio_udp(uuid, frame)
+        else:
+            if not message:
+                message = self.codec.encode(frames[0] if len(frames) == 1 else
+                                     {'type': 'audio_batch', 'uuid': uuid, 'frames': frames})
+            await session.client_ws.send_str(message)
+        self.count_forwarded(len(frames))
+        for frame in frames:
+            self.record_frame(uuid, 'viewer_mic', frame)
+    
+    def send_viewer_audio_udp(self, uuid, frame):
+        """Send a viewer audio frame over the client's UDP path, if it is up"""
+        if not self.udp_relay or not frame.get('audio'):
+            return False
+        return self.udp_relay.send_to_client(uuid, udp_media.KIND_VIEWER, time.time(),
+                                             frame.get('rate', 22050), b64decode(frame['audio']))
+    
+    async def forward_to_viewer(self, session, message, droppable=False):
+        """Forward a message to a session's viewer, shedding load when it falls behind
+        
+        Returns False if a droppable frame was skipped because the viewer's
+        socket backlog is over the limit.
+        """
+        backlog = self.viewer_backlog(session)
+        if backlog > self.viewer_buffer_limit:
+            await self.signal_congestion(session, backlog)
+            if droppable:
+                session.viewer_dropped_frames += 1
+                return False
+        
+        await session.viewer_ws.send_str(message)
+        self.count_forwarded(1)
+        return True
+    
+    def viewer_backlog(self, session):
+        """Bytes waiting in the viewer's socket send buffer"""
+        transport = session.viewer_transport
+        return transport.get_write_buffer_size() if transport else 0
+    
+    def count_forwarded(self, frames):
+        """Count one outgoing message carrying some audio frames"""
+        self.traffic['messages_out'] += 1
+        self.traffic['frames_out'] += frames
+    
+    async def forward_batch(self, uuid, connection_type, frames, message):
+        """Route a coalesced audio batch with the same rules as single frames
+        
+        The batch is forwarded as the same message, without splitting it. It
+        is only rebuilt when congestion sheds the system audio frames in it,
+        or when the receiving peer needs its frames transcoded.
+        """
+        if not frames:
+            return
+        if connection_type == 'audio_viewer':
+            # Viewer's microphone -> client
+            await self.route_viewer_frames(uuid, frames, message)
+            return
+        
+        # Client's system audio and microphone -> viewer (and monitoring walls)
+        session = self.call_manager.get_session(uuid)
+        if session:
+            self.quality_history.count_frames(session, frames)
+        if session and uuid in self.wall.watching:
+            await self.wall.client_frames(session, frames, message)
+        if not session or not session.to_viewer or not session.viewer_ws:
+            return
+        if self.transcoder.needs_work(frames, session.viewer_caps):
+            self.transcoder.submit(uuid, frames, session.viewer_caps,
+                                   lambda converted: self.deliver_to_viewer(uuid, converted))
+            return
+        await self.send_client_batch(session, frames, message)
+    
+    async def send_client_batch(self, session, frames, message=None):
+        """Send client frames the viewer can play to the viewer as one batch"""
+        uuid = session.uuid
+        backlog = self.viewer_backlog(session)
+        if backlog > self.viewer_buffer_limit:
+            await self.signal_congestion(session, backlog)
+            kept = [f for f in frames if f.get('type') != 'client_system_audio']
+            session.viewer_dropped_frames += len(frames) - len(kept)
+            if not kept:
+                return
+            if len(kept) != len(frames):
+                frames = kept
+                message = None
+        
+        message = message or self.codec.encode({'type': 'audio_batch', 'uuid': uuid, 'frames': frames})
+        await session.viewer_ws.send_str(message)
+        self.count_forwarded(len(frames))
+        for frame in frames:
+            self.account_client_frame(session, frame)
+    
+    async def signal_congestion(self, session, backlog):
+        """Tell the viewer and the client that the viewer link is congested"""
+        now = time.time()
+        if now - session.last_congestion_signal < 1:
+            return
+        session.last_congestion_signal = now
+        session.viewer_congestion_events += 1
+        
+        message = self.codec.encode({
+            'type': 'congestion',
+            'direction': 'to_viewer',
+            'backlog_bytes': backlog,
+            'dropped_frames': session.viewer_dropped_frames
+        })
+        await session.viewer_ws.send_str(message)
+        if session.client_ws:
+            await session.client_ws.send_str(message)
+    
+    def record_frame(self, uuid, track, data):
+        """Hand a forwarded frame to the session recorder, if recording"""
+        recorder = self.recorders.get(uuid)
+        if recorder and data.get('audio') and data.get('codec', 'pcm16') in CODECS:
+            recorder.record(track, data['audio'], data.get('rate', 22050), data.get('channels', 1),
+                            data.get('codec', 'pcm16'))
+    
+    def stop_recording(self, uuid):
+        """Close the session recorder - the writer finishes in the background"""
+        recorder = self.recorders.pop(uuid, None)
+        if recorder:
+            recorder.close()
+            self.logger.log_recording_saved(uuid, recorder.session_dir,
+                                            recorder.recorded_frames, recorder.dropped_frames)
     
     async def websocket_handler(self, request):
         """Handle WebSocket connections - Audio Only"""
-        ws = web.WebSocketResponse(heartbeat=30)
-        await ws.prepare(request)
-        
         client_ip = request.remote
+        refused = self.admission.admit(client_ip)
+        if refused:
+            # Turned away before the upgrade, when it costs almost nothing
+            return web.Response(status=503, text=refused, headers={'Retry-After': '5'})
+        
+        ws = web.WebSocketResponse(heartbeat=30, max_msg_size=self.max_message_bytes)
+        try:
+            await ws.prepare(request)
+        except Exception:
+            self.admission.release(client_ip)
+            raise
+        
+        # How many reconnects skipped the full handshake thanks to tickets
+        ssl_object = request.transport.get_extra_info('ssl_object') if request.transport else None
+        if ssl_object:
+            self.tls['connections'] += 1
+            self.tls['resumed'] += ssl_object.session_reused
+        
         connection_type = None
         uuid = None
+        client_uuid = None   # the uuid this socket connected as an audio client
+        wall = None
+        trace_id = self.trace.open() if self.trace else None
+        
+        def handshake_expired():
+            # Sockets that never say who they are would otherwise sit here forever
+            if connection_type is None:
+                self.admission.stats['handshake_timeouts'] += 1
+                asyncio.create_task(ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b'No connect message'))
+        handshake_deadline = asyncio.get_running_loop().call_later(self.admission.handshake_timeout,
+                                                                   handshake_expired)
+        buckets = self.admission.connection_buckets()
         
         try:
             async for msg in ws:
+                if msg.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+                    verdict = self.admission.check(client_ip, buckets, len(msg.data))
+                    if verdict == 'close':
+                        await ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b'Rate limit exceeded')
+                        break
+                    if verdict == 'drop':
+                        continue
+                
                 if msg.type == WSMsgType.TEXT:
+                    self.traffic['messages_in'] += 1
+                    if connection_type == 'audio_client':
+                        self.call_manager.touch_client(uuid)
+                    elif connection_type == 'audio_viewer':
+                        self.call_manager.touch_viewer(uuid)
                     try:
-                        data = json.loads(msg.data)
+                        data = self.codec.decode(msg.data)
                         msg_type = data.get('type')
+                        if trace_id:
+                            try:
+                                self.trace.message(trace_id, data, msg.data)
+                            except Exception as e:   # tracing must never break forwarding
+                                self.logger.log_error(f"Traffic trace error: {e}")
+                        
+                        if connection_type is None and msg_type not in CONNECT_TYPES:
+                            self.admission.stats['before_connect'] += 1
+                            raise MessageError(f"'{msg_type}' before connect")
                         
                         if msg_type == 'audio_client_connect':
                             uuid = data.get('uuid')
                             if not self.uuid_validator.is_allowed(uuid):
-                                await ws.send_str(json.dumps({
+                                await ws.send_str(self.codec.encode({
                                     'type': 'error',
                                     'message': 'UUID not authorized for audio calls'
                                 }))
@@ -246,18 +1891,39 @@ class AudioOnlyServer:
                                 break
                             
                             connection_type = 'audio_client'
-                            self.call_manager.add_audio_client(uuid, ws, client_ip)
+                            client_uuid = uuid
+                            resumed_mode = self.call_manager.resume_call(uuid, data.get('resume_token'))
+                            session = self.call_manager.add_audio_client(uuid, ws, client_ip)
+                            session.client_caps = peer_caps(data)
                             self.logger.log_client_connect(uuid, client_ip)
                             
-                            await ws.send_str(json.dumps({
+                            if self.record_dir and uuid not in self.recorders:
+                                self.recorders[uuid] = CallRecorder(self.record_dir, uuid)
+                            
+                            if resumed_mode:
+                                self.call_manager.set_call_mode(uuid, resumed_mode)
+                                self.logger.log_client_resume(uuid, client_ip, resumed_mode)
+                            
+                            await ws.send_str(self.codec.encode({
                                 'type': 'connected',
-                                'message': 'Audio client connected successfully'
+                                'message': 'Audio client connected successfully',
+                                'resume_token': self.call_manager.issue_resume_token(uuid),
+                                'resumed': resumed_mode is not None,
+                                'call_mode': self.call_manager.get_call_mode(uuid)
                             }))
+                            
+                            # Let the viewer know its client is back
+                            await self.notify_viewer(uuid, {
+                                'type': 'client_status',
+                                'connected': True,
+                                'resumed': resumed_mode is not None,
+                                'call_mode': self.call_manager.get_call_mode(uuid)
+                            })
                         
                         elif msg_type == 'audio_viewer_connect':
                             uuid = data.get('uuid')
                             if not self.uuid_validator.is_allowed(uuid):
-                                await ws.send_str(json.dumps({
+                                await ws.send_str(self.codec.encode({
                                     'type': 'error',
                                     'message': 'UUID not authorized for audio calls'
                                 }))
@@ -265,83 +1931,132 @@ class AudioOnlyServer:
                                 break
                             
                             connection_type = 'audio_viewer'
-                            self.call_manager.add_audio_viewer(uuid, ws, client_ip)
+                            session = self.call_manager.add_audio_viewer(uuid, ws, client_ip, request.transport)
+                            session.viewer_caps = peer_caps(data)
                             self.logger.log_viewer_connect(uuid, client_ip)
                             
-                            await ws.send_str(json.dumps({
+                            await ws.send_str(self.codec.encode({
                                 'type': 'connected',
                                 'message': 'Audio viewer connected successfully'
                             }))
                         
-                        elif msg_type == 'client_system_audio':
-                            # Client's system audio (Zoom, music, etc.) -> Forward to viewer
-                            uuid = data.get('uuid')
-                            call_mode = self.call_manager.get_call_mode(uuid)
+                        elif msg_type == 'wall_connect':
+                            # One viewer socket watching many clients (wall.html)
+                            uuids = [u for u in data['uuids'] if isinstance(u, str)]
+                            allowed = [u for u in uuids if self.uuid_validator.is_allowed(u)]
+                            if not allowed:
+                                await ws.send_str(self.codec.encode({
+                                    'type': 'error',
+                                    'message': 'No UUID authorized for audio calls'
+                                }))
+                                await ws.close()
+                                break
                             
-                            if call_mode in ['listen', 'both']:
-                                viewer = self.call_manager.get_audio_viewer(uuid)
-                                if viewer:
-                                    await viewer['ws'].send_str(msg.data)
-                                    self.call_manager.update_audio_stats(uuid, 'system_audio')
+                            connection_type = 'wall'
+                            wall = self.wall.subscribe(ws, request.transport, allowed,
+                                                       data['selected'], data.get('premix'))
+                            self.logger.log_wall_connect(len(allowed), client_ip)
+                            await ws.send_str(self.codec.encode({
+                                'type': 'connected',
+                                'message': 'Monitoring wall connected successfully',
+                                'rejected': sorted(set(uuids) - set(allowed)),
+                                **self.wall.state(wall)
+                            }))
                         
-                        elif msg_type == 'client_microphone_audio':
-                            # Client's microphone -> Forward to viewer (FIXED ROUTING)
+                        elif msg_type == 'wall_update' and wall:
+                            # Watch other clients, listen to others, or toggle the premix
+                            # Fields are optional here, so they are checked rather than schema-bound
+                            uuids = data.get('uuids')
+                            if isinstance(uuids, list):
+                                uuids = [u for u in uuids if isinstance(u, str) and self.uuid_validator.is_allowed(u)]
+                            else:
+                                uuids = None
+                            self.wall.update(wall, uuids, data.get('selected'), data.get('premix'))
+                            await ws.send_str(self.codec.encode({'type': 'wall_state', **self.wall.state(wall)}))
+                        
+                        elif msg_type in ['client_system_audio', 'client_microphone_audio', 'client_combined_audio']:
+                            # Client's system audio / microphone (or both in one frame) -> Forward to viewer
                             uuid = data.get('uuid')
-                            call_mode = self.call_manager.get_call_mode(uuid)
-                            
-                            # Forward client microphone in BOTH modes (listen + both)
-                            if call_mode in ['listen', 'both']:  # Changed from just 'both'
-                                viewer = self.call_manager.get_audio_viewer(uuid)
-                                if viewer:
-                                    await viewer['ws'].send_str(msg.data)
-                                    self.call_manager.update_audio_stats(uuid, 'mic_audio')
-                                    print(f"🎤 Forwarded client microphone to viewer (mode: {call_mode})")
+                            self.traffic['frames_in'] += 1
+                            await self.route_client_frame(uuid, data, msg.data)
                         
                         elif msg_type == 'viewer_audio':
                             # Viewer's microphone -> Forward to client
                             uuid = data.get('uuid')
-                            call_mode = self.call_manager.get_call_mode(uuid)
-                            
-                            if call_mode in ['talk', 'both']:
-                                client = self.call_manager.get_audio_client(uuid)
-                                if client:
-                                    await client['ws'].send_str(msg.data)
+                            self.traffic['frames_in'] += 1
+                            await self.route_viewer_frames(uuid, [data], msg.data)
+                        
+                        elif msg_type == 'udp_offer':
+                            # Client asks for a UDP media path - hand out a session key
+                            if (connection_type == 'audio_client' and self.udp_relay
+                                    and data.get('uuid') == client_uuid):
+                                session_id, key = self.udp_relay.register(client_uuid)
+                                await ws.send_str(self.codec.encode({
+                                    'type': 'udp_answer',
+                                    'port': self.udp_port,
+                                    'session_id': session_id,
+                                    'key': b64encode(key).decode('utf-8')
+                                }))
+                            else:
+                                await ws.send_str(self.codec.encode({'type': 'udp_unavailable'}))
+                        
+                        elif msg_type == 'audio_batch':
+                            # Coalesced frames from a client or viewer
+                            uuid = data.get('uuid')
+                            frames = data.get('frames') or []
+                            self.traffic['frames_in'] += len(frames)
+                            await self.forward_batch(uuid, connection_type, frames, msg.data)
                         
                         elif msg_type == 'call_mode_change':
                             # Update call mode and forward to client
                             uuid = data.get('uuid')
-                            mode = data.get('mode', 'off')
+                            mode = data['mode']
                             
                             self.call_manager.set_call_mode(uuid, mode)
                             self.logger.log_call_mode_change(uuid, mode)
                             
                             # Forward mode change to client
-                            client = self.call_manager.get_audio_client(uuid)
-                            if client:
-                                await client['ws'].send_str(msg.data)
+                            session = self.call_manager.get_session(uuid)
+                            if session and session.client_ws:
+                                await session.client_ws.send_str(msg.data)
+                        
+                        elif msg_type == 'quality_report':
+                            # Adaptive quality state from the client -> status API + viewer
+                            uuid = data.get('uuid')
+                            self.call_manager.set_quality_report(uuid, data.get('report'))
+                            session = self.call_manager.get_session(uuid)
+                            if session and session.viewer_ws:
+                                await session.viewer_ws.send_str(msg.data)
                         
-                        elif msg_type == 'ping_request':
-                            # Handle ping from viewer to client
+                        elif msg_type in ('ping_request', 'profile_request'):
+                            # Handle ping (or a stage timing request) from viewer to client
                             uuid = data.get('uuid')
-                            client = self.call_manager.get_audio_client(uuid)
-                            if client:
-                                await client['ws'].send_str(msg.data)
+                            session = self.call_manager.get_session(uuid)
+                            if session and session.client_ws:
+                                await session.client_ws.send_str(msg.data)
                         
                         elif msg_type == 'ping_response':
                             # Handle ping response from client to viewer
                             uuid = data.get('uuid')
-                            viewer = self.call_manager.get_audio_viewer(uuid)
-                            if viewer:
-                                await viewer['ws'].send_str(msg.data)
+                            session = self.call_manager.get_session(uuid)
+                            if session and session.viewer_ws:
+                                await session.viewer_ws.send_str(msg.data)
                             
                             self.call_manager.update_ping(uuid)
                         
+                        elif msg_type == 'profile_report':
+                            # Client pipeline stage timings -> viewer that asked
+                            uuid = data.get('uuid')
+                            session = self.call_manager.get_session(uuid)
+                            if session and session.viewer_ws:
+                                await session.viewer_ws.send_str(msg.data)
+                        
                         elif msg_type == 'disconnect':
                             print(f"📞 Call ended for UUID: {uuid}")
                             break
                     
-                    except json.JSONDecodeError:
-                        self.logger.log_error(f"Invalid JSON from {client_ip}")
+                    except MessageError as e:
+                        self.logger.log_error(f"Invalid message from {client_ip}: {e}")
                         continue
                 
                 elif msg.type == WSMsgType.ERROR:
@@ -352,34 +2067,222 @@ class AudioOnlyServer:
         
         finally:
             # Clean up connection
+            handshake_deadline.cancel()
+            self.admission.release(client_ip)
+            if trace_id:
+                self.trace.close_connection(trace_id)
             if connection_type == 'audio_client' and uuid:
                 # Log final audio stats
-                stats = self.call_manager.audio_stats.get(uuid, {})
-                self.logger.log_audio_stats(
-                    uuid, 
-                    stats.get('system_audio', 0), 
-                    stats.get('mic_audio', 0)
-                )
+                status = self.call_manager.get_connection_status(uuid)
                 
-                self.call_manager.remove_audio_client(uuid)
+                # A reconnected client may already own this UUID
+                if self.call_manager.remove_audio_client(uuid, ws):
+                    self.logger.log_audio_stats(
+                        uuid, 
+                        status['system_audio_count'], 
+                        status['mic_audio_count']
+                    )
+                    await self.notify_viewer(uuid, {
+                        'type': 'client_status',
+                        'connected': False
+                    })
+                    self.stop_recording(uuid)
+                    self.transcoder.forget(uuid)
+                    if self.udp_relay:
+                        self.udp_relay.unregister(uuid)
                 self.logger.log_client_disconnect(uuid, client_ip)
                 
             elif connection_type == 'audio_viewer' and uuid:
-                self.call_manager.remove_audio_viewer(uuid)
+                self.call_manager.remove_audio_viewer(uuid, ws)
                 self.logger.log_viewer_disconnect(uuid, client_ip)
+            
+            elif connection_type == 'wall':
+                self.wall.unsubscribe(ws)
+                self.logger.log_wall_disconnect(len(wall.uuids), client_ip)
         
         return ws
     
-    def create_ssl_context(self, cert_file, key_file):
-        """Create SSL context for HTTPS/WSS"""
+    async def reap_idle_peers(self):
+        """Close clients and viewers that sent nothing for idle_timeout seconds
+        
+        Live peers send media, pings or quality reports every few seconds;
+        one that has gone quiet is stuck or gone, and closing it frees its
+        session without waiting for the heartbeat to give up.
+        """
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 4, 10))
+            cutoff = time.time() - self.idle_timeout
+            idle = [(session.uuid, ws, side) for session in self.call_manager.sessions.values()
+                    for ws, seen, side in ((session.client_ws, session.client_seen, 'client'),
+                                           (session.viewer_ws, session.viewer_seen, 'viewer'))
+                    if ws and seen < cutoff]
+            for uuid, ws, side in idle:
+                self.admission.stats['reaped'] += 1
+                self.logger.log_idle_reaped(uuid, side, self.idle_timeout)
+                await ws.close(code=WSCloseCode.GOING_AWAY, message=b'Idle session')
+    
+    async def start_udp_relay(self, host, udp_fd=None):
+        """Open the UDP media relay next to the WebSocket server (or on an inherited socket)"""
+        if not udp_media.is_available():
+            print("⚠ UDP media disabled: install 'cryptography' - clients will use WebSocket")
+            return
+        if udp_fd is not None:
+            endpoint = {'sock': socket.socket(fileno=udp_fd)}
+        else:
+            endpoint = {'local_addr': (host, self.udp_port)}
+        loop = asyncio.get_running_loop()
+        _, self.udp_relay = await loop.create_datagram_endpoint(lambda: UdpMediaRelay(self), **endpoint)
+        asyncio.create_task(self.udp_relay.forward_loop())
+    
+    def restart_command(self, listen_fd, control_fd, udp_fd=None):
+        """This server's command line, pointed at the sockets it hands over"""
+        args = []
+        argv = iter(sys.argv[1:])
+        for arg in argv:
+            if arg in self.HANDOFF_FLAGS:
+                next(argv, None)   # and its value
+            elif arg.split('=', 1)[0] not in self.HANDOFF_FLAGS:
+                args.append(arg)
+        args += ['--listen-fd', str(listen_fd), '--handoff-fd', str(control_fd)]
+        if udp_fd is not None:
+            args += ['--udp-fd', str(udp_fd)]
+        return [sys.executable, sys.argv[0], *args]
+    
+    async def graceful_restart(self):
+        """Hand the listening socket and every call over to a fresh server.py
+        
+        The new process starts on the inherited socket, so connections are
+        never refused, and says when it is ready. Only then does this
+        process stop accepting, pass on each call's resume token and mode,
+        and ask its clients and viewers to reconnect. They land on the new
+        process and resume where they were, so a deploy or certificate
+        rotation costs each call one reconnect instead of the call.
+        """
+        if self.restarting:
+            return
+        self.restarting = True
+        started = time.time()
+        
+        udp_fd = None
+        if self.udp_relay and self.udp_relay.transport:
+            udp_fd = self.udp_relay.transport.get_extra_info('socket').fileno()
+        ours, theirs = socket.socketpair()
+        fds = [self.listen_sock.fileno(), theirs.fileno()] + ([udp_fd] if udp_fd is not None else [])
+        try:
+            child = subprocess.Popen(self.restart_command(self.listen_sock.fileno(), theirs.fileno(), udp_fd),
+                                     pass_fds=fds)
+        except (OSError, ValueError) as e:
+            # pass_fds needs a POSIX system
+            self.logger.log_error(f"Graceful restart failed, staying up: {e}")
+            ours.close()
+            self.restarting = False
+            return
+        finally:
+            theirs.close()
+        
+        reader, writer = await asyncio.open_connection(sock=ours)
+        try:
+            ready = await asyncio.wait_for(reader.readline(), timeout=30)
+        except asyncio.TimeoutError:
+            ready = b''
+        if ready.strip() != b'ready':
+            self.logger.log_error("Graceful restart failed, staying up: new server did not start")
+            child.kill()
+            writer.close()
+            self.restarting = False
+            return
+        
+        # The new process takes every connection from here on
+        await self.site.stop()
+        if self.udp_relay and self.udp_relay.transport:
+            self.udp_relay.transport.close()
+        calls = self.call_manager.export_resumable()
+        try:
+            writer.write(json.dumps({'calls': calls}).encode('utf-8') + b'\n')
+            await writer.drain()
+            await asyncio.wait_for(reader.readline(), timeout=10)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            self.logger.log_error(f"Call handoff to the new server failed: {e}")
+        writer.close()
+        
+        await self.disconnect_for_restart()
+        self.logger.log_server_restart(child.pid, len(calls), time.time() - started)
+        self.stopping.set_result(None)
+    
+    async def disconnect_for_restart(self):
+        """Tell every peer to reconnect (to the new process) and close its socket"""
+        notice = self.codec.encode({'type': 'server_restart', 'message': 'Server restarting - reconnect to resume the call'})
+        
+        async def hand_off(ws):
+            try:
+                await ws.send_str(notice)
+                await ws.close(code=WSCloseCode.SERVICE_RESTART, message=b'Server restarting')
+            except Exception:
+                pass
+        
+        sockets = [ws for session in list(self.call_manager.sessions.values())
+                   for ws in (session.client_ws, session.viewer_ws) if ws]
+        sockets += list(self.wall.subscriptions)
+        await asyncio.gather(*(hand_off(ws) for ws in sockets))
+    
+    async def take_over(self, handoff_fd):
+        """Tell the process being replaced that we are up, and take its calls"""
+        reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=handoff_fd))
+        writer.write(b'ready\n')
+        try:
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout=30)
+            calls = json.loads(line)['calls'] if line else {}
+        except (asyncio.TimeoutError, ConnectionError, ValueError, KeyError):
+            calls = {}
+        self.call_manager.import_resumable(calls)
+        writer.write(b'loaded\n')
+        writer.close()
+        print(f"🔁 Took over {len(calls)} calls from the previous server process")
+    
+    def create_ssl_context(self, cert_file, key_file, tickets=2):
+        """Create SSL context for HTTPS/WSS
+        
+        Session tickets let a reconnecting peer resume without a full
+        handshake; tickets is how many each TLS 1.3 handshake issues
+        (0 turns resumption off).
+        """
         ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
         ssl_context.load_cert_chain(cert_file, key_file)
+        if tickets:
+            ssl_context.options &= ~ssl.OP_NO_TICKET
+            ssl_context.num_tickets = tickets
+        else:
+            ssl_context.options |= ssl.OP_NO_TICKET
+            ssl_context.num_tickets = 0
         return ssl_context
     
-    async def start_server(self, host='0.0.0.0', port=5444, cert_file=None, key_file=None):
-        """Start the audio-only server"""
+    def open_listener(self, host, port, unix_path=None):
+        """Create the listening socket: TCP, or a Unix socket for a local proxy"""
+        if not unix_path:
+            return socket.create_server((host, port), family=socket.AF_INET6 if ':' in host else socket.AF_INET)
+        path = Path(unix_path)
+        if path.is_socket():
+            path.unlink()   # left over from a previous run
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(str(path))
+        sock.listen(128)
+        return sock
+    
+    async def start_server(self, host='0.0.0.0', port=5444, cert_file=None, key_file=None,
+                           unix_path=None, proxy_protocol=False, tls_tickets=2,
+                           listen_fd=None, udp_fd=None, handoff_fd=None):
+        """Start the audio-only server
+        
+        With unix_path it listens on a Unix socket instead of host:port, and
+        with proxy_protocol every connection must start with a PROXY header
+        from the TLS-terminating proxy in front. The fd arguments are set
+        when a graceful restart started this process: it serves on the
+        sockets of the process it replaces.
+        """
         if cert_file and key_file:
-            ssl_context = self.create_ssl_context(cert_file, key_file)
+            ssl_context = self.create_ssl_context(cert_file, key_file, tls_tickets)
             scheme = "https"
             ws_scheme = "wss"
         else:
@@ -390,17 +2293,50 @@ class AudioOnlyServer:
         runner = web.AppRunner(self.app)
         await runner.setup()
         
-        site = web.TCPSite(runner, host, port, ssl_context=ssl_context)
-        await site.start()
+        # Our own socket rather than TCPSite's, so a restart can pass it on
+        if listen_fd is not None:
+            self.listen_sock = socket.socket(fileno=listen_fd)
+        else:
+            self.listen_sock = self.open_listener(host, port, unix_path)
+        if proxy_protocol:
+            self.site = ProxyProtocolSite(
+                runner, self.listen_sock, ssl_context=ssl_context,
+                on_error=lambda peer, reason: self.logger.log_error(f"Rejected connection from {peer}: {reason}"))
+        else:
+            self.site = web.SockSite(runner, self.listen_sock, ssl_context=ssl_context)
+        await self.site.start()
+        
+        if self.udp_port:
+            await self.start_udp_relay(host, udp_fd)
+        if handoff_fd is not None:
+            await self.take_over(handoff_fd)
+        asyncio.create_task(self.status_feed.stats_loop())
+        asyncio.create_task(self.loop_monitor.run())
+        asyncio.create_task(self.wall.run())
+        asyncio.create_task(self.quality_history.run())
+        if self.idle_timeout:
+            asyncio.create_task(self.reap_idle_peers())
+        self.transcoder.start()
         
         print("📞" + "="*60)
         print("   AUDIO-ONLY REMOTE CALL SERVER STARTED")
         print("="*62)
-        print(f"🌐 Web Interface: {scheme}://{host}:{port}")
-        print(f"📡 WebSocket: {ws_scheme}://{host}:{port}/ws")
+        if unix_path:
+            print(f"🔌 Listening on unix:{unix_path} - serve it through your TLS proxy")
+        else:
+            print(f"🌐 Web Interface: {scheme}://{host}:{port}")
+            print(f"📡 WebSocket: {ws_scheme}://{host}:{port}/ws")
+        if proxy_protocol:
+            print("🧭 Expecting a PROXY protocol header on every connection")
         print(f"📋 Allowed UUIDs: {len(self.uuid_validator.allowed_uuids)}")
         print(f"🎤 Features: System Audio + Microphone + Call Modes")
         print(f"📊 Logs: audio_call_log.txt")
+        if self.record_dir:
+            print(f"💾 Recording calls to: {self.record_dir}")
+        if self.trace:
+            print(f"🧾 Tracing incoming traffic to: {self.trace.path} (payloads: {self.trace.payloads})")
+        if self.udp_relay:
+            print(f"📦 UDP media: udp://{host}:{self.udp_port} (ChaCha20-Poly1305)")
         print("="*62)
         print("🎵 CALL MODES:")
         print("  • Off: No audio transmission")
@@ -410,13 +2346,32 @@ class AudioOnlyServer:
         print("="*62)
         print("🚀 Ready for audio calls!")
         
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, 'SIGHUP'):
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(self.graceful_restart()))
+            print(f"🔁 Graceful restart (new code/certificates, calls kept): kill -HUP {os.getpid()}")
+        
+        self.stopping = loop.create_future()
         try:
-            await asyncio.Future()  # Run forever
+            await self.stopping  # Runs until a graceful restart hands over
         except KeyboardInterrupt:
             print("\n📞 Audio call server shutdown requested")
         finally:
+            for uuid in list(self.recorders):
+                self.stop_recording(uuid)
+            self.quality_history.save_all()
+            self.transcoder.close()
+            if self.trace:
+                self.trace.close()
             await runner.cleanup()
 
+def create_trace(args):
+    """TrafficTrace for --trace; a process taking over in a restart writes its own file"""
+    if not args.trace:
+        return None
+    path = f"{args.trace}.{os.getpid()}" if args.handoff_fd is not None else args.trace
+    return TrafficTrace(path, args.trace_payloads)
+
 def main():
     import argparse
     
@@ -425,21 +2380,99 @@ def main():
     parser.add_argument('--port', type=int, default=5444, help='Port to bind to')
     parser.add_argument('--cert', help='SSL certificate file')
     parser.add_argument('--key', help='SSL private key file')
+    parser.add_argument('--resume-window', type=int, default=60,
+                        help='Seconds a dropped client can resume its call')
+    parser.add_argument('--record-dir', help='Record calls as WAV tracks into this directory')
+    parser.add_argument('--udp-port', type=int, help='Enable the encrypted UDP media path on this port')
+    parser.add_argument('--status-interval', type=float, default=5,
+                        help='Seconds between traffic counter deltas on /api/status_feed')
+    parser.add_argument('--transcode-workers', type=int, default=2,
+                        help='Codec/rate conversion workers (0 = convert on the event loop)')
+    parser.add_argument('--transcode-processes', action='store_true',
+                        help='Run conversion workers as processes instead of threads')
+    parser.add_argument('--max-connections', type=int, default=1000, help='WebSocket connections in total')
+    parser.add_argument('--max-per-ip', type=int, default=50, help='WebSocket connections per client address')
+    parser.add_argument('--handshake-timeout', type=float, default=10,
+                        help='Seconds a new connection gets to send its connect message')
+    parser.add_argument('--message-rate', type=float, default=200,
+                        help='Messages per second per connection (bursts of twice that)')
+    parser.add_argument('--byte-rate', type=float, default=1024 * 1024, help='Bytes per second per connection')
+    parser.add_argument('--ip-message-rate', type=float, default=1000, help='Messages per second per address')
+    parser.add_argument('--ip-byte-rate', type=float, default=8 * 1024 * 1024, help='Bytes per second per address')
+    parser.add_argument('--idle-timeout', type=float, default=90,
+                        help='Close clients/viewers silent for this many seconds (0 = never)')
+    parser.add_argument('--unix', metavar='PATH',
+                        help='Listen on a Unix socket (behind a local TLS-terminating proxy)')
+    parser.add_argument('--proxy-protocol', action='store_true',
+                        help='Connections start with a PROXY v1/v2 header naming the real client')
+    parser.add_argument('--tls-tickets', type=int, default=2,
+                        help='TLS 1.3 session tickets per handshake (0 = no resumption)')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Record incoming message timing, types and sizes for bench.py replay')
+    parser.add_argument('--codec', choices=['auto', *MESSAGE_CODECS], default='auto',
+                        help='JSON codec for messages and API responses (auto = fastest installed)')
+    parser.add_argument('--loop', choices=['auto', 'asyncio', 'uvloop'], default='auto',
+                        help='Event loop implementation (auto = uvloop when installed)')
+    parser.add_argument('--trace-payloads', choices=PAYLOAD_MODES, default='none',
+                        help='What the trace keeps of each message (redacted drops audio and UUIDs)')
+    parser.add_argument('--wall-interval', type=float, default=0.5,
+                        help='Seconds between level summaries on monitoring walls')
+    parser.add_argument('--wall-max-selected', type=int, default=4,
+                        help='Clients a monitoring wall can listen to at once')
+    parser.add_argument('--quality-minutes', type=float, default=30,
+                        help='Minutes of per-second quality samples kept per session (36 bytes a second)')
+    parser.add_argument('--quality-dir', default='call_quality',
+                        help="Where each session's quality samples are saved when it ends ('' = not saved)")
+    # Set by a graceful restart for the process that takes over
+    for flag in AudioOnlyServer.HANDOFF_FLAGS:
+        parser.add_argument(flag, type=int, help=argparse.SUPPRESS)
     
     args = parser.parse_args()
+    if args.proxy_protocol and args.cert:
+        parser.error("--proxy-protocol expects the proxy to terminate TLS; drop --cert/--key")
+    if args.loop == 'uvloop' and uvloop is None:
+        parser.error("--loop uvloop needs 'pip install uvloop'")
+    try:
+        create_message_codec(args.codec)
+    except RuntimeError as e:
+        parser.error(str(e))
     
-    server = AudioOnlyServer()
+    use_uvloop = uvloop is not None and args.loop != 'asyncio'
+    server = AudioOnlyServer(resume_window=args.resume_window, record_dir=args.record_dir,
+                             udp_port=args.udp_port, status_interval=args.status_interval,
+                             transcode_workers=args.transcode_workers,
+                             transcode_processes=args.transcode_processes,
+                             admission=AdmissionControl(
+                                 max_connections=args.max_connections, max_per_ip=args.max_per_ip,
+                                 handshake_timeout=args.handshake_timeout,
+                                 message_rate=args.message_rate, byte_rate=args.byte_rate,
+                                 ip_message_rate=args.ip_message_rate, ip_byte_rate=args.ip_byte_rate),
+                             idle_timeout=args.idle_timeout,
+                             trace=create_trace(args),
+                             codec=args.codec,
+                             wall_interval=args.wall_interval,
+                             wall_max_selected=args.wall_max_selected,
+                             quality_minutes=args.quality_minutes,
+                             quality_dir=args.quality_dir)
     
     print("🎵 Starting Audio-Only Remote Call Server...")
     print(f"📝 Call logs: audio_call_log.txt")
     print(f"🔐 UUID validation: allowed.json")
     print("🎯 No screen/keyboard/mouse - Pure audio communication!")
+    print(f"⚙ Runtime: {'uvloop' if use_uvloop else 'asyncio'} event loop, {server.codec.name} codec")
     
-    asyncio.run(server.start_server(
+    run = uvloop.run if use_uvloop else asyncio.run
+    run(server.start_server(
         host=args.host,
         port=args.port,
         cert_file=args.cert,
-        key_file=args.key
+        key_file=args.key,
+        unix_path=args.unix,
+        proxy_protocol=args.proxy_protocol,
+        tls_tickets=args.tls_tickets,
+        listen_fd=args.listen_fd,
+        udp_fd=args.udp_fd,
+        handoff_fd=args.handoff_fd
     ))
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Traffic Trace
+- Records what peers send to the server - when, on which connection, which
+  message type and how big - into a compact binary file, so benchmarks can
+  replay real call traffic (VAD gaps, mode changes, reconnects) instead of
+  a steady synthetic stream
+- Payloads are optional: 'none' keeps only timing, type and size;
+  'redacted' keeps the JSON without audio data, UUIDs or resume tokens;
+  'full' keeps the messages as sent
+- UUIDs become small call numbers, so connections of the same call can be
+  paired on replay without the trace naming any machine
+
+File layout:
+    header = magic (8) | start time (8, unix seconds) | payload mode (1)
+    record = offset us (8) | connection (4) | event (1) | call (2) | type (2) | size (4) | payload length (4)
+             followed by the payload
+"""
+
+import json
+import queue
+import struct
+import threading
+import time
+
+MAGIC = b'ACTRACE1'
+HEADER = struct.Struct('!8sdB')
+RECORD = struct.Struct('!QIBHHII')
+
+PAYLOAD_MODES = ('none', 'redacted', 'full')
+
+# Record events
+OPEN = 1        # a WebSocket connection was accepted
+MESSAGE = 2     # the peer sent a message
+CLOSE = 3       # the connection ended
+TYPE = 4        # defines a message type number; the payload is its name
+
+REDACTED_KEYS = ('uuid', 'resume_token')
+
+# Type and call numbers are 16-bit; past this, messages are traced as type
+# or call 0 (unknown) instead of growing the tables on what peers send
+MAX_NUMBERS = 0xFFFF
+
+def redact(data):
+    """Message without audio data (kept as its length), UUIDs or tokens"""
+    clean = {k: v for k, v in data.items() if k not in REDACTED_KEYS}
+    if isinstance(clean.get('audio'), str):
+        clean['audio'] = len(clean['audio'])
+    if isinstance(clean.get('frames'), list):
+        clean['frames'] = [redact(f) if isinstance(f, dict) else f for f in clean['frames']]
+    return clean
+
+class TrafficTrace:
+    """Writes a trace of incoming WebSocket traffic
+
+    The server only packs a record and queues it; a background thread does
+    the writing, and records are dropped (and counted) rather than letting
+    a slow disk hold up forwarding.
+    """
+    def __init__(self, path, payloads='none', queue_size=65536, flush_seconds=1.0):
+        if payloads not in PAYLOAD_MODES:
+            raise ValueError(f"payloads must be one of {PAYLOAD_MODES}")
+        self.path = path
+        self.payloads = payloads
+        self.flush_seconds = flush_seconds
+        self.started = time.perf_counter()
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, time.time(), PAYLOAD_MODES.index(payloads)))
+
+        self.types = {}            # message type -> number
+        self.calls = {}            # uuid -> call number (0 = none yet)
+        self.next_connection = 0
+        self.records = 0
+        self.bytes = HEADER.size
+        self.dropped = 0
+
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.writer_thread, daemon=True)
+        self.thread.start()
+
+    def put(self, connection, event, call=0, type_id=0, size=0, payload=b''):
+        record = RECORD.pack(int((time.perf_counter() - self.started) * 1e6), connection, event,
+                             call, type_id, size, len(payload)) + payload
+        try:
+            self.pending.put_nowait(record)
+            self.records += 1
+            self.bytes += len(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def open(self):
+        """Start tracing a new connection; returns its number"""
+        self.next_connection += 1
+        self.put(self.next_connection, OPEN)
+        return self.next_connection
+
+    def message(self, connection, data, raw):
+        """Record one parsed message (data) and its text as received (raw)"""
+        msg_type = str(data.get('type'))
+        type_id = self.types.get(msg_type, 0)
+        if not type_id and len(self.types) < MAX_NUMBERS:
+            type_id = self.types[msg_type] = len(self.types) + 1
+            self.put(0, TYPE, type_id=type_id, payload=msg_type.encode('utf-8'))
+
+        call = 0
+        uuid = data.get('uuid')
+        if uuid and isinstance(uuid, str):
+            call = self.calls.get(uuid, 0)
+            if not call and len(self.calls) < MAX_NUMBERS:
+                call = self.calls[uuid] = len(self.calls) + 1
+
+        if self.payloads == 'full':
+            payload = raw.encode('utf-8')
+        elif self.payloads == 'redacted':
+            payload = json.dumps(redact(data), separators=(',', ':')).encode('utf-8')
+        else:
+            payload = b''
+        self.put(connection, MESSAGE, call, type_id, len(raw), payload)
+
+    def close_connection(self, connection):
+        self.put(connection, CLOSE)
+
+    def get_stats(self):
+        return {
+            'path': str(self.path),
+            'payloads': self.payloads,
+            'connections': self.next_connection,
+            'records': self.records,
+            'bytes': self.bytes,
+            'dropped': self.dropped
+        }
+
+    def close(self):
+        """Write what is queued and close the file"""
+        self.pending.put(None)
+        self.thread.join(timeout=5)
+
+    def writer_thread(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.pending.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                self.file.flush()
+                last_flush = time.monotonic()
+                continue
+            if record is None:
+                break
+            self.file.write(record)
+            if time.monotonic() - last_flush > self.flush_seconds:
+                self.file.flush()
+                last_flush = time.monotonic()
+        self.file.close()
+
+def read_trace(path):
+    """Load a trace: (header dict, list of records)
+
+    Each record is a dict with time (seconds from the start of the trace),
+    connection, event, call, type (name), size and payload (bytes, empty
+    when the trace has none). A record cut off at the end of the file (the
+    server was killed mid-write) is ignored.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, started, mode = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a traffic trace")
+
+    types = {}
+    records = []
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        t_us, connection, event, call, type_id, size, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+        payload = data[offset:offset + length]
+        offset += length
+        if event == TYPE:
+            types[type_id] = payload.decode('utf-8')
+            continue
+        records.append({
+            'time': t_us / 1e6,
+            'connection': connection,
+            'event': event,
+            'call': call,
+            'type': types.get(type_id),
+            'size': size,
+            'payload': payload
+        })
+    return {'started': started, 'payloads': PAYLOAD_MODES[mode]}, records
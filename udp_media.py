@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Encrypted UDP Media Transport
+- Optional datagram path for audio frames next to the /ws control channel
+- Keys are handed out over the (TLS) WebSocket, frames are sealed with
+  ChaCha20-Poly1305 and carry sequence numbers
+- A lost datagram costs one frame instead of stalling every frame behind it
+  the way a lost TCP segment does
+- Frames are cut into slices that fit one unfragmented datagram; each slice
+  is a playable frame of its own with its own timestamp, so a lost packet
+  costs ~26 ms of audio instead of the whole frame
+
+Packet layout:
+    header  = session id (4) | sequence (8)           - sent in clear, authenticated
+    payload = kind (1) | timestamp (8) | rate (4) | 16-bit PCM   - encrypted
+"""
+
+import asyncio
+import secrets
+import struct
+import time
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+except ImportError:  # UDP media is optional - everything falls back to WebSocket
+    ChaCha20Poly1305 = None
+    InvalidTag = Exception
+
+HEADER = struct.Struct('!IQ')     # session id, sequence
+NONCE = struct.Struct('!IQ')      # direction, sequence (12 bytes)
+PAYLOAD = struct.Struct('!BdI')   # kind, timestamp, sample rate
+
+# Frame kinds
+KIND_PROBE = 0      # keepalive / reachability check, echoed by the server
+KIND_SYSTEM = 1     # client system audio
+KIND_MIC = 2        # client microphone
+KIND_VIEWER = 3     # viewer microphone (server -> client)
+KIND_STEREO = 4     # client system audio (left) + microphone (right), one frame
+KIND_MIX = 5        # client system audio and microphone pre-mixed to mono
+
+# Directions keep nonces unique when both ends use the same key
+TO_SERVER = 1
+FROM_SERVER = 2
+
+LIVENESS_TIMEOUT = 3.0  # seconds without a datagram before falling back to WebSocket
+
+# PCM bytes per datagram: with the headers and the 16-byte tag a packet stays
+# near 1200 bytes, under any common path MTU (a multiple of 4 keeps stereo
+# sample pairs together)
+MAX_SLICE_BYTES = 1152
+
+def frame_slices(kind, timestamp, rate, pcm):
+    """(timestamp, pcm) slices of a frame, each small enough for one datagram"""
+    if len(pcm) <= MAX_SLICE_BYTES:
+        return [(timestamp, pcm)]
+    bytes_per_second = rate * (4 if kind == KIND_STEREO else 2)
+    return [(timestamp + offset / bytes_per_second if rate else timestamp, pcm[offset:offset + MAX_SLICE_BYTES])
+            for offset in range(0, len(pcm), MAX_SLICE_BYTES)]
+
+def is_available():
+    """True when the cryptography package is installed"""
+    return ChaCha20Poly1305 is not None
+
+def new_session_key():
+    """Random 256-bit key for one UDP media session"""
+    return secrets.token_bytes(32)
+
+def peek_session_id(packet):
+    """Session id from a packet header, without decrypting"""
+    return HEADER.unpack_from(packet)[0]
+
+class MediaCipher:
+    """Seals and opens datagrams for one session and tracks sequence numbers"""
+    def __init__(self, key, session_id):
+        self.aead = ChaCha20Poly1305(key)
+        self.session_id = session_id
+        self.send_seq = 0
+        self.recv_seq = 0
+        self.lost = 0        # gaps in the received sequence
+        self.rejected = 0    # forged, replayed or out-of-order packets
+
+    def seal(self, direction, kind, timestamp, rate, pcm=b''):
+        """Encrypt one frame into a datagram"""
+        self.send_seq += 1
+        header = HEADER.pack(self.session_id, self.send_seq)
+        nonce = NONCE.pack(direction, self.send_seq)
+        return header + self.aead.encrypt(nonce, PAYLOAD.pack(kind, timestamp, rate) + pcm, header)
+
+    def open(self, direction, packet):
+        """Decrypt a datagram into (kind, timestamp, rate, pcm)
+
+        Returns None for packets that fail authentication or arrive after a
+        newer one - a late audio frame is no use for real-time playback.
+        """
+        if len(packet) < HEADER.size:
+            self.rejected += 1
+            return None
+        _, seq = HEADER.unpack_from(packet)
+        try:
+            plain = self.aead.decrypt(NONCE.pack(direction, seq), packet[HEADER.size:],
+                                      packet[:HEADER.size])
+        except InvalidTag:
+            self.rejected += 1
+            return None
+
+        if seq <= self.recv_seq:
+            self.rejected += 1
+            return None
+        if self.recv_seq:
+            self.lost += seq - self.recv_seq - 1
+        self.recv_seq = seq
+
+        kind, timestamp, rate = PAYLOAD.unpack_from(plain)
+        return kind, timestamp, rate, plain[PAYLOAD.size:]
+
+class UdpMediaChannel(asyncio.DatagramProtocol):
+    """Client end of the UDP media path"""
+    def __init__(self, key, session_id, on_audio):
+        self.cipher = MediaCipher(key, session_id)
+        self.on_audio = on_audio        # called with (kind, timestamp, rate, pcm)
+        self.transport = None
+        self.last_received = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        frame = self.cipher.open(FROM_SERVER, data)
+        if frame is None:
+            return
+        self.last_received = time.time()
+        if frame[0] != KIND_PROBE:
+            self.on_audio(*frame)
+
+    def error_received(self, exc):
+        print(f"⚠ UDP media error: {exc}")
+
+    def send(self, kind, timestamp, rate=0, pcm=b''):
+        """Send one frame (or a probe) to the server, as several datagrams if it is large"""
+        if self.transport:
+            for slice_timestamp, piece in frame_slices(kind, timestamp, rate, pcm):
+                self.transport.sendto(self.cipher.seal(TO_SERVER, kind, slice_timestamp, rate, piece))
+
+    @property
+    def alive(self):
+        """True while the server's probe replies keep arriving"""
+        return time.time() - self.last_received < LIVENESS_TIMEOUT
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+async def open_channel(host, port, key, session_id, on_audio):
+    """Create the client's UDP endpoint towards the server's relay"""
+    loop = asyncio.get_running_loop()
+    _, channel = await loop.create_datagram_endpoint(
+        lambda: UdpMediaChannel(key, session_id, on_audio),
+        remote_addr=(host, port)
+    )
+    return channel